@@ -1,30 +1,53 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-import redis
-from utils.config import settings
-from utils.api_key_rotate import APIKeyManager
+from utils.config import settings, get_async_database
+from utils.db_indexes import bootstrap_indexes
+from utils.redis_client import open_async_redis, close_async_redis
+from utils.redis_cache import cache
+from utils.rate_limiter import RateLimitHeadersMiddleware, rate_limiter
+from utils.like_buffer import like_buffer
+from utils.leaderboard import leaderboard
+from src.llm.client_pool import llm_clients
+from src.llm.pinecone_langchain import embeddings
+from utils.app_logger import setup_logger
+
+logger = setup_logger("app.py")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await open_async_redis()
+    await bootstrap_indexes(get_async_database(), plan_check=settings.MONGO_PLAN_CHECK)
+    invalidation_listener = asyncio.create_task(cache.listen_for_invalidations())
+    rate_limit_sync = asyncio.create_task(rate_limiter.run_sync())
+    like_flusher = asyncio.create_task(like_buffer.run_flusher())
+    # Like-ordered pages fall back to Mongo until the leaderboards are seeded
+    leaderboard_seed = asyncio.create_task(leaderboard.seed())
+    yield
+    leaderboard_seed.cancel()
+    invalidation_listener.cancel()
+    rate_limit_sync.cancel()
+    like_flusher.cancel()
+    # Flush requests admitted and likes recorded since the last sync
+    await rate_limiter.sync()
+    try:
+        await like_buffer.flush()
+    except Exception as e:
+        # Left registered in Redis; another replica recovers the batch
+        logger.error(f"Error flushing likes at shutdown: {str(e)}")
+    logger.info(f"Embedding cache at shutdown: {embeddings.stats()}")
+    await close_async_redis()
+    await llm_clients.aclose()
 
 app = FastAPI(
     title="Prompt Store",
     description="Customize Prompt for Free",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-redis_client_main = redis.Redis.from_url(
-    settings.REDIS_URI,
-    decode_responses=True  # This automatically decodes responses
-)
-
-gemini_api_keys = [
-    settings.GEMINI_API_KEY1,
-    settings.GEMINI_API_KEY2,
-    settings.GEMINI_API_KEY3,
-    settings.GEMINI_API_KEY4,
-    settings.GEMINI_API_KEY5
-]
-gemini_api_key_manager = APIKeyManager(gemini_api_keys)
-
 # Mount static files first
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -35,7 +58,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"],
 )
+app.add_middleware(RateLimitHeadersMiddleware)
 
 from src.routers import serve_html, serve_apis
 # Include routers
@@ -44,4 +69,4 @@ app.include_router(serve_apis.router)
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "embedding_cache": embeddings.stats()}
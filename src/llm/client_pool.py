@@ -0,0 +1,113 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import httpx
+from openai import AsyncOpenAI, RateLimitError
+from utils.api_key_rotate import RedisKeyPool
+from utils.config import settings
+from utils.redis_client import async_redis_client
+from utils.app_logger import setup_logger
+
+logger = setup_logger("src/llm/client_pool.py")
+
+@dataclass
+class ProviderConfig:
+    base_url: str
+    max_concurrency: int
+    max_retries: int = 2
+
+PROVIDERS: Dict[str, ProviderConfig] = {
+    "google": ProviderConfig(
+        base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+        max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+        # Retried on another key from the pool instead (see openai_llm)
+        max_retries=0
+    ),
+    "groq": ProviderConfig(
+        base_url="https://api.groq.com/openai/v1",
+        max_concurrency=settings.GROQ_MAX_CONCURRENCY
+    ),
+    "mistral": ProviderConfig(
+        base_url="https://api.mistral.ai/v1",
+        max_concurrency=settings.MISTRAL_MAX_CONCURRENCY
+    ),
+}
+
+class LLMClientPool:
+    """
+    One AsyncOpenAI client per (provider, api key), all clients of a provider
+    sharing one keep-alive httpx pool, plus a semaphore per provider that caps
+    in-flight generations.
+    """
+
+    def __init__(self, providers: Dict[str, ProviderConfig]):
+        self.providers = providers
+        self.http_clients: Dict[str, httpx.AsyncClient] = {}
+        self.clients: Dict[Tuple[str, str], AsyncOpenAI] = {}
+        self.semaphores = {
+            name: asyncio.Semaphore(config.max_concurrency)
+            for name, config in providers.items()
+        }
+
+    def http_client(self, provider: str) -> httpx.AsyncClient:
+        http_client = self.http_clients.get(provider)
+        if http_client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS
+                ),
+                timeout=httpx.Timeout(
+                    settings.LLM_TIMEOUT_SECONDS,
+                    connect=settings.LLM_CONNECT_TIMEOUT_SECONDS
+                )
+            )
+            self.http_clients[provider] = http_client
+        return http_client
+
+    def client(self, provider: str, api_key: Optional[str]) -> AsyncOpenAI:
+        client = self.clients.get((provider, api_key))
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=self.providers[provider].base_url,
+                max_retries=self.providers[provider].max_retries,
+                http_client=self.http_client(provider)
+            )
+            self.clients[(provider, api_key)] = client
+        return client
+
+    def semaphore(self, provider: str) -> asyncio.Semaphore:
+        return self.semaphores[provider]
+
+    async def aclose(self) -> None:
+        for http_client in self.http_clients.values():
+            await http_client.aclose()
+        self.http_clients.clear()
+        self.clients.clear()
+
+def retry_after_seconds(error: RateLimitError) -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+llm_clients = LLMClientPool(PROVIDERS)
+
+gemini_api_keys = [
+    settings.GEMINI_API_KEY1,
+    settings.GEMINI_API_KEY2,
+    settings.GEMINI_API_KEY3,
+    settings.GEMINI_API_KEY4,
+    settings.GEMINI_API_KEY5
+]
+# Shared through Redis with every replica and with the ingestion script
+gemini_key_pool = RedisKeyPool(
+    async_redis_client,
+    "gemini",
+    gemini_api_keys,
+    rate_limit=settings.GEMINI_KEY_RATE_LIMIT,
+    window_seconds=settings.GEMINI_KEY_WINDOW_SECONDS,
+    quarantine_seconds=settings.GEMINI_KEY_QUARANTINE_SECONDS
+)
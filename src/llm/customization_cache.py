@@ -0,0 +1,131 @@
+import asyncio
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+import numpy as np
+import orjson
+import redis
+from langchain_core.embeddings import Embeddings
+from utils.app_logger import setup_logger
+
+logger = setup_logger("src/llm/customization_cache.py")
+
+def prompt_version(system_prompt: str) -> str:
+    """
+    Short content hash of a system prompt, so editing it retires old results
+    """
+    return hashlib.sha256(system_prompt.encode()).hexdigest()[:12]
+
+def normalize_message(message: str) -> str:
+    return " ".join(message.lower().split()).strip(" .!?")
+
+class CustomizationCache:
+    """
+    Cache of customized prompts, keyed on (prompt_id, normalized message,
+    model, system prompt version).
+
+    Exact hits are one GET. On a miss, the message embedding is compared with
+    the last max_entries cached messages for the same prompt/model/version, and
+    a result is reused if the cosine similarity is at least threshold.
+    """
+
+    def __init__(self, redis_client, embeddings: Embeddings, expire: int = 7 * 24 * 3600,
+                 threshold: float = 0.97, max_entries: int = 32, prefix: str = "customize"):
+        self.redis_client = redis_client
+        self.embeddings = embeddings
+        self.expire = expire
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.prefix = prefix
+
+    def digest(self, prompt_id: str, message: str, model: str, version: str) -> str:
+        params = orjson.dumps([prompt_id, normalize_message(message), model, version])
+        return hashlib.sha256(params).hexdigest()
+
+    def result_key(self, digest: str) -> str:
+        return f"{self.prefix}:result:{digest}"
+
+    def vectors_key(self, prompt_id: str, model: str, version: str) -> str:
+        return f"{self.prefix}:vectors:{prompt_id}:{model}:{version}"
+
+    async def embed(self, message: str) -> np.ndarray:
+        vector = np.asarray(
+            await asyncio.to_thread(self.embeddings.embed_query, normalize_message(message)),
+            dtype=np.float32
+        )
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def get_result(self, digest: str) -> Optional[Dict[str, Any]]:
+        value = await self.redis_client.get(self.result_key(digest))
+        return orjson.loads(value) if value else None
+
+    async def lookup(self, prompt_id: str, message: str, model: str, version: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached result with a "match" field ("exact" or "semantic"), or None
+        """
+        try:
+            result = await self.get_result(self.digest(prompt_id, message, model, version))
+            if result is not None:
+                result["match"] = "exact"
+                return result
+
+            if self.threshold > 1:
+                return None
+            entries = await self.redis_client.lrange(self.vectors_key(prompt_id, model, version), 0, -1)
+            if not entries:
+                return None
+
+            query_vector = await self.embed(message)
+            # Each entry is a 64-char hex digest followed by the float32 vector
+            digests = [entry[:64].decode() for entry in entries]
+            matrix = np.stack([np.frombuffer(entry[64:], dtype=np.float32) for entry in entries])
+            if matrix.shape[1] != query_vector.shape[0]:
+                return None
+            similarities = matrix @ query_vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            result = await self.get_result(digests[best])
+            if result is not None:
+                result["match"] = "semantic"
+                result["similarity"] = float(similarities[best])
+            return result
+        except (redis.RedisError, ValueError) as e:
+            logger.error(f"Customization cache lookup error: {e}")
+            return None
+        except Exception as e:
+            # e.g. the embedding call failed: treat as a miss
+            logger.error(f"Customization cache semantic lookup error: {str(e)}")
+            return None
+
+    async def store(self, prompt_id: str, message: str, model: str, version: str, customized_prompt: str,
+                    served_by: Optional[str] = None) -> None:
+        """
+        Cache a result. served_by records the provider/model that actually
+        generated it, when that can differ from model (e.g. after a failover).
+        """
+        digest = self.digest(prompt_id, message, model, version)
+        result = {
+            "customized_prompt": customized_prompt,
+            "customization_message": message,
+            "served_by": served_by or model,
+            "created_at": datetime.utcnow()
+        }
+        try:
+            vector = await self.embed(message) if self.threshold <= 1 else None
+        except Exception as e:
+            logger.error(f"Error embedding customization message: {str(e)}")
+            vector = None
+        try:
+            vectors_key = self.vectors_key(prompt_id, model, version)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.set(self.result_key(digest), orjson.dumps(result), ex=self.expire)
+                if vector is not None:
+                    pipe.lpush(vectors_key, digest.encode() + vector.tobytes())
+                    pipe.ltrim(vectors_key, 0, self.max_entries - 1)
+                    pipe.expire(vectors_key, self.expire)
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Customization cache store error: {e}")
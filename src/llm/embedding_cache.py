@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from typing import List, Optional
+import numpy as np
+import redis
+from cachetools import LRUCache
+from langchain_core.embeddings import Embeddings
+from utils.app_logger import setup_logger
+
+logger = setup_logger("src/llm/embedding_cache.py")
+
+class CachedEmbeddings(Embeddings):
+    """
+    Two-tier cache in front of an embeddings client for query embeddings.
+
+    L1 is an in-process LRU, L2 is Redis. Vectors are stored as packed float32
+    bytes, keyed on the model name and the normalized query text. Document
+    embeddings are passed straight through since they are only used at ingestion.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        redis_client: Optional[redis.Redis] = None,
+        max_entries: int = 2048,
+        expire: int = 7 * 24 * 3600
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.redis_client = redis_client
+        self.expire = expire
+        self.local_cache = LRUCache(maxsize=max_entries)
+        # Retrieval runs on a thread pool and cachetools is not thread-safe
+        self.lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def cache_key(self, normalized_text: str) -> str:
+        digest = hashlib.sha256(normalized_text.encode()).hexdigest()
+        return f"emb:{self.model_name}:{digest}"
+
+    def embed_query(self, text: str) -> List[float]:
+        normalized_text = self.normalize(text)
+        key = self.cache_key(normalized_text)
+
+        with self.lock:
+            vector = self.local_cache.get(key)
+            if vector is not None:
+                self.local_hits += 1
+                return vector.tolist()
+
+        if self.redis_client is not None:
+            try:
+                packed = self.redis_client.get(key)
+            except redis.RedisError as e:
+                logger.error(f"Redis get error for embedding cache: {e}")
+                packed = None
+            if packed:
+                vector = np.frombuffer(packed, dtype=np.float32)
+                with self.lock:
+                    self.local_cache[key] = vector
+                    self.redis_hits += 1
+                return vector.tolist()
+
+        with self.lock:
+            self.misses += 1
+
+        vector = np.asarray(self.embeddings.embed_query(normalized_text), dtype=np.float32)
+        with self.lock:
+            self.local_cache[key] = vector
+
+        if self.redis_client is not None:
+            try:
+                self.redis_client.setex(key, self.expire, vector.tobytes())
+            except redis.RedisError as e:
+                logger.error(f"Redis set error for embedding cache: {e}")
+
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.local_hits + self.redis_hits + self.misses
+            return {
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.local_hits + self.redis_hits) / lookups if lookups else 0.0,
+                "local_size": len(self.local_cache)
+            }
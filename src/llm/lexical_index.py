@@ -0,0 +1,196 @@
+import asyncio
+import math
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from utils.app_logger import setup_logger
+
+logger = setup_logger("src/llm/lexical_index.py")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+def normalize(text: str) -> str:
+    return " ".join(tokenize(text))
+
+def reciprocal_rank_fusion(ranked_lists: Sequence[Sequence[Tuple[str, float]]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several ranked (id, score) lists; each list contributes 1 / (k + rank) per id
+    """
+    fused: Dict[str, float] = {}
+    for ranked in ranked_lists:
+        for rank, (prompt_id, _) in enumerate(ranked, start=1):
+            fused[prompt_id] = fused.get(prompt_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+class BM25Index:
+    """
+    In-memory BM25 index over the name, tags and search_description of each prompt.
+
+    Fields are weighted by repeating their term frequencies, so a hit in the
+    name counts more than one in the description.
+    """
+
+    def __init__(self, documents: List[dict], k1: float = 1.2, b: float = 0.75,
+                 field_weights: Optional[Dict[str, float]] = None):
+        self.k1 = k1
+        self.b = b
+        self.field_weights = field_weights or {"name": 3.0, "tags": 2.0, "search_description": 1.0}
+
+        self.ids: List[str] = []
+        self.categories: List[str] = []
+        self.names: Dict[str, List[int]] = {}
+        self.tag_rows: Dict[str, List[int]] = {}
+        term_frequencies: List[Dict[str, float]] = []
+        lengths: List[float] = []
+
+        for row, document in enumerate(documents):
+            self.ids.append(document["prompt_id"])
+            self.categories.append(document.get("category") or "")
+            self.names.setdefault(normalize(document.get("name") or ""), []).append(row)
+            for tag in document.get("tags") or []:
+                self.tag_rows.setdefault(normalize(tag), []).append(row)
+
+            frequencies: Dict[str, float] = {}
+            fields = {
+                "name": document.get("name") or "",
+                "tags": " ".join(document.get("tags") or []),
+                "search_description": document.get("search_description") or ""
+            }
+            for field, text in fields.items():
+                weight = self.field_weights.get(field, 1.0)
+                for token in tokenize(text):
+                    frequencies[token] = frequencies.get(token, 0.0) + weight
+            term_frequencies.append(frequencies)
+            lengths.append(sum(frequencies.values()))
+
+        self.category_array = np.asarray(self.categories, dtype=object)
+        self.document_lengths = np.asarray(lengths, dtype=np.float32)
+        average_length = float(self.document_lengths.mean()) if lengths else 0.0
+        self.length_norms = self.k1 * (1 - self.b + self.b * self.document_lengths / (average_length or 1.0))
+
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        for row, frequencies in enumerate(term_frequencies):
+            for token, frequency in frequencies.items():
+                rows, values = postings.setdefault(token, ([], []))
+                rows.append(row)
+                values.append(frequency)
+
+        total = len(self.ids)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for token, (rows, values) in postings.items():
+            idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+            self.postings[token] = (np.asarray(rows, dtype=np.int64), np.asarray(values, dtype=np.float32), idf)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def filter_mask(self, category: Optional[str] = None, tags: Optional[Sequence[str]] = None) -> Optional[np.ndarray]:
+        if category is None and not tags:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        if category is not None:
+            category = getattr(category, "value", category)
+            mask &= self.category_array == category
+        for tag in tags or []:
+            tag_mask = np.zeros(len(self.ids), dtype=bool)
+            tag_mask[self.tag_rows.get(normalize(tag), [])] = True
+            mask &= tag_mask
+        return mask
+
+    def search(self, query: str, top_k: int = 10, category: Optional[str] = None,
+               tags: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Return up to top_k (id, BM25 score) pairs with a non-zero score, best first
+        """
+        if not self.ids or top_k <= 0:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            rows, frequencies, idf = posting
+            scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + self.length_norms[rows])
+
+        mask = self.filter_mask(category, tags)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size == 0:
+            return []
+        k = min(top_k, candidates.size)
+        best = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        best = best[np.argsort(-scores[best])]
+        return [(self.ids[row], float(scores[row])) for row in best]
+
+    def normalized_score(self, query: str, score: float) -> float:
+        """
+        score as a fraction of the best BM25 score possible for query: every
+        query token matched with saturated term frequency. Tokens missing from
+        the index count at their maximum idf, so unknown words lower it.
+        """
+        total = len(self.ids)
+        best = 0.0
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            idf = posting[2] if posting is not None else math.log(1 + (total + 0.5) / 0.5)
+            best += idf * (self.k1 + 1)
+        return score / best if best else 0.0
+
+    def is_navigational(self, query: str, hits: List[Tuple[str, float]], min_score: float = 0.6) -> bool:
+        """
+        True when the lexical hits can answer the query without vector search:
+        the query is a prompt's exact name or tag, or the best hit reaches
+        min_score of the best possible score for the query
+        """
+        if not hits:
+            return False
+        normalized_query = normalize(query)
+        if normalized_query in self.names or normalized_query in self.tag_rows:
+            return True
+        return self.normalized_score(query, hits[0][1]) >= min_score
+
+class LexicalSearchIndex:
+    """
+    Keeps a BM25Index over prompts_discover in memory and rebuilds it periodically
+    """
+
+    def __init__(self, refresh_seconds: float = 600.0):
+        self.refresh_seconds = refresh_seconds
+        self.index: Optional[BM25Index] = None
+        self.built_at = 0.0
+        self.lock = asyncio.Lock()
+
+    async def build(self, db) -> BM25Index:
+        documents = await db.prompts_discover.find(
+            {},
+            {"_id": 0, "prompt_id": 1, "name": 1, "tags": 1, "search_description": 1, "category": 1}
+        ).to_list(length=None)
+        index = await asyncio.to_thread(BM25Index, documents)
+        self.index = index
+        self.built_at = time.monotonic()
+        logger.info(f"Built lexical index over {len(index)} prompts")
+        return index
+
+    def is_fresh(self) -> bool:
+        return self.built_at > 0 and time.monotonic() - self.built_at < self.refresh_seconds
+
+    async def get(self, db) -> Optional[BM25Index]:
+        if self.is_fresh():
+            return self.index
+        async with self.lock:
+            if self.is_fresh():
+                return self.index
+            try:
+                return await self.build(db)
+            except Exception as e:
+                # Keep serving the previous index, and wait a full refresh period before retrying
+                logger.error(f"Error building lexical index: {str(e)}")
+                self.built_at = time.monotonic()
+                return self.index
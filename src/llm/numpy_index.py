@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from utils.app_logger import setup_logger
+
+logger = setup_logger("src/llm/numpy_index.py")
+
+class IndexSnapshot:
+    """
+    Immutable view of one loaded snapshot. Searches grab a reference to the
+    current snapshot, so a reload never changes the data under a running query.
+    """
+
+    def __init__(self, manifest_mtime: int, ids: List[str], matrix: np.ndarray,
+                 categories: np.ndarray, category_codes: Dict[str, int],
+                 tag_rows: Dict[str, np.ndarray]):
+        self.manifest_mtime = manifest_mtime
+        self.ids = ids
+        self.matrix = matrix
+        self.categories = categories
+        self.category_codes = category_codes
+        self.tag_rows = tag_rows
+
+    def filter_mask(self, category: Optional[str] = None, tags: Optional[Sequence[str]] = None) -> Optional[np.ndarray]:
+        if category is None and not tags:
+            return None
+
+        mask = np.ones(len(self.ids), dtype=bool)
+        if category is not None:
+            # Filters may carry a PromptCategory, whose hash differs from its value's
+            code = self.category_codes.get(getattr(category, "value", category))
+            if code is None:
+                return np.zeros(len(self.ids), dtype=bool)
+            mask &= self.categories == code
+
+        for tag in tags or []:
+            tag_mask = np.zeros(len(self.ids), dtype=bool)
+            tag_mask[self.tag_rows.get(tag, np.empty(0, dtype=np.int64))] = True
+            mask &= tag_mask
+
+        return mask
+
+class NumpyVectorIndex:
+    """
+    In-process cosine-similarity index over a memory-mapped float32 matrix.
+
+    A snapshot is a manifest JSON file pointing at a `.npy` matrix of
+    L2-normalized rows plus per-row ids, categories and tags. Writers publish a
+    new snapshot with write_snapshot(); readers pick it up on their next query
+    once the manifest's mtime changes.
+    """
+
+    def __init__(self, manifest_path: str, reload_interval: float = 5.0):
+        self.manifest_path = manifest_path
+        self.reload_interval = reload_interval
+        self.snapshot: Optional[IndexSnapshot] = None
+        self.last_checked = 0.0
+        self.reload_lock = threading.Lock()
+
+    def load(self) -> Optional[IndexSnapshot]:
+        manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+
+        vectors_path = os.path.join(os.path.dirname(self.manifest_path), manifest["vectors_file"])
+        matrix = np.load(vectors_path, mmap_mode="r")
+        ids = manifest["ids"]
+        if matrix.shape[0] != len(ids):
+            raise ValueError(f"Snapshot {vectors_path} has {matrix.shape[0]} rows for {len(ids)} ids")
+
+        category_codes: Dict[str, int] = {}
+        categories = np.empty(len(ids), dtype=np.int32)
+        for row, category in enumerate(manifest["categories"]):
+            categories[row] = category_codes.setdefault(category, len(category_codes))
+
+        tag_lists: Dict[str, List[int]] = {}
+        for row, tags in enumerate(manifest["tags"]):
+            for tag in tags:
+                tag_lists.setdefault(tag, []).append(row)
+        tag_rows = {tag: np.asarray(rows, dtype=np.int64) for tag, rows in tag_lists.items()}
+
+        logger.info(f"Loaded vector snapshot {vectors_path} with {len(ids)} vectors")
+        return IndexSnapshot(manifest_mtime, ids, matrix, categories, category_codes, tag_rows)
+
+    def current(self) -> Optional[IndexSnapshot]:
+        """
+        Return the active snapshot, reloading it if the manifest changed
+        """
+        now = time.monotonic()
+        if self.snapshot is not None and now - self.last_checked < self.reload_interval:
+            return self.snapshot
+
+        with self.reload_lock:
+            if self.snapshot is not None and now - self.last_checked < self.reload_interval:
+                return self.snapshot
+            self.last_checked = now
+            try:
+                manifest_mtime = os.stat(self.manifest_path).st_mtime_ns
+                if self.snapshot is None or manifest_mtime != self.snapshot.manifest_mtime:
+                    self.snapshot = self.load()
+            except FileNotFoundError:
+                logger.warning(f"No vector snapshot found at {self.manifest_path}")
+            except Exception as e:
+                # Keep serving the previous snapshot if the new one is unreadable
+                logger.error(f"Error loading vector snapshot {self.manifest_path}: {str(e)}")
+        return self.snapshot
+
+    def search(self, query_vector: Sequence[float], top_k: int = 5,
+               category: Optional[str] = None, tags: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Return up to top_k (id, cosine score) pairs, best first
+        """
+        snapshot = self.current()
+        if snapshot is None or not snapshot.ids or top_k <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        mask = snapshot.filter_mask(category, tags)
+        if mask is None:
+            rows = None
+            scores = snapshot.matrix @ query
+        else:
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return []
+            scores = snapshot.matrix[rows] @ query
+
+        k = min(top_k, scores.shape[0])
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        if rows is not None:
+            return [(snapshot.ids[rows[i]], float(scores[i])) for i in best]
+        return [(snapshot.ids[i], float(scores[i])) for i in best]
+
+    def search_with_filters(self, query_vector: Sequence[float], top_k: int = 5,
+                            filters: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        """
+        search() taking the same filter dict that is sent to Pinecone
+        """
+        filters = filters or {}
+        category = filters.get("category")
+        tags = filters.get("tags")
+        if isinstance(tags, dict):
+            tags = tags.get("$all")
+        elif isinstance(tags, str):
+            tags = [tags]
+        return self.search(query_vector, top_k, category=category, tags=tags)
+
+def write_snapshot(manifest_path: str, ids: List[str], vectors: np.ndarray,
+                   categories: List[str], tags: List[List[str]]) -> str:
+    """
+    Publish a new snapshot next to manifest_path and return the vectors file path.
+
+    The matrix is written under a fresh file name and the manifest is swapped in
+    with os.replace, so readers only ever see a complete snapshot.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+        raise ValueError("vectors must be a 2D array with one row per id")
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+
+    directory = os.path.dirname(manifest_path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    version = datetime.now(UTC).strftime("%Y%m%dT%H%M%S%f")
+    vectors_file = f"vectors-{version}.npy"
+    np.save(os.path.join(directory, vectors_file), vectors)
+
+    previous_vectors_file = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous_vectors_file = json.load(f).get("vectors_file")
+
+    tmp_manifest_path = f"{manifest_path}.tmp"
+    with open(tmp_manifest_path, "w") as f:
+        json.dump({
+            "vectors_file": vectors_file,
+            "dimension": int(vectors.shape[1]),
+            "created_at": version,
+            "ids": ids,
+            "categories": [str(getattr(category, "value", category)) for category in categories],
+            "tags": tags
+        }, f)
+    os.replace(tmp_manifest_path, manifest_path)
+
+    # Keep the previous matrix around for readers that still have it mapped
+    for name in os.listdir(directory):
+        if name.startswith("vectors-") and name.endswith(".npy") and name not in (vectors_file, previous_vectors_file):
+            os.remove(os.path.join(directory, name))
+
+    logger.info(f"Wrote vector snapshot {vectors_file} with {len(ids)} vectors")
+    return os.path.join(directory, vectors_file)
@@ -1,26 +1,41 @@
 import asyncio
+from typing import AsyncIterator, Optional
 from fastapi import HTTPException
-from openai import OpenAI
+from openai import APIConnectionError, InternalServerError, RateLimitError
 from utils.config import settings
 from utils.app_logger import setup_logger
-from app import gemini_api_key_manager
+from utils.api_key_rotate import NoAvailableKeyError
+from utils.request_coalescing import coalesced, request_key
+from src.llm.client_pool import gemini_key_pool, llm_clients, retry_after_seconds
 
 logger = setup_logger("src/llm/openai_llm.py")
 
-async def google_chat_completions(
-    input: str,
-    system_prompt: str = "",
-    model: str = "gemini-2.0-flash-exp"
-):
-    try:
-        logger.info("Starting google_chat_completions with model: %s", model)
-        current_api_key = gemini_api_key_manager.get_next_available_key()
-        google_client = OpenAI(
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
-            api_key=current_api_key
-        )
-        
-        response = google_client.chat.completions.create(
+# A 429 quarantines the key; 429s, 5xx and connection errors are retried on
+# another key from the pool
+GEMINI_KEY_ATTEMPTS = 3
+
+async def acquire_gemini_key() -> str:
+    return await gemini_key_pool.acquire(timeout=settings.GEMINI_KEY_ACQUIRE_TIMEOUT_SECONDS)
+
+def llm_request_key(input: str, system_prompt: str = "", model: Optional[str] = None) -> str:
+    return request_key(" ".join(input.split()), system_prompt, model)
+
+# Identical completions in flight share one upstream call. A call whose
+# callers all went away (e.g. a hedge that lost) is cancelled.
+coalesced_completion = coalesced(
+    llm_request_key,
+    timeout=settings.LLM_TIMEOUT_SECONDS,
+    across_replicas=settings.COALESCE_ACROSS_REPLICAS,
+    cancel_abandoned=True
+)
+
+async def chat_completion(provider: str, api_key: str, input: str, system_prompt: str, model: str) -> str:
+    """
+    One completion on the shared client for provider, within its concurrency limit
+    """
+    client = llm_clients.client(provider, api_key)
+    async with llm_clients.semaphore(provider):
+        response = await client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -30,13 +45,107 @@ async def google_chat_completions(
                 }
             ]
         )
+    return response.choices[0].message.content
+
+async def chat_completion_stream(provider: str, api_key: str, input: str, system_prompt: str,
+                                 model: str) -> AsyncIterator[str]:
+    """
+    Stream one completion on the shared client for provider, holding its
+    concurrency slot until the stream is done or closed
+    """
+    client = llm_clients.client(provider, api_key)
+    async with llm_clients.semaphore(provider):
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {
+                    "role": "user",
+                    "content": input
+                }
+            ],
+            stream=True
+        )
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+@coalesced_completion
+async def google_chat_completions(
+    input: str,
+    system_prompt: str = "",
+    model: str = "gemini-2.0-flash-exp"
+):
+    try:
+        logger.info("Starting google_chat_completions with model: %s", model)
+        for attempt in range(GEMINI_KEY_ATTEMPTS):
+            current_api_key = await acquire_gemini_key()
+            try:
+                content = await chat_completion("google", current_api_key, input, system_prompt, model)
+                break
+            except (RateLimitError, APIConnectionError, InternalServerError) as e:
+                if isinstance(e, RateLimitError):
+                    await gemini_key_pool.quarantine(current_api_key, retry_after_seconds(e))
+                if attempt == GEMINI_KEY_ATTEMPTS - 1:
+                    raise
         logger.info("google_chat_completions response received")
-        gemini_api_key_manager.use_key(current_api_key)
-        return response.choices[0].message.content
+        return content
+    except NoAvailableKeyError as e:
+        logger.error("No Gemini API key available: %s", str(e))
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error("Error in google_chat_completions: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+async def google_chat_completions_stream(
+    input: str,
+    system_prompt: str = "",
+    model: str = "gemini-2.0-flash-exp"
+) -> AsyncIterator[str]:
+    """
+    Yield the completion text as the provider streams it. Closing the generator
+    (e.g. when the HTTP client disconnects) closes the upstream stream, which
+    stops generation.
+    """
+    logger.info("Starting google_chat_completions_stream with model: %s", model)
+    for attempt in range(GEMINI_KEY_ATTEMPTS):
+        # Wait for a key before taking a concurrency slot, so requests queued
+        # on the key pool do not hold slots that others could use
+        current_api_key = await acquire_gemini_key()
+        client = llm_clients.client("google", current_api_key)
+        async with llm_clients.semaphore("google"):
+            try:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {
+                            "role": "user",
+                            "content": input
+                        }
+                    ],
+                    stream=True
+                )
+            except (RateLimitError, APIConnectionError, InternalServerError) as e:
+                # Nothing has been yielded yet, so another key can take over
+                if isinstance(e, RateLimitError):
+                    await gemini_key_pool.quarantine(current_api_key, retry_after_seconds(e))
+                if attempt == GEMINI_KEY_ATTEMPTS - 1:
+                    raise
+                continue
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.close()
+        break
+    logger.info("google_chat_completions_stream finished")
+
+@coalesced_completion
 async def groq_chat_completions(
     input: str,
     system_prompt: str = "",
@@ -44,27 +153,24 @@ async def groq_chat_completions(
 ):
     try:
         logger.info("Starting groq_chat_completions with model: %s", model)
-        groq_client = OpenAI(
-            api_key=settings.GROQ_API_KEY,
-            base_url="https://api.groq.com/openai/v1"
-        )
-        
-        response = groq_client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": input
-                }
-            ]
-        )
+        content = await chat_completion("groq", settings.GROQ_API_KEY, input, system_prompt, model)
         logger.info("groq_chat_completions response received")
-        return response.choices[0].message.content
+        return content
     except Exception as e:
         logger.error("Error in groq_chat_completions: %s", str(e))
         raise HTTPException(status_code=500, detail=str(e))
     
+async def groq_chat_completions_stream(
+    input: str,
+    system_prompt: str = "",
+    model: str = "llama-3.3-70b-versatile"
+) -> AsyncIterator[str]:
+    logger.info("Starting groq_chat_completions_stream with model: %s", model)
+    async for text in chat_completion_stream("groq", settings.GROQ_API_KEY, input, system_prompt, model):
+        yield text
+    logger.info("groq_chat_completions_stream finished")
+
+@coalesced_completion
 async def mistral_chat_completions(
     input: str,
     system_prompt: str = "",
@@ -72,23 +178,19 @@ async def mistral_chat_completions(
 ):
     try:
         logger.info("Starting mistral_chat_completions with model: %s", model)
-        client = OpenAI(
-            api_key=settings.MISTRAL_API_KEY,
-            base_url="https://api.mistral.ai/v1"
-        )
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": input
-                }
-            ]
-        )
+        content = await chat_completion("mistral", settings.MISTRAL_API_KEY, input, system_prompt, model)
         logger.info("mistral_chat_completions response received")
-        return response.choices[0].message.content
+        return content
     except Exception as e:
         logger.error("Error in mistral_chat_completions: %s", str(e))
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def mistral_chat_completions_stream(
+    input: str,
+    system_prompt: str = "",
+    model: str = "mistral-1.0-70b"
+) -> AsyncIterator[str]:
+    logger.info("Starting mistral_chat_completions_stream with model: %s", model)
+    async for text in chat_completion_stream("mistral", settings.MISTRAL_API_KEY, input, system_prompt, model):
+        yield text
+    logger.info("mistral_chat_completions_stream finished")
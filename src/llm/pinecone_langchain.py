@@ -1,10 +1,18 @@
-from typing import Dict, List
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional
+import orjson
 from pinecone import Pinecone, ServerlessSpec
 from utils.config import get_sync_database, settings
 from langchain_pinecone import PineconeVectorStore
 from langchain_core.documents import Document
 from utils.app_logger import setup_logger
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from src.llm.embedding_cache import CachedEmbeddings
+from src.llm.numpy_index import NumpyVectorIndex
+from utils.redis_client import sync_redis_client
+from utils.request_coalescing import coalesced, request_key
 from langchain_mongodb import MongoDBAtlasVectorSearch
 from pymongo import MongoClient
 
@@ -14,11 +22,41 @@ index = pc.Index("nm2")
 
 sync_db = get_sync_database()
 
-embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=settings.GEMINI_API_KEY1)
+embedding_model = "models/text-embedding-004"
+embeddings = CachedEmbeddings(
+    GoogleGenerativeAIEmbeddings(model=embedding_model, google_api_key=settings.GEMINI_API_KEY1),
+    model_name=embedding_model,
+    redis_client=sync_redis_client,
+    max_entries=settings.EMBEDDING_CACHE_SIZE,
+    expire=settings.EMBEDDING_CACHE_TTL_SECONDS
+)
 
 
 logger = setup_logger("src/llm/pinecone.py")
 
+# Pinecone and the embedding client are blocking, so async callers run them on
+# this bounded pool instead of on the event loop.
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=settings.RETRIEVAL_MAX_WORKERS,
+    thread_name_prefix="retrieval"
+)
+
+vector_stores: Dict[str, PineconeVectorStore] = {}
+
+# Local stand-in for Pinecone, loaded from the snapshot written by
+# src/scripts/build_vector_snapshot.py
+numpy_index = NumpyVectorIndex(settings.NUMPY_INDEX_PATH, reload_interval=settings.NUMPY_INDEX_RELOAD_SECONDS)
+
+def get_vector_store(tenant_id: str) -> PineconeVectorStore:
+    """
+    Return the long-lived vector store for a namespace, creating it on first use
+    """
+    vector_store = vector_stores.get(tenant_id)
+    if vector_store is None:
+        vector_store = PineconeVectorStore(index=index, embedding=embeddings, namespace=tenant_id)
+        vector_stores[tenant_id] = vector_store
+    return vector_store
+
 def create_index(name: str, dimension: int = 768):
     logger.info(f"Creating index: {name} with dimension: {dimension}")
     try:
@@ -43,7 +81,7 @@ def delete_index(name: str):
 def upload_documents(tenant_id: str, documents: List[Document], uuids: List[str]):
     logger.info(f"Uploading {len(documents)} documents for tenant_id: {tenant_id}")
     try:
-        vector_store = PineconeVectorStore(index=index, embedding=embeddings, namespace=tenant_id)
+        vector_store = get_vector_store(tenant_id)
         data = vector_store.add_documents(documents=documents, ids=uuids)
         logger.info(f"Successfully uploaded {len(documents)} documents for tenant_id: {tenant_id}")
         return data
@@ -51,10 +89,30 @@ def upload_documents(tenant_id: str, documents: List[Document], uuids: List[str]
         logger.error(f"Error uploading documents for tenant_id {tenant_id}: {str(e)}")
         return None
     
+def upsert_embeddings(tenant_id: str, documents: List[Document], vectors: List[List[float]], uuids: List[str],
+                      batch_size: int = 100):
+    """
+    Upsert documents with precomputed vectors, batch_size per request. The
+    page content goes under metadata["text"], where PineconeVectorStore reads it.
+    """
+    logger.info(f"Upserting {len(documents)} vectors for tenant_id: {tenant_id}")
+    try:
+        vector_tuples = [
+            (uuid, vector, {**document.metadata, "text": document.page_content})
+            for uuid, vector, document in zip(uuids, vectors, documents)
+        ]
+        for start in range(0, len(vector_tuples), batch_size):
+            index.upsert(vectors=vector_tuples[start:start + batch_size], namespace=tenant_id)
+        logger.info(f"Successfully upserted {len(documents)} vectors for tenant_id: {tenant_id}")
+        return uuids
+    except Exception as e:
+        logger.error(f"Error upserting vectors for tenant_id {tenant_id}: {str(e)}")
+        return None
+
 def delete_documents(tenant_id: str, integration_id: str, uuids: List[str]):
     logger.info(f"Deleting {len(uuids)} documents for tenant_id: {tenant_id} and integration_id: {integration_id}")
     try:
-        vector_store = PineconeVectorStore(index=index, embedding=embeddings, namespace=tenant_id)
+        vector_store = get_vector_store(tenant_id)
         data = vector_store.delete(ids=uuids)
         logger.info(f"Successfully deleted {len(uuids)} documents for tenant_id: {tenant_id} and integration_id: {integration_id}")
         return data
@@ -65,14 +123,79 @@ def delete_documents(tenant_id: str, integration_id: str, uuids: List[str]):
 def retrieve_documents(tenant_id: str, query: str, filters: Dict = None, top_k: int = 5):
     logger.info(f"Retrieving documents for tenant_id: {tenant_id}, query: {query}, top_k: {top_k}")
     try:
-        vector_store = PineconeVectorStore(index=index, embedding=embeddings, namespace=tenant_id)
-        data = vector_store.similarity_search(query=query, k=top_k, filter=filters)
+        vector_store = get_vector_store(tenant_id)
+        results = vector_store.similarity_search_with_score(query=query, k=top_k, filter=filters)
+        data = []
+        for document, score in results:
+            document.metadata["score"] = score
+            data.append(document)
         logger.info(f"Successfully retrieved {len(data)} documents for tenant_id: {tenant_id}")
         return data
     except Exception as e:
         logger.error(f"Error retrieving documents for tenant_id {tenant_id}: {str(e)}")
         return None
     
+def retrieve_documents_numpy(tenant_id: str, query: str, filters: Dict = None, top_k: int = 5):
+    logger.info(f"Retrieving documents from numpy index for tenant_id: {tenant_id}, query: {query}, top_k: {top_k}")
+    try:
+        query_vector = embeddings.embed_query(query)
+        matches = numpy_index.search_with_filters(query_vector, top_k=top_k, filters=filters)
+        data = [
+            Document(id=prompt_id, page_content="", metadata={"prompt_id": prompt_id, "score": score})
+            for prompt_id, score in matches
+        ]
+        logger.info(f"Successfully retrieved {len(data)} documents for tenant_id: {tenant_id}")
+        return data
+    except Exception as e:
+        logger.error(f"Error retrieving documents from numpy index for tenant_id {tenant_id}: {str(e)}")
+        return None
+
+retrieval_backends = {
+    "pinecone": retrieve_documents,
+    "numpy": retrieve_documents_numpy,
+}
+
+def retrieval_request_key(tenant_id: str, query: str, filters: Dict = None, top_k: int = 5) -> str:
+    return request_key(settings.RETRIEVAL_BACKEND, tenant_id, " ".join(query.split()), filters, top_k)
+
+def dump_documents(documents: Optional[List[Document]]) -> bytes:
+    if documents is None:
+        return orjson.dumps(None)
+    return orjson.dumps(
+        [{"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata} for doc in documents],
+        default=str
+    )
+
+def load_documents(blob: bytes) -> Optional[List[Document]]:
+    data = orjson.loads(blob)
+    return None if data is None else [Document(**doc) for doc in data]
+
+@coalesced(
+    retrieval_request_key,
+    timeout=settings.RETRIEVAL_TIMEOUT_SECONDS,
+    across_replicas=settings.COALESCE_ACROSS_REPLICAS,
+    dumps=dump_documents,
+    loads=load_documents
+)
+async def aretrieve_documents(tenant_id: str, query: str, filters: Dict = None, top_k: int = 5):
+    """
+    Non-blocking retrieval through the configured backend (settings.RETRIEVAL_BACKEND),
+    run on the retrieval pool
+    """
+    retrieve = retrieval_backends[settings.RETRIEVAL_BACKEND]
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(
+                retrieval_executor,
+                partial(retrieve, tenant_id, query, filters, top_k)
+            ),
+            timeout=settings.RETRIEVAL_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        logger.error(f"Timed out retrieving documents for tenant_id: {tenant_id}, query: {query}")
+        return None
+    
 def retrieve_documents_mongo_db(tenant_id: str, query: str, filters: Dict = None, top_k: int = 5):
     logger.info(f"Retrieving documents for tenant_id: {tenant_id}, query: {query}, top_k: {top_k}")
     try:
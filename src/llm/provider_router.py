@@ -0,0 +1,288 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from utils.config import settings
+from utils.app_logger import setup_logger
+from src.llm.openai_llm import (
+    google_chat_completions,
+    google_chat_completions_stream,
+    groq_chat_completions,
+    groq_chat_completions_stream,
+    mistral_chat_completions,
+    mistral_chat_completions_stream
+)
+
+logger = setup_logger("src/llm/provider_router.py")
+
+@dataclass
+class ProviderRoute:
+    provider: str
+    model: str
+    complete: Callable[..., Awaitable[str]]
+    stream: Optional[Callable[..., AsyncIterator[str]]] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+class RouteStats:
+    """
+    EWMA of latency and error rate for one route, plus recent latencies for p95
+    """
+
+    def __init__(self, alpha: float = 0.2, window: int = 100, prior_latency: float = 2.0):
+        self.alpha = alpha
+        self.prior_latency = prior_latency
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, latency: Optional[float]) -> None:
+        """
+        Record a call that took latency seconds, or failed if latency is None
+        """
+        self.error_rate += self.alpha * ((1.0 if latency is None else 0.0) - self.error_rate)
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+            self.samples.append(latency)
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < 5:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def score(self) -> float:
+        """
+        Expected cost of a call: latency inflated by the error rate. Routes
+        without samples are scored at prior_latency, so they still get tried
+        when the measured ones are slower than that.
+        """
+        latency = self.prior_latency if self.latency is None else self.latency
+        return latency / max(1.0 - self.error_rate, 0.05)
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    reset_seconds. Then one probe call is let through (half-open): success
+    closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def begin(self) -> None:
+        if self.state == "half_open":
+            self.probing = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self.probing:
+                logger.warning(f"Circuit breaker for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+    def release(self) -> None:
+        """
+        The call was cancelled (it lost a hedge): no verdict on the provider
+        """
+        self.probing = False
+
+class ProviderRouter:
+    """
+    Send each completion to the best healthy route (lowest EWMA latency
+    adjusted for errors, breaker not open), failing over to the next route
+    when it fails.
+
+    With hedging (off by default: a hedge can pay for two completions), if
+    the first route has not answered after its p95 latency (clamped to
+    [hedge_min_delay, hedge_max_delay]), the next route is started as well;
+    the first answer wins and the other call is cancelled.
+    """
+
+    def __init__(self, routes: List[ProviderRoute], hedge: bool = False, hedge_min_delay: float = 0.5,
+                 hedge_max_delay: float = 5.0, alpha: float = 0.2, failure_threshold: int = 5,
+                 reset_seconds: float = 30.0, prior_latency: float = 2.0):
+        self.routes = routes
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.stats: Dict[str, RouteStats] = {
+            route.name: RouteStats(alpha, prior_latency=prior_latency) for route in routes
+        }
+        self.breakers: Dict[str, CircuitBreaker] = {
+            route.name: CircuitBreaker(route.name, failure_threshold, reset_seconds) for route in routes
+        }
+
+    def ranked(self) -> List[ProviderRoute]:
+        available = [route for route in self.routes if self.breakers[route.name].available()]
+        return sorted(available, key=lambda route: self.stats[route.name].score())
+
+    def hedge_delay(self, route: ProviderRoute) -> float:
+        p95 = self.stats[route.name].p95()
+        if p95 is None:
+            return self.hedge_max_delay
+        return min(max(p95, self.hedge_min_delay), self.hedge_max_delay)
+
+    async def attempt(self, route: ProviderRoute, input: str, system_prompt: str) -> str:
+        breaker = self.breakers[route.name]
+        stats = self.stats[route.name]
+        breaker.begin()
+        start = time.monotonic()
+        try:
+            content = await route.complete(input=input, system_prompt=system_prompt, model=route.model)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            stats.record(None)
+            breaker.record_failure()
+            logger.warning(f"LLM route {route.name} failed: {getattr(e, 'detail', str(e))}")
+            raise
+        stats.record(time.monotonic() - start)
+        breaker.record_success()
+        return content
+
+    async def complete(self, input: str, system_prompt: str = "") -> Tuple[str, ProviderRoute]:
+        """
+        Return the first successful completion and the route that produced it
+        """
+        candidates = self.ranked()
+        if not candidates:
+            raise HTTPException(status_code=503, detail="No LLM provider available")
+
+        pending: Dict[asyncio.Task, ProviderRoute] = {}
+        last_error: Optional[Exception] = None
+        launch = True
+        try:
+            while True:
+                if launch and candidates:
+                    route = candidates.pop(0)
+                    pending[asyncio.create_task(self.attempt(route, input, system_prompt))] = route
+                if not pending:
+                    break
+
+                # At most one hedge in flight next to the primary
+                timeout = None
+                if self.hedge and candidates and len(pending) < 2:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(set(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    route = pending.pop(task)
+                    if task.exception() is None:
+                        if len(pending):
+                            logger.info(f"Hedged LLM request won by {route.name}")
+                        return task.result(), route
+                    last_error = task.exception()
+
+                # Timed out: hedge. Everything in flight failed: fail over.
+                launch = not done or not pending
+        finally:
+            for task in pending:
+                task.cancel()
+
+        detail = getattr(last_error, "detail", str(last_error))
+        raise HTTPException(status_code=503, detail=f"All LLM providers failed: {detail}")
+
+    async def stream(self, input: str, system_prompt: str = "") -> Tuple[AsyncIterator[str], ProviderRoute]:
+        """
+        Open a streaming completion on the best healthy route that can stream,
+        failing over until one produces its first chunk (after that, text has
+        reached the client and a failure ends the stream). Returns the chunks,
+        first one included, and the route.
+
+        Streams are never hedged, and only feed the circuit breakers: time to
+        first token is not comparable with the completion latencies in stats.
+        """
+        candidates = [route for route in self.ranked() if route.stream is not None]
+        if not candidates:
+            raise HTTPException(status_code=503, detail="No LLM provider available")
+
+        last_error: Optional[Exception] = None
+        for route in candidates:
+            breaker = self.breakers[route.name]
+            breaker.begin()
+            chunks = route.stream(input=input, system_prompt=system_prompt, model=route.model)
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except asyncio.CancelledError:
+                breaker.release()
+                await chunks.aclose()
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                logger.warning(f"LLM stream route {route.name} failed: {getattr(e, 'detail', str(e))}")
+                last_error = e
+                await chunks.aclose()
+                continue
+            breaker.record_success()
+            return self.relay(route, first, chunks), route
+
+        detail = getattr(last_error, "detail", str(last_error))
+        raise HTTPException(status_code=503, detail=f"All LLM providers failed: {detail}")
+
+    async def relay(self, route: ProviderRoute, first: Optional[str],
+                    chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        breaker = self.breakers[route.name]
+        try:
+            if first is not None:
+                yield first
+            async for text in chunks:
+                yield text
+        except Exception:
+            breaker.record_failure()
+            raise
+        finally:
+            await chunks.aclose()
+
+customization_routes = [
+    ProviderRoute("google", settings.CUSTOMIZATION_MODEL, google_chat_completions, google_chat_completions_stream)
+]
+if settings.GROQ_API_KEY:
+    customization_routes.append(ProviderRoute(
+        "groq", settings.CUSTOMIZATION_GROQ_MODEL, groq_chat_completions, groq_chat_completions_stream
+    ))
+if settings.MISTRAL_API_KEY:
+    customization_routes.append(ProviderRoute(
+        "mistral", settings.CUSTOMIZATION_MISTRAL_MODEL, mistral_chat_completions, mistral_chat_completions_stream
+    ))
+
+customization_router = ProviderRouter(
+    customization_routes,
+    hedge=settings.LLM_HEDGE_ENABLED,
+    hedge_min_delay=settings.LLM_HEDGE_MIN_DELAY_SECONDS,
+    hedge_max_delay=settings.LLM_HEDGE_MAX_DELAY_SECONDS,
+    alpha=settings.LLM_LATENCY_EWMA_ALPHA,
+    failure_threshold=settings.LLM_BREAKER_FAILURE_THRESHOLD,
+    reset_seconds=settings.LLM_BREAKER_RESET_SECONDS,
+    prior_latency=settings.LLM_ROUTE_PRIOR_LATENCY_SECONDS
+)
@@ -1,9 +1,13 @@
+import asyncio
+import time
 from math import ceil
 from uuid import uuid4
+import orjson
 from fastapi import APIRouter, HTTPException, Query, Request, Depends, status
-from typing import Optional, List
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from typing import Optional, List, Tuple
 from datetime import datetime
-from utils.config import get_async_database
+from utils.config import get_async_database, settings
 from src.schemas.models import (
     Prompt, 
     PromptCategory, 
@@ -11,28 +15,176 @@ from src.schemas.models import (
     CreatePromptRequest,
     UpdatePromptRequest
 )
-from src.llm.pinecone_langchain import retrieve_documents
+from src.llm.pinecone_langchain import aretrieve_documents, embeddings
+from src.llm.customization_cache import CustomizationCache, prompt_version
+from src.llm.lexical_index import LexicalSearchIndex, reciprocal_rank_fusion
 from utils.app_logger import setup_logger
-from src.llm.openai_llm import google_chat_completions
+from src.llm.provider_router import customization_router
 from src.llm.system_prompts import system_prompt_for_customization
 from utils.rate_limiter import rate_limit
 from utils.redis_cache import cached
+from utils.cache_tags import (
+    CATEGORIES_TAG,
+    prompt_tag,
+    category_tag,
+    browse_tag,
+    author_tag
+)
+from utils.redis_client import async_redis_client
+from utils.count_cache import CountCache
+from utils.like_buffer import like_buffer
+from utils.leaderboard import leaderboard
+from utils.pagination import (
+    RankedResultStore,
+    encode_cursor,
+    decode_cursor,
+    encode_seek_cursor,
+    decode_seek_cursor,
+    seek_filter
+)
 
 logger = setup_logger("src/routers/serve_apis.py")
 router = APIRouter(prefix="/api")
 db = get_async_database()
+ranked_results = RankedResultStore(async_redis_client, expire=settings.SEARCH_CURSOR_TTL_SECONDS)
+prompt_counts = CountCache(async_redis_client, db.prompts_discover)
+lexical_index = LexicalSearchIndex(refresh_seconds=settings.LEXICAL_INDEX_REFRESH_SECONDS)
+customization_cache = CustomizationCache(
+    async_redis_client,
+    embeddings,
+    expire=settings.CUSTOMIZATION_CACHE_TTL_SECONDS,
+    threshold=settings.CUSTOMIZATION_SEMANTIC_THRESHOLD,
+    max_entries=settings.CUSTOMIZATION_SEMANTIC_MAX_ENTRIES
+)
+customization_prompt_version = prompt_version(system_prompt_for_customization)
 
-@router.get("/prompts/search")
-@cached(expire=300)  # Cache for 5 minutes
-async def search_prompts(
-    request: Request,
+prompt_projection = {"_id": 0}
+# Listing pages leave out the full prompt text; clients load it from /prompts/{prompt_id}.
+# pending_like_batches stays in, so it is stored with the cached pages and
+# like_buffer.apply_pending, run on each response after the cache, can tell
+# which like batches a like_count already includes before dropping the field.
+search_item_projection = {**prompt_projection, "original_prompt": 0}
+
+async def hydrate_prompts(hits: List[Tuple[str, float]], with_scores: bool = True) -> List[dict]:
+    """
+    Fetch the prompts for one page of ranked hits in a single query, in rank order and (optionally) with their scores
+    """
+    if not hits:
+        return []
+    
+    prompt_ids = [prompt_id for prompt_id, _ in hits]
+    documents = await db.prompts_discover.find(
+        {"prompt_id": {"$in": prompt_ids}},
+        search_item_projection
+    ).to_list(length=len(prompt_ids))
+    documents_by_id = {document["prompt_id"]: document for document in documents}
+    
+    prompts = []
+    for prompt_id, score in hits:
+        prompt = documents_by_id.get(prompt_id)
+        # Hits can outlive their document in the vector index
+        if prompt is None:
+            continue
+        if with_scores:
+            prompt["score"] = score
+        prompts.append(prompt)
+    return prompts
+
+async def vector_search_hits(query: str, filters: dict) -> List[Tuple[str, float]]:
+    document_retrieved = await aretrieve_documents(
+        tenant_id="harsh90731",
+        query=query,
+        filters=filters,
+        top_k=settings.SEARCH_MAX_RESULTS
+    )
+    if document_retrieved is None:
+        raise RuntimeError("Vector retrieval failed")
+    return [(doc.id, doc.metadata.get("score", 0.0)) for doc in document_retrieved]
+
+async def rank_search_hits(query: str, filters: dict, mode: str) -> List[Tuple[str, float]]:
+    """
+    Rank prompts for a text query. Hybrid mode fuses BM25 and vector hits with
+    reciprocal-rank fusion, and skips the vector search for navigational queries.
+    """
+    if mode == "vector":
+        return await vector_search_hits(query, filters)
+    
+    index = await lexical_index.get(db)
+    if index is None:
+        return await vector_search_hits(query, filters)
+    
+    tags = filters.get("tags", {}).get("$all")
+    lexical_hits = index.search(
+        query,
+        top_k=settings.SEARCH_MAX_RESULTS,
+        category=filters.get("category"),
+        tags=tags
+    )
+    if mode == "lexical" or index.is_navigational(query, lexical_hits, settings.SEARCH_NAVIGATIONAL_MIN_SCORE):
+        return lexical_hits
+    
+    vector_hits = await vector_search_hits(query, filters)
+    return reciprocal_rank_fusion([lexical_hits, vector_hits])[:settings.SEARCH_MAX_RESULTS]
+
+async def leaderboard_browse_page(category: Optional[str], direction: int, page: int, page_size: int,
+                                  cursor: Optional[str]) -> Optional[Tuple[List[dict], int, int, Optional[str]]]:
+    """
+    One like-ordered browse page from the leaderboard, as (prompts, total, page,
+    next cursor); None if the leaderboard is not seeded
+    """
+    board_key = leaderboard.key_for("likes", category)
+    offset = (page - 1) * page_size
+    if cursor:
+        try:
+            cursor_payload = decode_cursor(cursor)
+            if cursor_payload.get("k") != board_key or cursor_payload.get("d") != direction:
+                raise ValueError("Cursor does not match this listing")
+            offset = int(cursor_payload["o"])
+            if offset < 0:
+                raise ValueError("Cursor offset must not be negative")
+        except (KeyError, TypeError, ValueError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid cursor: {str(e)}"
+            )
+        page = offset // page_size + 1
+
+    board_page = await leaderboard.page("likes", category, offset, page_size, descending=direction == -1)
+    if board_page is None:
+        return None
+    page_hits, total_items = board_page
+    prompts = await hydrate_prompts(page_hits, with_scores=False)
+    next_cursor = None
+    if offset + page_size < total_items:
+        next_cursor = encode_cursor({"k": board_key, "d": direction, "o": offset + page_size})
+    return prompts, total_items, page, next_cursor
+
+def search_cache_tags(params: dict, response: dict) -> List[str]:
+    """
+    A listing page depends on its category filter and the prompts it shows;
+    browse pages also depend on the order of their sort key
+    """
+    category = params.get("category")
+    tags = [category_tag(category)]
+    query = params.get("query")
+    if not query or query == "undefined":
+        tags.append(browse_tag(params.get("sort_by"), category))
+    tags.extend(prompt_tag(prompt["prompt_id"]) for prompt in response["items"])
+    return tags
+
+# Cache for 10 minutes, 30 seconds in-process; writes invalidate by tag. Query
+# results also change when the vector index is rebuilt, which no tag covers.
+@cached(expire=600, local_ttl=30, stale_ttl=60, tags=search_cache_tags)
+async def search_prompts_page(
     query: Optional[str] = None,
     category: Optional[PromptCategory] = None,
-    tags: Optional[List[str]] = Query(None),
-    sort_by: Optional[str] = Query("like_count", enum=["created_at", "like_count", "name"]),
-    sort_order: Optional[str] = Query("desc", enum=["asc", "desc"]),
-    page: int = Query(1, ge=1),
-    page_size: int = Query(9, ge=1, le=100)
+    tags: Optional[List[str]] = None,
+    sort_by: str = "like_count",
+    sort_order: str = "desc",
+    page: int = 1,
+    page_size: int = 9,
+    cursor: Optional[str] = None,
+    mode: str = settings.SEARCH_DEFAULT_MODE
 ):
     try:
         skip = (page - 1) * page_size
@@ -43,38 +195,87 @@ async def search_prompts(
         if tags:
             filters["tags"] = {"$all": tags}
         
+        next_cursor = None
+        
         if query and query!="undefined":
-            document_retrieved = retrieve_documents(
-                tenant_id="harsh90731",
-                query=query,
-                filters=filters,
-                top_k=page_size * page
-            )
+            ranked_key = ranked_results.key_for(query, filters, mode)
+            offset = skip
+            if cursor:
+                try:
+                    cursor_payload = decode_cursor(cursor)
+                    if cursor_payload.get("k") != ranked_key:
+                        raise ValueError("Cursor does not match this search")
+                    offset = int(cursor_payload["o"])
+                    if offset < 0:
+                        raise ValueError("Cursor offset must not be negative")
+                except (KeyError, TypeError, ValueError) as e:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Invalid cursor: {str(e)}"
+                    )
+                page = offset // page_size + 1
             
-            prompt_ids = [doc.id for doc in document_retrieved]
-            
-            if document_retrieved:
-                prompts = await db.prompts_discover.find(
-                    {"prompt_id": {"$in": prompt_ids}}
-                ).to_list(length=None)
+            # The ranked id list is computed once per (query, filters) and
+            # every page is a slice of it
+            cached_page = await ranked_results.get_page(ranked_key, offset, page_size)
+            if cached_page is None:
+                ranked = await rank_search_hits(query, filters, mode)
+                await ranked_results.save(ranked_key, ranked)
+                page_hits, total_items = ranked[offset:offset + page_size], len(ranked)
             else:
-                prompts = []
+                page_hits, total_items = cached_page
+            
+            prompts = await hydrate_prompts(page_hits)
             
-            total_items = len(document_retrieved)
+            if offset + page_size < total_items:
+                next_cursor = encode_cursor({"k": ranked_key, "o": offset + page_size})
             
         else:
-            pipeline = [
-                {"$match": filters}, # Filtering first to reduce the documents to sort
-                {"$sort": {sort_by: 1 if sort_order == "asc" else -1}},
-                {"$skip": skip},
-                {"$limit": page_size},
-                {"$project": {"_id": 0}} # Remove _id at the end
-            ]
-
-            prompts = await db.prompts_discover.aggregate(pipeline).to_list(length=None)
+            direction = 1 if sort_order == "asc" else -1
+            board_page = None
+            if sort_by == "like_count" and not tags:
+                # Constant-time pages from the like leaderboard (Redis sorted sets)
+                board_page = await leaderboard_browse_page(category, direction, page, page_size, cursor)
+            
+            if board_page is not None:
+                prompts, total_items, page, next_cursor = board_page
+            else:
+                match = filters
+                if cursor:
+                    # Seek past the last document of the previous page instead of skipping
+                    try:
+                        last_value, last_prompt_id, page = decode_seek_cursor(cursor, sort_by, direction, filters)
+                    except ValueError as e:
+                        raise HTTPException(
+                            status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=str(e)
+                        )
+                    seek = seek_filter(sort_by, direction, last_value, last_prompt_id)
+                    match = {"$and": [filters, seek]} if filters else seek
+                    skip = 0
+                elif page > settings.BROWSE_MAX_OFFSET_PAGES:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Pages beyond {settings.BROWSE_MAX_OFFSET_PAGES} must be requested with next_cursor"
+                    )
+            
+                pipeline = [
+                    {"$match": match}, # Filtering first to reduce the documents to sort
+                    # prompt_id breaks ties so every document has a unique seek position
+                    {"$sort": {sort_by: direction, "prompt_id": direction}},
+                    {"$skip": skip},
+                    {"$limit": page_size},
+                    {"$project": search_item_projection} # Trim the payload at the end
+                ]
 
-            # Count query optimization - use count_documents for simple counting with filters
-            total_items = await db.prompts_discover.count_documents(filters)
+                # Totals come from the count cache, so they no longer cost a second collection scan
+                prompts, total_items = await asyncio.gather(
+                    db.prompts_discover.aggregate(pipeline).to_list(length=None),
+                    prompt_counts.count(filters)
+                )
+            
+                if len(prompts) == page_size and page * page_size < total_items:
+                    next_cursor = encode_seek_cursor(sort_by, direction, filters, prompts[-1], page + 1)
 
         # Clean up and prepare response
         for prompt in prompts:
@@ -88,21 +289,102 @@ async def search_prompts(
             "current_page": page,
             "total_items": total_items,
             "has_next": page < total_pages,
-            "has_previous": page > 1
+            "has_previous": page > 1,
+            "next_cursor": next_cursor
         }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in search_prompts: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An error occurred while searching prompts"
         )
-    
-@router.get("/prompts/{prompt_id}")
-@cached(expire=300)  # Cache for 5 minutes
-async def get_prompt(prompt_id: str):
+
+@router.get("/prompts/search")
+async def search_prompts(
+    request: Request,
+    query: Optional[str] = None,
+    category: Optional[PromptCategory] = None,
+    tags: Optional[List[str]] = Query(None),
+    sort_by: Optional[str] = Query("like_count", enum=["created_at", "like_count", "name"]),
+    sort_order: Optional[str] = Query("desc", enum=["asc", "desc"]),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(9, ge=1, le=100),
+    cursor: Optional[str] = None,
+    mode: Optional[str] = Query(settings.SEARCH_DEFAULT_MODE, enum=["vector", "hybrid", "lexical"])
+):
+    result = await search_prompts_page(
+        query=query,
+        category=category,
+        tags=tags,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        page=page,
+        page_size=page_size,
+        cursor=cursor,
+        mode=mode
+    )
+    # Likes not yet flushed to Mongo are added on top of the cached page
+    await like_buffer.apply_pending(result["items"])
+    return ORJSONResponse(result)
+
+async def leaderboard_prompts(board: str, category: Optional[PromptCategory], limit: int) -> List[dict]:
+    board_page = await leaderboard.page(board, category, 0, limit)
+    if board_page is not None:
+        return await hydrate_prompts(board_page[0], with_scores=False)
+    if board == "trending":
+        return []
+    # Not seeded yet: fall back to the like_count index
+    filters = {"category": category} if category else {}
+    return await db.prompts_discover.find(filters, search_item_projection).sort(
+        [("like_count", -1), ("prompt_id", -1)]
+    ).limit(limit).to_list(length=limit)
+
+@router.get("/prompts/top")
+async def get_top_prompts(
+    category: Optional[PromptCategory] = None,
+    limit: int = Query(10, ge=1, le=100)
+):
+    """
+    Most liked prompts, overall or in one category
+    """
     try:
-        prompt = await db.prompts_discover.find_one({"prompt_id": prompt_id})
+        prompts = await leaderboard_prompts("likes", category, limit)
+        await like_buffer.apply_pending(prompts)
+        return ORJSONResponse({"items": prompts})
+    except Exception as e:
+        logger.error(f"Error in get_top_prompts: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch top prompts"
+        )
+
+@router.get("/prompts/trending")
+async def get_trending_prompts(
+    category: Optional[PromptCategory] = None,
+    limit: int = Query(10, ge=1, le=100)
+):
+    """
+    Prompts with the most recent likes, each like decaying with TRENDING_HALF_LIFE_SECONDS
+    """
+    try:
+        prompts = await leaderboard_prompts("trending", category, limit)
+        await like_buffer.apply_pending(prompts)
+        return ORJSONResponse({"items": prompts})
+    except Exception as e:
+        logger.error(f"Error in get_trending_prompts: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch trending prompts"
+        )
+
+# Cache for 1 hour, 1 minute in-process
+@cached(expire=3600, local_ttl=60, stale_ttl=60, tags=lambda params, prompt: [prompt_tag(prompt["prompt_id"])])
+async def load_prompt(prompt_id: str):
+    try:
+        prompt = await db.prompts_discover.find_one({"prompt_id": prompt_id}, prompt_projection)
         
         if not prompt:
             raise HTTPException(
@@ -121,12 +403,20 @@ async def get_prompt(prompt_id: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch prompt"
         )
-        
-@router.get("/prompts/author/{author_id}")
-@cached(expire=300)  # Cache for 5 minutes
-async def get_prompts_by_author(author_id: str):
+
+@router.get("/prompts/{prompt_id}")
+async def get_prompt(prompt_id: str):
+    prompt = await load_prompt(prompt_id=prompt_id)
+    await like_buffer.apply_pending([prompt])
+    return ORJSONResponse(prompt)
+
+@cached(
+    expire=3600,  # Cache for 1 hour
+    tags=lambda params, prompts: [author_tag(params["author_id"])] + [prompt_tag(prompt["prompt_id"]) for prompt in prompts]
+)
+async def load_prompts_by_author(author_id: str):
     try:
-        prompts = await db.prompts_discover.find({"author_id": author_id}).to_list(length=None)
+        prompts = await db.prompts_discover.find({"author_id": author_id}, prompt_projection).to_list(length=None)
         
         if not prompts:
             raise HTTPException(
@@ -147,21 +437,30 @@ async def get_prompts_by_author(author_id: str):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to fetch prompts"
         )
+
+@router.get("/prompts/author/{author_id}")
+async def get_prompts_by_author(author_id: str):
+    prompts = await load_prompts_by_author(author_id=author_id)
+    await like_buffer.apply_pending(prompts)
+    return ORJSONResponse(prompts)
         
 @router.post("/prompts/{prompt_id}/like")
 @rate_limit(max_requests=1, window_seconds=10000)
 async def like_prompt(request: Request, prompt_id: str):
     try:
-        result = await db.prompts_discover.update_one(
-            {"prompt_id": prompt_id},
-            {"$inc": {"like_count": 1}}
-        )
+        prompt = await db.prompts_discover.find_one({"prompt_id": prompt_id}, {"_id": 0, "category": 1})
         
-        if not result.modified_count:
+        if not prompt:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Prompt not found"
             )
+        
+        # Buffered in Redis and flushed to Mongo in bulk; reads merge the
+        # pending count in, and the flusher invalidates cached pages
+        if not await like_buffer.record(prompt_id):
+            raise RuntimeError("Could not record like")
+        await leaderboard.record_like(prompt_id, prompt.get("category"))
             
         return {
             "status": "Prompt liked successfully"
@@ -239,7 +538,7 @@ async def update_prompt(
         )
         
 @router.get("/categories")
-@cached(expire=3000)
+@cached(expire=3000, local_ttl=300, stale_ttl=600, raw=True, tags=lambda params, categories: [CATEGORIES_TAG])
 async def get_categories(
     request: Request
 ):
@@ -264,7 +563,7 @@ async def get_categories(
         )
 
 @router.post("/prompts/customize")
-@rate_limit(max_requests=5, window_seconds=60)
+@rate_limit(max_requests=5, window_seconds=60, algorithm="token_bucket")
 async def customize_prompt(request: Request, customization: CustomizationRequest):
     """
     Customize a prompt with user's specific requirements
@@ -281,18 +580,39 @@ async def customize_prompt(request: Request, customization: CustomizationRequest
                 detail="Prompt not found"
             )
 
-        # Combine original prompt with customization request
-        message = (
-            f"Original Prompt: {prompt['original_prompt']}\n"
-            f"Customization Request: {customization.customization_message}"
-        )
-        
-        # Get customized response from LLM
-        customized_prompt = await google_chat_completions(
-            input=message,
-            system_prompt=system_prompt_for_customization
+        cached_result = await customization_cache.lookup(
+            customization.prompt_id,
+            customization.customization_message,
+            settings.CUSTOMIZATION_MODEL,
+            customization_prompt_version
         )
-        logger.info(f"Customized prompt: {customized_prompt}")
+        if cached_result is not None:
+            logger.info(
+                f"Customization cache {cached_result['match']} hit for {customization.prompt_id} "
+                f"(served by {cached_result.get('served_by', 'unknown')})"
+            )
+            customized_prompt = cached_result["customized_prompt"]
+        else:
+            # Combine original prompt with customization request
+            message = (
+                f"Original Prompt: {prompt['original_prompt']}\n"
+                f"Customization Request: {customization.customization_message}"
+            )
+            
+            # Get customized response from the fastest healthy provider
+            customized_prompt, route = await customization_router.complete(
+                input=message,
+                system_prompt=system_prompt_for_customization
+            )
+            logger.info(f"Customized prompt from {route.name}: {customized_prompt}")
+            await customization_cache.store(
+                customization.prompt_id,
+                customization.customization_message,
+                settings.CUSTOMIZATION_MODEL,
+                customization_prompt_version,
+                customized_prompt,
+                served_by=route.name
+            )
         
         return {
             "original_prompt": prompt['original_prompt'],
@@ -309,4 +629,107 @@ async def customize_prompt(request: Request, customization: CustomizationRequest
         raise HTTPException(
             status_code=500,
             detail="Failed to customize prompt"
-        )
\ No newline at end of file
+        )
+
+def sse_event(event: str, data: dict) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+@router.post("/prompts/customize/stream")
+@rate_limit(max_requests=5, window_seconds=60, algorithm="token_bucket")
+async def customize_prompt_stream(request: Request, customization: CustomizationRequest):
+    """
+    Customize a prompt, streaming the result as Server-Sent Events: "token"
+    events with text as it is generated, then a "done" (or "error") event
+    """
+    try:
+        prompt = await db.prompts_discover.find_one(
+            {"prompt_id": customization.prompt_id, "is_public": True},
+            {"_id": 0, "original_prompt": 1}
+        )
+        
+        if not prompt:
+            raise HTTPException(
+                status_code=404,
+                detail="Prompt not found"
+            )
+
+        message = (
+            f"Original Prompt: {prompt['original_prompt']}\n"
+            f"Customization Request: {customization.customization_message}"
+        )
+        cached_result = await customization_cache.lookup(
+            customization.prompt_id,
+            customization.customization_message,
+            settings.CUSTOMIZATION_MODEL,
+            customization_prompt_version
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error customizing prompt: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to customize prompt"
+        )
+
+    async def generate():
+        if cached_result is not None:
+            logger.info(
+                f"Customization cache {cached_result['match']} hit for {customization.prompt_id} "
+                f"(served by {cached_result.get('served_by', 'unknown')})"
+            )
+            yield cached_result["customized_prompt"]
+            return
+        # Streamed by the fastest healthy provider, failing over until one starts
+        chunks, route = await customization_router.stream(
+            input=message,
+            system_prompt=system_prompt_for_customization
+        )
+        parts = []
+        async for text in chunks:
+            parts.append(text)
+            yield text
+        logger.info(f"Customized prompt streamed from {route.name}")
+        # Only complete generations are cached
+        await customization_cache.store(
+            customization.prompt_id,
+            customization.customization_message,
+            settings.CUSTOMIZATION_MODEL,
+            customization_prompt_version,
+            "".join(parts),
+            served_by=route.name
+        )
+
+    async def events():
+        started = time.monotonic()
+        first_token_at = None
+        length = 0
+        try:
+            async for text in generate():
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                length += len(text)
+                yield sse_event("token", {"text": text})
+            
+            yield sse_event("done", {
+                "prompt_id": customization.prompt_id,
+                "customization_message": customization.customization_message,
+                "created_at": datetime.utcnow(),
+                "cached": cached_result["match"] if cached_result is not None else None,
+                "length": length,
+                "time_to_first_token_ms": round(((first_token_at or time.monotonic()) - started) * 1000),
+                "elapsed_ms": round((time.monotonic() - started) * 1000)
+            })
+        except asyncio.CancelledError:
+            # The client went away: leaving the generator closes the upstream stream
+            logger.info(f"Customization stream for {customization.prompt_id} cancelled after {length} characters")
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming customized prompt: {str(e)}")
+            yield sse_event("error", {"detail": "Failed to customize prompt"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import List
+import numpy as np
+from src.llm.numpy_index import write_snapshot
+from src.llm.pinecone_langchain import index
+from utils.config import get_async_database, settings
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+db = get_async_database()
+
+async def build_vector_snapshot(tenant_id: str = "harsh90731", fetch_batch_size: int = 100):
+    """
+    Copy the Pinecone vectors of every prompt in prompts_discover into a local
+    snapshot for the numpy retrieval backend
+    """
+    prompts = await db.prompts_discover.find(
+        {},
+        {"_id": 0, "prompt_id": 1, "category": 1, "tags": 1}
+    ).to_list(length=None)
+    logging.info(f"Building vector snapshot for {len(prompts)} prompts")
+
+    ids: List[str] = []
+    categories: List[str] = []
+    tags: List[List[str]] = []
+    vectors: List[List[float]] = []
+
+    for start in range(0, len(prompts), fetch_batch_size):
+        batch = prompts[start:start + fetch_batch_size]
+        try:
+            response = await asyncio.to_thread(
+                index.fetch,
+                ids=[prompt["prompt_id"] for prompt in batch],
+                namespace=tenant_id
+            )
+        except Exception as e:
+            logging.error(f"Error fetching vectors from Pinecone: {e}")
+            raise
+
+        for prompt in batch:
+            vector = response.vectors.get(prompt["prompt_id"])
+            if vector is None:
+                logging.warning(f"No vector found in Pinecone for prompt {prompt['prompt_id']}")
+                continue
+            ids.append(prompt["prompt_id"])
+            categories.append(prompt.get("category") or "")
+            tags.append(prompt.get("tags") or [])
+            vectors.append(vector.values)
+
+    if not vectors:
+        logging.warning("No vectors fetched, snapshot not written")
+        return None
+
+    path = write_snapshot(
+        settings.NUMPY_INDEX_PATH,
+        ids,
+        np.asarray(vectors, dtype=np.float32),
+        categories,
+        tags
+    )
+    return {"total_vectors": len(ids), "vectors_file": path}
+
+async def main():
+    result = await build_vector_snapshot()
+    print(f"Snapshot complete: {result}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
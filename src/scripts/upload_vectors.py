@@ -1,21 +1,28 @@
-from typing import List
 from langchain.schema import Document
 import asyncio
 import logging
-from openai import OpenAI
-from src.llm.pinecone_langchain import upload_documents
+import time
+from dataclasses import dataclass
+from openai import RateLimitError
+from pymongo import UpdateOne
+from src.llm.client_pool import gemini_key_pool, llm_clients, retry_after_seconds
+from src.llm.pinecone_langchain import embeddings, upsert_embeddings
 from utils.config import get_async_database
-from utils.config import settings
 import json
-from typing import List, Optional
-from pydantic import BaseModel, Field, validator
+from typing import Dict, List, Optional, Tuple
 import datetime
 from enum import Enum
-from utils.api_key_rotate import APIKeyManager
+from utils.api_key_rotate import NoAvailableKeyError, RedisKeyPool
+from utils.count_cache import CountCache
+from utils.redis_client import async_redis_client
+from utils.redis_cache import cache
+from utils.cache_tags import prompt_inserted_tags
+from utils.leaderboard import leaderboard
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 db = get_async_database()
+prompt_counts = CountCache(async_redis_client, db.prompts_discover)
 
 class PromptCategory(str, Enum):
     CREATIVE = "Creative"        # Stories, poetry, art, music, creative writing
@@ -132,208 +139,360 @@ Prompt: You are 'Cognix,' a personalized learning assistant specializing in Topo
 }
 """
 
-async def fetch_prompts_from_mongodb(skip: int = 0, limit: int = 100) -> List[dict]:
-    """
-    Fetch prompts from MongoDB with pagination
-    """
-    try:
-        cursor = db.prompts_unmodified.find({}).skip(skip).limit(limit)
-        prompts = await cursor.to_list(length=limit)
-        return prompts
-    except Exception as e:
-        logging.error(f"Error fetching prompts from MongoDB: {e}")
-        return []
 
-async def generate_searchable_description(prompt_data: dict, api_key_manager: APIKeyManager) -> Optional[dict]:
+async def generate_searchable_description(prompt_data: dict, key_pool: RedisKeyPool,
+                                          max_key_wait: float = 120.0) -> Optional[dict]:
     """
-    Generate a search-friendly description for the prompt using Groq with API key rotation
+    Generate a search-friendly description for the prompt using Gemini, with keys from the shared key pool
     """
     max_retries = 3
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            prompt_name = prompt_data["name"]
-            prompt_description = prompt_data["description"]
-            prompt_text = prompt_data["prompts"].get("prompt1", "")
-            
-            input_text = f"""
-            Prompt Name: {prompt_name}
-            Prompt Description: {prompt_description}
-            Prompt: {prompt_text}
+    prompt_name = prompt_data.get("name", "N/A")
+    input_text = f"""
+            Prompt Name: {prompt_data["name"]}
+            Prompt Description: {prompt_data["description"]}
+            Prompt: {prompt_data["prompts"].get("prompt1", "")}
             
             Please generate a JSON object with the category, tags, and searchable description
             """
-            
-            # Get available API key
-            current_api_key = api_key_manager.get_next_available_key()
-            
-            client = OpenAI(
-                api_key=current_api_key,
-                base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-            )
-            
-            response = client.chat.completions.create(
-                model="gemini-2.0-flash-exp",
-                messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {"role": "user", "content": input_text}
-                ],
-                response_format={"type": "json_object"}
-            )
-            
-            # Mark the key as used
-            api_key_manager.use_key(current_api_key)
-            
-            if response.choices and response.choices[0].message.content:
-                try:
-                    parse = json.loads(response.choices[0].message.content)
-                    logging.info(f"Successfully generated searchable description for: {prompt_name}")
-                    return {
-                        "name": prompt_data["name"],
-                        "description": prompt_data["description"],
-                        "category": parse.get("category"),
-                        "tags": parse.get("tags", []),
-                        "search_description": parse.get("searchable_description"),
-                        "original_prompt": prompt_data["prompts"].get("prompt1", "")
-                    }
-                except json.JSONDecodeError as e:
-                    logging.error(f"JSONDecodeError for prompt {prompt_data.get('name', 'N/A')}: {e}")
-                    retry_count += 1
-                    
+
+    for retry_count in range(max_retries):
+        try:
+            # Waits (without blocking the other workers) while every key is busy
+            current_api_key = await key_pool.acquire(timeout=max_key_wait)
+        except NoAvailableKeyError as e:
+            logging.error(f"No API key available for prompt {prompt_name}: {e}")
+            continue
+
+        client = llm_clients.client("google", current_api_key)
+        try:
+            async with llm_clients.semaphore("google"):
+                response = await client.chat.completions.create(
+                    model="gemini-2.0-flash-exp",
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": input_text}
+                    ],
+                    response_format={"type": "json_object"}
+                )
+        except RateLimitError as e:
+            logging.info(f"Rate limit reached for a key on prompt {prompt_name}. Switching to next key.")
+            await key_pool.quarantine(current_api_key, retry_after_seconds(e))
+            continue
         except Exception as e:
-            logging.error(f"Error generating searchable description: {e} for prompt {prompt_data.get('name', 'N/A')}")
-            if "rate_limit" in str(e).lower():
-                logging.info(f"Rate limit reached for key {current_api_key}. Switching to next key.")
-                retry_count += 1
-                await asyncio.sleep(2)  # Small delay before retry
-            else:
-                retry_count += 1
-    
+            logging.error(f"Error generating searchable description: {e} for prompt {prompt_name}")
+            continue
+
+        if not (response.choices and response.choices[0].message.content):
+            continue
+        try:
+            parse = json.loads(response.choices[0].message.content)
+        except json.JSONDecodeError as e:
+            logging.error(f"JSONDecodeError for prompt {prompt_name}: {e}")
+            continue
+        logging.debug(f"Generated searchable description for: {prompt_name}")
+        return {
+            "name": prompt_data["name"],
+            "description": prompt_data["description"],
+            "category": parse.get("category"),
+            "tags": parse.get("tags", []),
+            "search_description": parse.get("searchable_description"),
+            "original_prompt": prompt_data["prompts"].get("prompt1", "")
+        }
+
     return None
 
-async def upload_prompt_to_vector_db(batch_size: int = 1):
+def build_records(prompt: dict, search_description: dict, tenant_id: str) -> Tuple[dict, Document]:
     """
-    Main function to process prompts and upload to Pinecone and insert into mongodb
+    The prompts_discover document and the vector store document for one prompt
     """
-    api_keys = [
-        settings.GEMINI_API_KEY1,
-        settings.GEMINI_API_KEY2,
-        settings.GEMINI_API_KEY3,
-        settings.GEMINI_API_KEY4,
-        settings.GEMINI_API_KEY5
-    ]
-    api_key_manager = APIKeyManager(api_keys)
-    try:
-        skip = 0
-        total_processed = 0
-        total_uploaded = 0
-        total_inserted = 0
-        
+    now = datetime.datetime.now(datetime.UTC)
+    prompt_data_for_insert = {
+        "prompt_id": prompt["prompt_id"],
+        "name": prompt["name"],
+        "description": prompt["description"],
+        "search_description": search_description["search_description"],
+        "category": search_description["category"],
+        "tags": search_description["tags"],
+        "created_at": now,
+        "updated_at": now,
+        "like_count": 0,
+        "original_prompt": search_description["original_prompt"],
+        "is_public": True,
+        "author_id": tenant_id
+    }
+    document = Document(
+        page_content=search_description["search_description"],
+        metadata={
+            "prompt_id": prompt["prompt_id"],
+            "name": prompt["name"],
+            "description": prompt["description"],
+            "category": search_description["category"],
+            "tags": search_description["tags"],
+            # Pinecone metadata holds strings, numbers and lists of strings
+            "created_at": now.isoformat(),
+            "prompt": search_description["original_prompt"],
+            "author_id": tenant_id
+        }
+    )
+    return prompt_data_for_insert, document
+
+async def insert_prompts(records: List[dict]) -> List[dict]:
+    """
+    Insert records into prompts_discover in one bulk write, skipping prompt_ids
+    that are already there, and return the records actually inserted
+    """
+    result = await db.prompts_discover.bulk_write(
+        [
+            UpdateOne(
+                {"prompt_id": record["prompt_id"]},
+                {"$setOnInsert": {key: value for key, value in record.items() if key != "prompt_id"}},
+                upsert=True
+            )
+            for record in records
+        ],
+        ordered=False
+    )
+    inserted = [records[position] for position in result.upserted_ids]
+
+    if inserted:
+        await asyncio.gather(*(prompt_counts.record_insert(record) for record in inserted))
+        tags = set()
+        for record in inserted:
+            tags.update(prompt_inserted_tags(record))
+        await cache.invalidate_tags(*tags)
+        await asyncio.gather(*(leaderboard.add_prompt(record) for record in inserted))
+    return inserted
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    failed: int = 0
+
+    def summary(self, elapsed: float) -> str:
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        failed = f", {self.failed} failed" if self.failed else ""
+        return f"{self.name} {self.items} ({rate:.1f}/s{failed})"
+
+class IngestionPipeline:
+    """
+    Staged ingestion from prompts_unmodified into prompts_discover and Pinecone.
+
+    A reader streams prompts from Mongo into a pool of metadata workers (sized
+    to the API key pool). Their results are embedded in batches, upserted to
+    Pinecone and then inserted into Mongo with one bulk write per batch. The
+    stages are connected by bounded queues, so the slowest stage sets the pace
+    instead of work piling up in memory. Prompts are written to Mongo last and
+    ones already there are skipped, so a re-run picks up where a failed run
+    stopped.
+    """
+
+    def __init__(self, key_pool: RedisKeyPool, tenant_id: str = "harsh90731", read_batch_size: int = 100,
+                 workers: Optional[int] = None, workers_per_key: int = 2, sink_batch_size: int = 100,
+                 sink_flush_seconds: float = 2.0, skip_existing: bool = True, report_interval: float = 10.0):
+        self.key_pool = key_pool
+        self.tenant_id = tenant_id
+        self.read_batch_size = read_batch_size
+        self.workers = workers or max(1, len(key_pool) * workers_per_key)
+        self.sink_batch_size = sink_batch_size
+        self.sink_flush_seconds = sink_flush_seconds
+        self.skip_existing = skip_existing
+        self.report_interval = report_interval
+        self.prompt_queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        self.metadata_queue: asyncio.Queue = asyncio.Queue(maxsize=sink_batch_size * 2)
+        self.write_queue: asyncio.Queue = asyncio.Queue(maxsize=2)
+        self.stats: Dict[str, StageStats] = {
+            name: StageStats(name) for name in ("read", "metadata", "embed", "upload", "insert")
+        }
+        # Prompts already in prompts_discover; not a stage, they never leave the reader
+        self.skipped = 0
+
+    async def read(self) -> None:
+        cursor = db.prompts_unmodified.find({}).batch_size(self.read_batch_size)
+        batch = []
+        async for prompt in cursor:
+            batch.append(prompt)
+            if len(batch) >= self.read_batch_size:
+                await self.enqueue_prompts(batch)
+                batch = []
+        if batch:
+            await self.enqueue_prompts(batch)
+        for _ in range(self.workers):
+            await self.prompt_queue.put(None)
+
+    async def enqueue_prompts(self, prompts: List[dict]) -> None:
+        self.stats["read"].items += len(prompts)
+        if self.skip_existing:
+            existing = await db.prompts_discover.find(
+                {"prompt_id": {"$in": [prompt["prompt_id"] for prompt in prompts]}},
+                {"_id": 0, "prompt_id": 1}
+            ).to_list(length=None)
+            existing_ids = {document["prompt_id"] for document in existing}
+            self.skipped += len(existing_ids)
+            prompts = [prompt for prompt in prompts if prompt["prompt_id"] not in existing_ids]
+        for prompt in prompts:
+            await self.prompt_queue.put(prompt)
+
+    async def generate_metadata(self) -> None:
         while True:
-            # Fetch batch of prompts from MongoDB
-            prompts = await fetch_prompts_from_mongodb(skip=skip, limit=batch_size)
-            if not prompts:
-                logging.info("No more prompts found in MongoDB. Exiting...")
+            prompt = await self.prompt_queue.get()
+            if prompt is None:
+                return
+            search_description = await generate_searchable_description(prompt, self.key_pool)
+            if not search_description:
+                logging.warning(f"Skipping prompt {prompt.get('name', 'N/A')} due to missing or invalid searchable description.")
+                self.stats["metadata"].failed += 1
+                continue
+            self.stats["metadata"].items += 1
+            await self.metadata_queue.put(build_records(prompt, search_description, self.tenant_id))
+
+    async def run_metadata_workers(self) -> None:
+        await asyncio.gather(*(self.generate_metadata() for _ in range(self.workers)))
+        await self.metadata_queue.put(None)
+
+    async def next_batch(self) -> Tuple[List[Tuple[dict, Document]], bool]:
+        """
+        Up to sink_batch_size records, or fewer once sink_flush_seconds pass; and whether the input is exhausted
+        """
+        loop = asyncio.get_running_loop()
+        item = await self.metadata_queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        # The flush clock starts with the first record of the batch
+        deadline = loop.time() + self.sink_flush_seconds
+        while len(batch) < self.sink_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
                 break
-            
-            documents = []
-            uuids = []
-            
-            # Process each prompt in the batch
-            for prompt in prompts:
-                try:
-                    # Generate search-friendly description
-                    search_description = await generate_searchable_description(prompt, api_key_manager)
-                    if not search_description:
-                        logging.warning(f"Skipping prompt {prompt.get('name', 'N/A')} due to missing or invalid searchable description.")
-                        continue
-                        
-                    # Insert prompt document in prompts_discover collection
-                    prompt_data_for_insert = {
-                        "prompt_id": prompt["prompt_id"],
-                        "name": prompt["name"],
-                        "description": prompt["description"],
-                        "search_description": search_description["search_description"],
-                        "category": search_description["category"],
-                        "tags": search_description["tags"],
-                        "created_at": datetime.datetime.now(datetime.UTC),
-                        "updated_at": datetime.datetime.now(datetime.UTC),
-                        "like_count":0,
-                        "original_prompt": search_description["original_prompt"],
-                        "is_public": True,
-                        "author_id": "harsh90731"
-                    }
-                    
-                    # Insert the document in the prompts_discover collection
-                    insert_result = await db.prompts_discover.insert_one(prompt_data_for_insert)
-                    
-                    if insert_result.inserted_id:
-                        total_inserted += 1
-                        logging.info(f"Successfully inserted new prompt {prompt.get("prompt_id", "NA")} in prompts_discover")
-                    else:
-                         logging.warning(f"Failed to insert prompt {prompt.get("prompt_id", "NA")} in prompts_discover")
-                         
-                    # Create document for vector store
-                    document = Document(
-                        page_content=search_description["search_description"],
-                        metadata={
-                            "prompt_id": prompt["prompt_id"],
-                            "name": prompt["name"],
-                            "description": prompt["description"],
-                            "category": search_description["category"],
-                            "tags": search_description["tags"],
-                            "created_at": datetime.datetime.now(datetime.UTC),
-                            "prompt": search_description["original_prompt"],
-                            "author_id": "harsh90731"
-                        }
-                    )
-                    
-                    documents.append(document)
-                    uuids.append(prompt["prompt_id"])
-                    
-                except Exception as e:
-                    logging.error(f"Error processing prompt {prompt.get('name', 'N/A')}: {e}")
-                    continue
-            
-            # Upload batch to Pinecone
-            if documents:
-                try:
-                # Using a fixed tenant_id for the prompt search engine
-                   tenant_id = "harsh90731"
-                   result = upload_documents(tenant_id, documents, uuids)
-                    
-                   if result:
-                      total_uploaded += len(documents)
-                      logging.info(f"Successfully uploaded {len(documents)} prompts to vector store.")
-                   else:
-                        logging.warning("Pinecone upload failed for the batch.")
-                except Exception as e:
-                    logging.error(f"Error uploading batch to Pinecone: {e}")
-            else:
-                logging.info("No document to upload to Pinecone")
-                
-            total_processed += len(prompts)
-            skip += batch_size
-            
-            
-            # Optional: Add a small delay to prevent overloading
-            await asyncio.sleep(1)
-        
+            try:
+                item = await asyncio.wait_for(self.metadata_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def embed(self) -> None:
+        finished = False
+        while not finished:
+            batch, finished = await self.next_batch()
+            if not batch:
+                continue
+            documents = [document for _, document in batch]
+            try:
+                vectors = await asyncio.to_thread(
+                    embeddings.embed_documents,
+                    [document.page_content for document in documents]
+                )
+            except Exception as e:
+                logging.error(f"Error embedding batch of {len(batch)} prompts: {e}")
+                self.stats["embed"].failed += len(batch)
+                continue
+            self.stats["embed"].items += len(batch)
+            await self.write_queue.put((batch, vectors))
+        await self.write_queue.put(None)
+
+    async def write(self) -> None:
+        while True:
+            item = await self.write_queue.get()
+            if item is None:
+                return
+            batch, vectors = item
+            records = [record for record, _ in batch]
+            uuids = [record["prompt_id"] for record in records]
+            result = await asyncio.to_thread(
+                upsert_embeddings,
+                self.tenant_id,
+                [document for _, document in batch],
+                vectors,
+                uuids
+            )
+            if not result:
+                logging.warning("Pinecone upload failed for the batch.")
+                self.stats["upload"].failed += len(batch)
+                continue
+            self.stats["upload"].items += len(batch)
+            try:
+                inserted = await insert_prompts(records)
+            except Exception as e:
+                logging.error(f"Error inserting batch into prompts_discover: {e}")
+                self.stats["insert"].failed += len(batch)
+                continue
+            self.stats["insert"].items += len(inserted)
+
+    def report(self, elapsed: float) -> str:
+        stages = " | ".join(stats.summary(elapsed) for stats in self.stats.values())
+        if self.skipped:
+            stages = f"{stages} | skipped {self.skipped} existing"
+        queues = (
+            f"queues prompts={self.prompt_queue.qsize()}/{self.prompt_queue.maxsize} "
+            f"metadata={self.metadata_queue.qsize()}/{self.metadata_queue.maxsize} "
+            f"write={self.write_queue.qsize()}/{self.write_queue.maxsize}"
+        )
+        return f"{stages} | {queues}"
+
+    async def run_reporter(self, started: float) -> None:
+        while True:
+            await asyncio.sleep(self.report_interval)
+            logging.info(self.report(time.monotonic() - started))
+
+    async def run(self) -> dict:
+        logging.info(f"Starting ingestion with {self.workers} metadata workers")
+        started = time.monotonic()
+        reporter = asyncio.create_task(self.run_reporter(started))
+        try:
+            # A stage that raises cancels the others instead of leaving them blocked on a queue
+            async with asyncio.TaskGroup() as group:
+                group.create_task(self.read())
+                group.create_task(self.run_metadata_workers())
+                group.create_task(self.embed())
+                group.create_task(self.write())
+        finally:
+            reporter.cancel()
+        elapsed = time.monotonic() - started
+        logging.info(f"Ingestion finished in {elapsed:.1f}s: {self.report(elapsed)}")
         return {
-            "total_processed": total_processed,
-            "total_uploaded": total_uploaded,
-            "total_inserted": total_inserted,
+            "total_processed": self.stats["read"].items,
+            "total_uploaded": self.stats["upload"].items,
+            "total_inserted": self.stats["insert"].items,
+            "total_skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 1),
+            "stages": {
+                name: {
+                    "items": stats.items,
+                    "failed": stats.failed,
+                    "per_second": round(stats.items / elapsed, 2) if elapsed > 0 else 0.0
+                }
+                for name, stats in self.stats.items()
+            }
         }
-        
+
+async def upload_prompt_to_vector_db(batch_size: int = 100, workers: Optional[int] = None,
+                                     sink_batch_size: int = 100, skip_existing: bool = True):
+    """
+    Main function to process prompts and upload to Pinecone and insert into mongodb
+    """
+    try:
+        pipeline = IngestionPipeline(
+            gemini_key_pool,
+            read_batch_size=batch_size,
+            workers=workers,
+            sink_batch_size=sink_batch_size,
+            skip_existing=skip_existing
+        )
+        return await pipeline.run()
     except Exception as e:
-         logging.error(f"Error in main processing loop: {e}")
-         raise
+        logging.error(f"Error in main processing loop: {e}")
+        raise
+    finally:
+        await llm_clients.aclose()
 
 # Example usage:
 async def main():
-    result = await upload_prompt_to_vector_db(batch_size=10) # set batch_size
+    result = await upload_prompt_to_vector_db(batch_size=100)
     print(f"Processing complete: {result}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -4,6 +4,7 @@ const API = {
     search: '/prompts/search',
     categories: '/categories',
     customize: '/prompts/customize',
+    customizeStream: '/prompts/customize/stream',
     upload: '/create_prompt',
     like: '/prompts/:prompt_id/like',
     author: '/prompts/author/:author_id'
@@ -43,6 +44,11 @@ let currentPage = 1;
 const pageSize = 9;
 let currentCategory = null;
 let currentSearchQuery = '';
+let currentSortBy = 'created_at';
+// Cursor for each page reached through "Next"; deep pages can only be loaded with one
+let pageCursors = {};
+// Mirrors BROWSE_MAX_OFFSET_PAGES: created_at listings past this page need a cursor
+const maxOffsetPages = 10;
 
 // DOM Elements
 const searchContainer = document.getElementById('search-container');
@@ -103,7 +109,9 @@ async function performSearch() {
 
     currentSearchQuery = query;
     currentCategory = null;
+    currentSortBy = 'created_at';
     currentPage = 1;
+    pageCursors = {};
     
     document.getElementById('categories-section').style.display = 'none';
     searchContainer.classList.remove('justify-center');
@@ -141,7 +149,10 @@ async function performSearch() {
 async function searchByCategory(category) {
     currentCategory = category;
     currentSearchQuery = '';
+    // Most liked first; served from the like leaderboard
+    currentSortBy = 'like_count';
     currentPage = 1;
+    pageCursors = {};
     searchInput.value = '';
     
     document.getElementById('categories-section').style.display = 'none';
@@ -155,7 +166,9 @@ async function searchByCategory(category) {
         const searchParams = new URLSearchParams({
             category: category,
             page: currentPage,
-            page_size: pageSize
+            page_size: pageSize,
+            sort_by: currentSortBy,
+            sort_order: 'desc'
         });
 
         const results = await fetchAPI(`${API.search}?${searchParams}`);
@@ -239,21 +252,62 @@ async function handleUploadSubmit(event) {
     }
 }
 
-async function customizePrompt(promptId, customization) {
+// Streams the customized prompt over Server-Sent Events; onText receives the text so far
+async function customizePrompt(promptId, customization, onText = () => {}) {
     try {
-        const response = await fetchAPI(API.customize, {
+        const response = await fetch(`${API.base}${API.customizeStream}`, {
             method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
                 prompt_id: promptId,
                 customization_message: customization
             })
         });
 
-        if (response && response.customized_prompt) {
-            return response.customized_prompt;
-        } else {
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.detail || 'API request failed');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let customizedPrompt = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                const payload = data ? JSON.parse(data) : {};
+
+                if (eventName === 'token') {
+                    customizedPrompt += payload.text;
+                    onText(customizedPrompt);
+                } else if (eventName === 'error') {
+                    throw new Error(payload.detail || 'Customization failed');
+                } else if (eventName === 'done') {
+                    return customizedPrompt;
+                }
+            }
+        }
+
+        if (!customizedPrompt) {
             throw new Error('Invalid response from customization API');
         }
+        return customizedPrompt;
     } catch (error) {
         console.error('Customization error:', error);
         throw error;
@@ -262,13 +316,11 @@ async function customizePrompt(promptId, customization) {
 
 // Handle Page Change
 async function handlePageChange(page) {
-    currentPage = page;
-    
     try {
         const searchParams = new URLSearchParams({
-            page: currentPage,
+            page: page,
             page_size: pageSize,
-            sort_by: 'created_at',
+            sort_by: currentSortBy,
             sort_order: 'desc'
         });
 
@@ -278,7 +330,12 @@ async function handlePageChange(page) {
         if (currentCategory) {
             searchParams.append('category', currentCategory);
         }
+        // Deep pages are only served through the cursor of the page before them
+        if (pageCursors[page]) {
+            searchParams.append('cursor', pageCursors[page]);
+        }
 
+        currentPage = page;
         const results = await fetchAPI(`${API.search}?${searchParams}`);
         displayResults(results);
         window.scrollTo(0, 0);
@@ -291,6 +348,9 @@ async function handlePageChange(page) {
 // Display Functions
 function displayResults(results) {
     resultsGrid.innerHTML = '';
+    if (results.next_cursor) {
+        pageCursors[results.current_page + 1] = results.next_cursor;
+    }
     
     results.items.forEach(prompt => {
         const card = document.createElement('div');
@@ -302,7 +362,16 @@ function displayResults(results) {
                 <span class="inline-block px-3 py-1 text-sm text-white bg-zinc-800 rounded-full">${prompt.category}</span>
             </div>
         `;
-        card.addEventListener('click', () => openModal(prompt));
+        card.addEventListener('click', async () => {
+            // Search results leave out the full prompt text, so load it on demand
+            if (!prompt.original_prompt) {
+                const fullPrompt = await fetchPromptById(prompt.prompt_id);
+                if (fullPrompt) {
+                    Object.assign(prompt, fullPrompt);
+                }
+            }
+            openModal(prompt);
+        });
         resultsGrid.appendChild(card);
     });
 
@@ -324,7 +393,7 @@ function displayPagination(totalPages) {
     paginationWrapper.className = 'flex justify-center items-center space-x-2 mt-8';
     
     // Previous button
-    if (currentPage > 1) {
+    if (currentPage > 1 && canLoadPage(currentPage - 1)) {
         const prevButton = createPaginationButton('Previous', currentPage - 1);
         paginationWrapper.appendChild(prevButton);
     }
@@ -344,10 +413,12 @@ function displayPagination(totalPages) {
     }
 
     for (let i = startPage; i <= endPage; i++) {
-        paginationWrapper.appendChild(createPaginationButton(i.toString(), i, i === currentPage));
+        if (i === currentPage || canLoadPage(i)) {
+            paginationWrapper.appendChild(createPaginationButton(i.toString(), i, i === currentPage));
+        }
     }
 
-    if (endPage < totalPages) {
+    if (endPage < totalPages && canLoadPage(totalPages)) {
         if (endPage < totalPages - 1) {
             const ellipsis = document.createElement('span');
             ellipsis.className = 'text-white px-2';
@@ -358,7 +429,7 @@ function displayPagination(totalPages) {
     }
 
     // Next button
-    if (currentPage < totalPages) {
+    if (currentPage < totalPages && canLoadPage(currentPage + 1)) {
         const nextButton = createPaginationButton('Next', currentPage + 1);
         paginationWrapper.appendChild(nextButton);
     }
@@ -366,6 +437,15 @@ function displayPagination(totalPages) {
     paginationContainer.appendChild(paginationWrapper);
 }
 
+// created_at listings are only served by page number up to maxOffsetPages;
+// beyond that a page needs the cursor handed out with the page before it
+function canLoadPage(page) {
+    if (currentSearchQuery || currentSortBy === 'like_count') {
+        return true;
+    }
+    return page <= maxOffsetPages || Boolean(pageCursors[page]);
+}
+
 function createPaginationButton(text, page, isActive = false) {
     const button = document.createElement('button');
     button.className = `px-4 py-2 text-sm rounded-lg ${
@@ -398,7 +478,9 @@ async function checkUrlForPrompt() {
 async function viewAllPrompts() {
     currentCategory = null;
     currentSearchQuery = '';
+    currentSortBy = 'created_at';
     currentPage = 1;
+    pageCursors = {};
     searchInput.value = '';
     
     document.getElementById('categories-section').style.display = 'none';
@@ -412,7 +494,7 @@ async function viewAllPrompts() {
         const searchParams = new URLSearchParams({
             page: currentPage,
             page_size: pageSize,
-            sort_by: 'created_at',
+            sort_by: currentSortBy,
             sort_order: 'desc'
         });
 
@@ -530,7 +612,9 @@ function resetToHome() {
     resultsContainer.classList.add('hidden');
     currentCategory = null;
     currentSearchQuery = '';
+    currentSortBy = 'created_at';
     currentPage = 1;
+    pageCursors = {};
     window.history.pushState({}, '', window.location.pathname);
 }
 
@@ -610,7 +694,10 @@ document.getElementById('customize-button').addEventListener('click', async () =
     button.disabled = true;
 
     try {
-        const customizedPrompt = await customizePrompt(promptId, customization);
+        const modalPrompt = document.getElementById('modal-prompt');
+        const customizedPrompt = await customizePrompt(promptId, customization, (text) => {
+            modalPrompt.textContent = text;
+        });
         
         if (customizedPrompt) {
             document.getElementById('modal-prompt').textContent = customizedPrompt;
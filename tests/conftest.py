@@ -0,0 +1,30 @@
+import os
+
+# Settings and the shared clients are created at import time; they connect
+# lazily, so placeholder URIs are enough for tests that never use them
+os.environ.setdefault("REDIS_URI", "redis://localhost:6379/0")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("PINECONE_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY1", "test")
+
+import fakeredis
+import pinecone
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+@pytest.fixture
+async def redis_client():
+    client = fakeredis.FakeAsyncRedis()
+    yield client
+    await client.aclose()
+
+@pytest.fixture
+def mongo_db():
+    return AsyncMongoMockClient().test_db
+
+@pytest.fixture
+def serve_apis(monkeypatch):
+    # The module resolves the Pinecone index by name at import, over the network
+    monkeypatch.setattr(pinecone.Pinecone, "Index", lambda self, name=None, host=None: None)
+    from src.routers import serve_apis
+    return serve_apis
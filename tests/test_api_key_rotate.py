@@ -0,0 +1,67 @@
+import asyncio
+import time
+from collections import Counter
+import pytest
+from utils.api_key_rotate import NoAvailableKeyError, RedisKeyPool
+
+async def test_each_key_is_capped_at_its_rate_limit(redis_client):
+    pool = RedisKeyPool(redis_client, "test", ["key-a", "key-b"], rate_limit=2, window_seconds=60)
+
+    acquired = Counter([await pool.acquire() for _ in range(4)])
+
+    assert acquired == {"key-a": 2, "key-b": 2}
+    with pytest.raises(NoAvailableKeyError):
+        await pool.acquire(timeout=0.05)
+
+async def test_concurrent_acquires_never_exceed_the_caps(redis_client):
+    pool = RedisKeyPool(redis_client, "test", ["key-a", "key-b"], rate_limit=3, window_seconds=60)
+
+    results = await asyncio.gather(*(pool.acquire(timeout=0.05) for _ in range(10)), return_exceptions=True)
+
+    acquired = Counter(result for result in results if isinstance(result, str))
+    assert acquired == {"key-a": 3, "key-b": 3}
+    assert sum(isinstance(result, NoAvailableKeyError) for result in results) == 4
+
+async def test_acquire_waits_for_a_token_to_refill(redis_client):
+    pool = RedisKeyPool(redis_client, "test", ["key-a"], rate_limit=4, window_seconds=1)
+    for _ in range(4):
+        await pool.acquire()
+
+    started = time.monotonic()
+    assert await pool.acquire(timeout=2) == "key-a"
+    # One token refills every 250 ms
+    assert 0.15 < time.monotonic() - started < 1
+
+async def test_quarantined_key_returns_to_rotation_when_it_expires(redis_client):
+    pool = RedisKeyPool(redis_client, "test", ["key-a", "key-b"], rate_limit=2, window_seconds=60)
+    await pool.quarantine("key-a", 0.3)
+
+    assert [await pool.acquire() for _ in range(2)] == ["key-b", "key-b"]
+    started = time.monotonic()
+    assert await pool.acquire(timeout=2) == "key-a"
+    assert 0.2 < time.monotonic() - started < 1
+
+async def test_quarantine_is_not_shortened_by_a_later_one(redis_client):
+    pool = RedisKeyPool(redis_client, "test", ["key-a"], rate_limit=10, window_seconds=60)
+    await pool.quarantine("key-a", 60)
+    await pool.quarantine("key-a", 0.01)
+
+    with pytest.raises(NoAvailableKeyError):
+        await pool.acquire(timeout=0.1)
+
+async def test_no_available_key_once_the_wait_budget_runs_out(redis_client):
+    pool = RedisKeyPool(redis_client, "test", ["key-a"], rate_limit=1, window_seconds=60)
+    await pool.acquire()
+
+    started = time.monotonic()
+    with pytest.raises(NoAvailableKeyError):
+        await pool.acquire(timeout=0.2)
+    assert 0.15 < time.monotonic() - started < 0.5
+
+async def test_pools_with_the_same_name_share_state(redis_client):
+    first = RedisKeyPool(redis_client, "test", ["key-a"], rate_limit=1, window_seconds=60)
+    second = RedisKeyPool(redis_client, "test", ["key-a"], rate_limit=1, window_seconds=60)
+    await first.acquire()
+
+    with pytest.raises(NoAvailableKeyError):
+        await second.acquire(timeout=0.05)
@@ -0,0 +1,38 @@
+import pytest
+from utils.count_cache import CountCache
+
+@pytest.fixture
+async def counts(redis_client, mongo_db):
+    await mongo_db.prompts_discover.insert_many([
+        {"prompt_id": "p1", "category": "Technical", "tags": ["sql"]},
+        {"prompt_id": "p2", "category": "Technical", "tags": ["python"]},
+        {"prompt_id": "p3", "category": "Creative", "tags": ["sql"]},
+    ])
+    return CountCache(redis_client, mongo_db.prompts_discover, expire=600)
+
+async def test_count_is_cached_with_expiry(counts, redis_client, mongo_db):
+    assert await counts.count({"category": "Technical"}) == 2
+    assert 0 < await redis_client.ttl(counts.key) <= 600
+
+    # Served from Redis, not recounted
+    await mongo_db.prompts_discover.delete_many({})
+    assert await counts.count({"category": "Technical"}) == 2
+
+async def test_later_counts_keep_the_original_expiry(counts, redis_client):
+    await counts.count({"category": "Technical"})
+    await redis_client.expire(counts.key, 100)
+
+    await counts.count({"tags": {"$all": ["sql"]}})
+
+    assert await redis_client.ttl(counts.key) <= 100
+
+async def test_record_insert_adjusts_matching_counts_only(counts):
+    await counts.count({"category": "Technical"})
+    await counts.count({"tags": {"$all": ["sql"]}})
+    await counts.count({"category": "Creative", "tags": {"$all": ["python"]}})
+
+    await counts.record_insert({"prompt_id": "p4", "category": "Technical", "tags": ["sql"]})
+
+    assert await counts.count({"category": "Technical"}) == 3
+    assert await counts.count({"tags": {"$all": ["sql"]}}) == 3
+    assert await counts.count({"category": "Creative", "tags": {"$all": ["python"]}}) == 0
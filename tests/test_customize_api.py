@@ -0,0 +1,82 @@
+import httpx
+import orjson
+import pytest
+from fastapi import FastAPI
+from src.llm.customization_cache import CustomizationCache
+from src.llm.provider_router import ProviderRoute, ProviderRouter
+from utils import rate_limiter as rate_limiter_module
+from utils.rate_limiter import HybridRateLimiter, RateLimiter
+
+class BrokenCollection:
+    async def find_one(self, *args, **kwargs):
+        raise ConnectionError("Mongo is unreachable")
+
+class BrokenDatabase:
+    prompts_discover = BrokenCollection()
+
+async def failing_stream(input, system_prompt, model):
+    raise RuntimeError("Gemini is down")
+    yield
+
+async def backup_stream(input, system_prompt, model):
+    for text in ("Customized ", "prompt"):
+        yield text
+
+async def unused_completion(input, system_prompt, model):
+    raise AssertionError("streams do not use the completion route")
+
+@pytest.fixture
+async def client(serve_apis, redis_client, mongo_db, monkeypatch):
+    await mongo_db.prompts_discover.insert_one(
+        {"prompt_id": "p1", "original_prompt": "Write a poem", "is_public": True}
+    )
+    monkeypatch.setattr(rate_limiter_module, "rate_limiter", HybridRateLimiter(RateLimiter(redis_client)))
+    monkeypatch.setattr(serve_apis, "db", mongo_db)
+    # threshold above 1 turns the semantic (embedding) tier off
+    monkeypatch.setattr(serve_apis, "customization_cache", CustomizationCache(redis_client, None, threshold=2))
+    monkeypatch.setattr(serve_apis, "customization_router", ProviderRouter([
+        ProviderRoute("google", "gemini", unused_completion, failing_stream),
+        ProviderRoute("groq", "llama", unused_completion, backup_stream),
+    ]))
+
+    app = FastAPI()
+    app.include_router(serve_apis.router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+def parse_events(body: bytes):
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name.removeprefix("event: "), orjson.loads(data.removeprefix("data: "))))
+    return events
+
+async def test_stream_fails_over_and_caches_the_serving_provider(client, serve_apis):
+    body = {"prompt_id": "p1", "customization_message": "make it rhyme, please"}
+
+    response = await client.post("/api/prompts/customize/stream", json=body)
+
+    events = parse_events(response.content)
+    assert [data["text"] for name, data in events if name == "token"] == ["Customized ", "prompt"]
+    assert events[-1][0] == "done"
+    cached = await serve_apis.customization_cache.lookup(
+        "p1", "make it rhyme, please", serve_apis.settings.CUSTOMIZATION_MODEL, serve_apis.customization_prompt_version
+    )
+    assert cached["customized_prompt"] == "Customized prompt"
+    assert cached["served_by"] == "groq/llama"
+
+async def test_stream_for_unknown_prompt_is_a_404(client):
+    response = await client.post(
+        "/api/prompts/customize/stream", json={"prompt_id": "missing", "customization_message": "make it shorter"}
+    )
+    assert response.status_code == 404
+
+async def test_stream_lookup_failure_is_a_wrapped_500(client, serve_apis, monkeypatch):
+    monkeypatch.setattr(serve_apis, "db", BrokenDatabase())
+
+    response = await client.post(
+        "/api/prompts/customize/stream", json={"prompt_id": "p1", "customization_message": "make it shorter"}
+    )
+
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Failed to customize prompt"
@@ -0,0 +1,34 @@
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+from utils.db_indexes import bootstrap_indexes, canonical_queries, verify_query_plans
+
+class UnreachableCollection:
+    async def create_indexes(self, indexes):
+        raise ServerSelectionTimeoutError("localhost:27017: connection refused")
+
+class UnreachableDatabase:
+    def __init__(self):
+        self.prompts_discover = UnreachableCollection()
+        self.like_batches_applied = UnreachableCollection()
+        self.commands = 0
+
+    async def command(self, command):
+        self.commands += 1
+        raise ServerSelectionTimeoutError("localhost:27017: connection refused")
+
+async def test_unreachable_mongo_skips_plan_checks():
+    db = UnreachableDatabase()
+
+    await bootstrap_indexes(db, plan_check="log")
+
+    assert db.commands == 0
+
+async def test_unreachable_mongo_still_fails_a_strict_deploy():
+    with pytest.raises(ServerSelectionTimeoutError):
+        await bootstrap_indexes(UnreachableDatabase(), plan_check="fail")
+
+async def test_plan_check_stops_at_the_first_connection_failure():
+    db = UnreachableDatabase()
+
+    assert await verify_query_plans(db) == []
+    assert db.commands == 1 < len(canonical_queries("prompts_discover"))
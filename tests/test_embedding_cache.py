@@ -0,0 +1,66 @@
+import fakeredis
+import numpy as np
+import pytest
+from src.llm.embedding_cache import CachedEmbeddings
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.queries = []
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [len(text) / 3, 0.1, -0.7]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis()
+
+def test_queries_that_normalize_alike_share_an_entry():
+    client = CountingEmbeddings()
+    embeddings = CachedEmbeddings(client, "model")
+
+    first = embeddings.embed_query("Write a  Poem")
+    second = embeddings.embed_query("  write a poem\n")
+
+    assert first == second
+    assert client.queries == ["write a poem"]
+    assert embeddings.stats()["local_hits"] == 1
+    assert embeddings.stats()["misses"] == 1
+
+def test_redis_round_trip_is_float32(redis_client):
+    client = CountingEmbeddings()
+    vector = CachedEmbeddings(client, "model", redis_client).embed_query("write a poem")
+
+    # A fresh L1, as on another replica, reads the vector back from Redis
+    other = CachedEmbeddings(client, "model", redis_client)
+    restored = other.embed_query("Write a poem")
+
+    assert restored == vector
+    assert restored == np.asarray([4.0, 0.1, -0.7], dtype=np.float32).tolist()
+    assert len(client.queries) == 1
+    assert other.stats()["redis_hits"] == 1
+    packed = redis_client.get(other.cache_key("write a poem"))
+    assert len(packed) == 3 * np.dtype(np.float32).itemsize
+
+def test_least_recently_used_entry_is_evicted_from_l1():
+    client = CountingEmbeddings()
+    embeddings = CachedEmbeddings(client, "model", max_entries=2)
+
+    embeddings.embed_query("first")
+    embeddings.embed_query("second")
+    embeddings.embed_query("first")
+    embeddings.embed_query("third")
+    embeddings.embed_query("first")
+    embeddings.embed_query("second")
+
+    assert client.queries == ["first", "second", "third", "second"]
+    assert embeddings.stats() == {
+        "local_hits": 2,
+        "redis_hits": 0,
+        "misses": 4,
+        "hit_ratio": 2 / 6,
+        "local_size": 2
+    }
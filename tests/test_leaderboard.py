@@ -0,0 +1,87 @@
+import pytest
+from utils import leaderboard as leaderboard_module
+from utils.cache_codec import CacheCodec
+from utils.leaderboard import Leaderboard
+from utils.like_buffer import LikeBuffer
+from utils import like_buffer as like_buffer_module
+from utils.redis_cache import LocalCache, RedisCache
+
+@pytest.fixture
+async def buffer(redis_client, mongo_db, monkeypatch):
+    monkeypatch.setattr(like_buffer_module, "cache", RedisCache(redis_client, LocalCache(16), CacheCodec()))
+    buffer = LikeBuffer(redis_client, mongo_db.prompts_discover, mongo_db.like_batches_applied)
+    monkeypatch.setattr(leaderboard_module, "like_buffer", buffer)
+    return buffer
+
+@pytest.fixture
+async def board(redis_client, mongo_db, buffer):
+    await mongo_db.prompts_discover.insert_many([
+        {"prompt_id": "p1", "category": "Technical", "like_count": 5},
+        {"prompt_id": "p2", "category": "Technical", "like_count": 2},
+        {"prompt_id": "p3", "category": "Creative", "like_count": 0},
+    ])
+    return Leaderboard(redis_client, mongo_db.prompts_discover)
+
+async def like(board, buffer, prompt_id, category):
+    """
+    What the like endpoint does
+    """
+    await buffer.record(prompt_id)
+    await board.record_like(prompt_id, category)
+
+async def scores(board, category=None):
+    hits, _ = await board.page("likes", category, 0, 10)
+    return dict(hits)
+
+async def test_seed_counts_mongo_and_buffered_likes(board, buffer):
+    await buffer.record("p2", 3)
+
+    await board.seed()
+
+    assert await scores(board) == {"p1": 5, "p2": 5, "p3": 0}
+    assert await scores(board, "Creative") == {"p3": 0}
+    hits, _ = await board.page("trending", None, 0, 10)
+    assert {prompt_id for prompt_id, _ in hits} == {"p1", "p2"}
+
+async def test_likes_are_counted_before_seeding(board, buffer):
+    await like(board, buffer, "p3", "Creative")
+
+    await board.seed()
+
+    assert await scores(board) == {"p1": 5, "p2": 2, "p3": 1}
+
+async def test_likes_recorded_while_seeding_are_not_lost(board, buffer, monkeypatch):
+    read_pending = buffer.pending
+
+    async def pending_then_like(prompt_ids, included=None):
+        result = await read_pending(prompt_ids, included)
+        # After the snapshot, before the boards are swapped in
+        await like(board, buffer, "p1", "Technical")
+        await like(board, buffer, "p2", "Technical")
+        await like(board, buffer, "p3", "Creative")
+        return result
+
+    monkeypatch.setattr(buffer, "pending", pending_then_like)
+    await board.seed()
+
+    assert await scores(board) == {"p1": 6, "p2": 3, "p3": 1}
+    assert await scores(board, "Technical") == {"p1": 6, "p2": 3}
+    assert await scores(board, "Creative") == {"p3": 1}
+    hits, _ = await board.page("trending", "Creative", 0, 10)
+    assert [prompt_id for prompt_id, _ in hits] == ["p3"]
+
+    # Live again once seeded
+    await like(board, buffer, "p3", "Creative")
+    assert (await scores(board))["p3"] == 2
+
+async def test_prompt_published_while_seeding_keeps_its_place(board, buffer, monkeypatch):
+    read_pending = buffer.pending
+
+    async def pending_then_publish(prompt_ids, included=None):
+        await board.add_prompt({"prompt_id": "p4", "category": "Creative", "like_count": 0})
+        return await read_pending(prompt_ids, included)
+
+    monkeypatch.setattr(buffer, "pending", pending_then_publish)
+    await board.seed()
+
+    assert await scores(board, "Creative") == {"p3": 0, "p4": 0}
@@ -0,0 +1,54 @@
+import pytest
+from src.llm.lexical_index import BM25Index, reciprocal_rank_fusion
+
+DOCUMENTS = [
+    {"prompt_id": "sql", "name": "SQL Query Optimizer", "tags": ["sql", "database"],
+     "search_description": "Rewrite slow SQL queries for better performance"},
+    {"prompt_id": "resume", "name": "Resume Writer", "tags": ["career", "resume"],
+     "search_description": "Write a professional resume tailored to a job posting"},
+    {"prompt_id": "cover", "name": "Cover Letter Writer", "tags": ["career"],
+     "search_description": "Write a cover letter for a job application"},
+    {"prompt_id": "blog", "name": "Blog Post Generator", "tags": ["writing", "blog"],
+     "search_description": "Generate a long-form blog post about any topic"},
+    {"prompt_id": "python", "name": "Python Code Reviewer", "tags": ["python", "code"],
+     "search_description": "Review python code for bugs and style issues"},
+]
+
+@pytest.fixture
+def index():
+    return BM25Index(DOCUMENTS)
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([
+        [("a", 9.0), ("b", 5.0), ("c", 1.0)],
+        [("b", 0.9), ("d", 0.8)],
+    ], k=60)
+
+    assert [prompt_id for prompt_id, _ in fused] == ["b", "a", "d", "c"]
+    assert fused[0][1] == pytest.approx(1 / 62 + 1 / 61)
+
+def test_search_ranks_name_matches_first(index):
+    hits = index.search("code reviewer")
+    assert hits[0][0] == "python"
+
+def test_search_applies_category_and_tag_filters(index):
+    assert {prompt_id for prompt_id, _ in index.search("writer", tags=["career"])} == {"resume", "cover"}
+    assert index.search("writer", tags=["sql"]) == []
+
+@pytest.mark.parametrize("query", ["SQL Query Optimizer", "resume", "Career"])
+def test_exact_name_or_tag_is_navigational(index, query):
+    assert index.is_navigational(query, index.search(query), min_score=1.1)
+
+def test_strong_partial_match_is_navigational(index):
+    hits = index.search("python reviewer")
+    assert index.normalized_score("python reviewer", hits[0][1]) >= 0.6
+    assert index.is_navigational("python reviewer", hits, min_score=0.6)
+
+@pytest.mark.parametrize("query", ["help me write something for my job", "write", "sql query optimizer tool"])
+def test_weak_or_partial_match_is_not_navigational(index, query):
+    hits = index.search(query)
+    assert hits
+    assert not index.is_navigational(query, hits, min_score=0.6)
+
+def test_no_hits_is_not_navigational(index):
+    assert not index.is_navigational("kubernetes", index.search("kubernetes"))
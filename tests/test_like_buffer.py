@@ -0,0 +1,113 @@
+import pytest
+import redis
+from utils import like_buffer as like_buffer_module
+from utils.cache_codec import CacheCodec
+from utils.like_buffer import LikeBuffer
+from utils.redis_cache import LocalCache, RedisCache
+
+@pytest.fixture
+async def buffer(redis_client, mongo_db, monkeypatch):
+    monkeypatch.setattr(like_buffer_module, "cache", RedisCache(redis_client, LocalCache(16), CacheCodec()))
+    await mongo_db.prompts_discover.insert_many([
+        {"prompt_id": "p1", "category": "Technical", "like_count": 3},
+        {"prompt_id": "p2", "category": "Creative", "like_count": 0},
+    ])
+    await mongo_db.like_batches_applied.create_index([("batch_id", 1), ("prompt_id", 1)], unique=True)
+    return LikeBuffer(redis_client, mongo_db.prompts_discover, mongo_db.like_batches_applied, stale_batch_seconds=0)
+
+async def like_count(mongo_db, prompt_id):
+    document = await mongo_db.prompts_discover.find_one({"prompt_id": prompt_id})
+    return document["like_count"]
+
+async def test_flush_applies_pending_likes(buffer, mongo_db):
+    await buffer.record("p1")
+    await buffer.record("p1")
+    await buffer.record("p2")
+    assert await buffer.pending(["p1", "p2"]) == {"p1": 2, "p2": 1}
+
+    await buffer.flush()
+
+    assert await like_count(mongo_db, "p1") == 5
+    assert await like_count(mongo_db, "p2") == 1
+    assert await buffer.pending(["p1", "p2"]) == {}
+    document = await mongo_db.prompts_discover.find_one({"prompt_id": "p1"})
+    assert document["pending_like_batches"] == []
+
+async def test_batch_abandoned_after_mongo_update_is_applied_once(buffer, mongo_db):
+    await buffer.record("p1", 4)
+
+    # The replica dies after the $inc, before recording the batch as applied
+    applied_collection = buffer.applied_collection
+
+    class CrashingCollection:
+        def find(self, *args, **kwargs):
+            return applied_collection.find(*args, **kwargs)
+
+        async def bulk_write(self, *args, **kwargs):
+            raise RuntimeError("replica crashed")
+
+    buffer.applied_collection = CrashingCollection()
+    with pytest.raises(RuntimeError):
+        await buffer.flush()
+    buffer.applied_collection = applied_collection
+    assert await like_count(mongo_db, "p1") == 7
+
+    # Many newer batches for the same prompt do not push the abandoned one out
+    for i in range(30):
+        await buffer.record("p1")
+        batch_key = f"{buffer.key}:batch:fresh{i}"
+        await buffer.start_batch(keys=[buffer.key, batch_key, buffer.batches_key], args=[9999999999])
+        await buffer.apply_batch(batch_key)
+
+    # Recovery of the abandoned batch does not count it again
+    await buffer.flush()
+    assert await like_count(mongo_db, "p1") == 7 + 30
+    assert await buffer.redis_client.zcard(buffer.batches_key) == 0
+
+async def test_batch_abandoned_before_redis_delete_is_applied_once(buffer, mongo_db, monkeypatch):
+    await buffer.record("p2", 2)
+    pipeline = buffer.redis_client.pipeline
+
+    def broken_pipeline(*args, **kwargs):
+        raise redis.ConnectionError("connection lost")
+    monkeypatch.setattr(buffer.redis_client, "pipeline", broken_pipeline)
+    with pytest.raises(redis.ConnectionError):
+        await buffer.flush()
+    monkeypatch.setattr(buffer.redis_client, "pipeline", pipeline)
+    assert await like_count(mongo_db, "p2") == 2
+
+    await buffer.flush()
+    assert await like_count(mongo_db, "p2") == 2
+    assert await buffer.pending(["p2"]) == {}
+
+async def test_apply_pending_skips_batches_already_in_like_count(buffer, mongo_db):
+    await buffer.record("p1", 2)
+    batch_key = f"{buffer.key}:batch:inflight"
+    await buffer.start_batch(keys=[buffer.key, batch_key, buffer.batches_key], args=[0])
+    await buffer.record("p1", 1)
+
+    # Read while the batch is being applied: like_count already includes it
+    prompts = [{"prompt_id": "p1", "like_count": 5, "pending_like_batches": ["inflight"]}]
+    await buffer.apply_pending(prompts)
+    assert prompts == [{"prompt_id": "p1", "like_count": 6}]
+
+    # Read before the batch was applied: it is still pending
+    prompts = [{"prompt_id": "p1", "like_count": 3}]
+    await buffer.apply_pending(prompts)
+    assert prompts == [{"prompt_id": "p1", "like_count": 6}]
+
+async def test_pending_retries_when_a_batch_starts_after_reading_the_registry(buffer, redis_client, monkeypatch):
+    await buffer.record("p1", 2)
+    zrange = redis_client.zrange
+
+    async def zrange_then_start_batch(*args, **kwargs):
+        batch_keys = await zrange(*args, **kwargs)
+        monkeypatch.setattr(redis_client, "zrange", zrange)
+        # The flusher moves the pending hash aside before the script runs
+        batch_key = f"{buffer.key}:batch:racing"
+        await buffer.start_batch(keys=[buffer.key, batch_key, buffer.batches_key], args=[0])
+        return batch_keys
+
+    monkeypatch.setattr(redis_client, "zrange", zrange_then_start_batch)
+
+    assert await buffer.pending(["p1"]) == {"p1": 2}
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from src.llm.numpy_index import NumpyVectorIndex, write_snapshot
+
+CATEGORIES = ["Creative", "Technical", "Creative", "Utility", "Technical", "Creative"]
+TAGS = [["poetry"], ["python", "debugging"], ["poetry", "story"], [], ["python"], ["story"]]
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(7).normal(size=(len(CATEGORIES), 16)).astype(np.float32)
+
+@pytest.fixture
+def index(tmp_path, vectors):
+    manifest_path = str(tmp_path / "index" / "manifest.json")
+    write_snapshot(manifest_path, [f"p{i}" for i in range(len(vectors))], vectors, CATEGORIES, TAGS)
+    return NumpyVectorIndex(manifest_path, reload_interval=0)
+
+def brute_force(vectors, query, rows):
+    scores = {
+        f"p{row}": float(vectors[row] @ query / (np.linalg.norm(vectors[row]) * np.linalg.norm(query)))
+        for row in rows
+    }
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+def test_top_k_matches_brute_force_cosine(index, vectors):
+    query = np.random.default_rng(1).normal(size=16)
+
+    results = index.search(query, top_k=4)
+
+    expected = brute_force(vectors, query, range(len(vectors)))[:4]
+    assert [id for id, _ in results] == [id for id, _ in expected]
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected], abs=1e-5)
+
+def test_filters_mask_rows_before_ranking(index, vectors):
+    query = vectors[1]
+
+    by_category = index.search(query, top_k=10, category="Creative")
+    by_tags = index.search_with_filters(query, top_k=10, filters={"tags": {"$all": ["poetry", "story"]}})
+    both = index.search(query, top_k=10, category="Technical", tags=["python"])
+
+    assert {id for id, _ in by_category} == {"p0", "p2", "p5"}
+    assert [id for id, _ in by_tags] == ["p2"]
+    assert [id for id, _ in both] == [id for id, _ in brute_force(vectors, query, [1, 4])]
+    assert index.search(query, category="Lifestyle") == []
+    assert index.search(query, tags=["unknown"]) == []
+
+def test_k_larger_than_matches_returns_every_match(index, vectors):
+    query = vectors[0]
+
+    results = index.search(query, top_k=50, category="Technical")
+
+    assert [id for id, _ in results] == [id for id, _ in brute_force(vectors, query, [1, 4])]
+    assert len(index.search(query, top_k=50)) == len(vectors)
+
+def test_new_snapshot_is_picked_up_without_restart(index, vectors):
+    query = vectors[3]
+    first = index.search(query, top_k=1)
+    old_matrix = index.current().matrix
+
+    replacement = np.vstack([vectors, -vectors[3]])
+    write_snapshot(index.manifest_path, [f"n{i}" for i in range(len(replacement))], replacement,
+                   CATEGORIES + ["Utility"], TAGS + [["inverse"]])
+    second = index.search(query, top_k=len(replacement))
+
+    assert first[0][0] == "p3"
+    assert second[0][0] == "n3"
+    assert second[-1] == ("n6", pytest.approx(-1.0, abs=1e-5))
+    assert index.current().matrix.shape[0] == len(replacement)
+    # The swapped-out matrix stays mapped and readable for queries still using it
+    assert isinstance(index.current().matrix, np.memmap)
+    assert old_matrix.shape[0] == len(vectors)
+    assert float(np.asarray(old_matrix[3]) @ (query / np.linalg.norm(query))) == pytest.approx(1.0, abs=1e-5)
@@ -0,0 +1,96 @@
+from datetime import datetime, timezone
+import pytest
+from utils.pagination import (
+    RankedResultStore,
+    decode_cursor,
+    decode_seek_cursor,
+    encode_cursor,
+    encode_seek_cursor,
+    seek_filter,
+)
+
+def test_cursor_round_trip():
+    payload = {"k": "search:ranked:abc", "o": 18}
+    cursor = encode_cursor(payload)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == payload
+
+@pytest.mark.parametrize("cursor", ["not base64!", encode_cursor([1, 2])])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_seek_cursor_round_trip():
+    filters = {"category": "Technical"}
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = encode_seek_cursor("created_at", -1, filters, {"prompt_id": "p7", "created_at": created_at}, 3)
+
+    assert decode_seek_cursor(cursor, "created_at", -1, filters) == (created_at, "p7", 3)
+
+@pytest.mark.parametrize("sort_by, direction, filters", [
+    ("like_count", -1, {"category": "Technical"}),
+    ("created_at", -1, {}),
+    ("like_count", 1, {}),
+])
+def test_seek_cursor_is_bound_to_its_listing(sort_by, direction, filters):
+    cursor = encode_seek_cursor("like_count", -1, {}, {"prompt_id": "p1", "like_count": 3}, 2)
+    with pytest.raises(ValueError):
+        decode_seek_cursor(cursor, sort_by, direction, filters)
+
+DOCUMENTS = [
+    {"prompt_id": "a", "like_count": 3},
+    {"prompt_id": "b", "like_count": None},
+    {"prompt_id": "c", "like_count": 1},
+    {"prompt_id": "d"},
+    {"prompt_id": "e", "like_count": 3},
+    {"prompt_id": "f", "like_count": 0},
+    {"prompt_id": "g"},
+]
+
+async def walk(collection, direction, page_size):
+    """
+    Page through the collection with seek cursors, like the browse endpoint
+    """
+    seen = []
+    cursor = None
+    while True:
+        match = {}
+        if cursor:
+            last_value, last_prompt_id, _ = decode_seek_cursor(cursor, "like_count", direction, {})
+            match = seek_filter("like_count", direction, last_value, last_prompt_id)
+        page = await collection.aggregate([
+            {"$match": match},
+            {"$sort": {"like_count": direction, "prompt_id": direction}},
+            {"$limit": page_size},
+        ]).to_list(length=None)
+        seen.extend(document["prompt_id"] for document in page)
+        if len(page) < page_size:
+            return seen
+        cursor = encode_seek_cursor("like_count", direction, {}, page[-1], 0)
+
+@pytest.mark.parametrize("direction", [1, -1])
+@pytest.mark.parametrize("page_size", [1, 2, 3])
+async def test_seek_pages_cover_null_and_missing_values_once(mongo_db, direction, page_size):
+    await mongo_db.prompts_discover.insert_many([dict(document) for document in DOCUMENTS])
+    ordered = await mongo_db.prompts_discover.aggregate([
+        {"$sort": {"like_count": direction, "prompt_id": direction}}
+    ]).to_list(length=None)
+
+    assert await walk(mongo_db.prompts_discover, direction, page_size) == [
+        document["prompt_id"] for document in ordered
+    ]
+
+async def test_ranked_results_round_trip(redis_client):
+    store = RankedResultStore(redis_client, expire=60)
+    key = store.key_for("SQL  tuning", {"category": "Technical"}, "hybrid")
+    assert key == store.key_for("sql tuning", {"category": "Technical"}, "hybrid")
+
+    await store.save(key, [("p1", 0.9), ("p2", 0.5), ("p3", 0.25)])
+
+    assert await store.get_page(key, 1, 10) == ([("p2", 0.5), ("p3", 0.25)], 3)
+    assert await store.get_page(store.key_for("other", {}), 0, 10) is None
+
+async def test_empty_ranked_results_are_cached(redis_client):
+    store = RankedResultStore(redis_client, expire=60)
+    await store.save("search:ranked:empty", [])
+    assert await store.get_page("search:ranked:empty", 0, 10) == ([], 0)
@@ -0,0 +1,167 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from src.llm.provider_router import CircuitBreaker, ProviderRoute, ProviderRouter, RouteStats
+
+class FakeProvider:
+    def __init__(self, name, latency=0.0, fail=False):
+        self.name = name
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    async def complete(self, input, system_prompt, model):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise HTTPException(status_code=503, detail=f"{self.name} is down")
+        return f"{self.name}: {input}"
+
+def route(provider):
+    return ProviderRoute(provider.name, "model", provider.complete)
+
+async def test_fails_over_to_the_next_route():
+    primary, backup = FakeProvider("primary", fail=True), FakeProvider("backup")
+    router = ProviderRouter([route(primary), route(backup)])
+
+    content, served_by = await router.complete("hi")
+
+    assert content == "backup: hi"
+    assert served_by.provider == "backup"
+    assert router.stats["primary/model"].error_rate > 0
+
+async def test_all_routes_failing_is_a_503():
+    router = ProviderRouter([route(FakeProvider("a", fail=True)), route(FakeProvider("b", fail=True))])
+
+    with pytest.raises(HTTPException) as error:
+        await router.complete("hi")
+
+    assert error.value.status_code == 503
+    assert "b is down" in error.value.detail
+
+async def test_open_breaker_takes_the_route_out_of_rotation():
+    primary, backup = FakeProvider("primary", fail=True), FakeProvider("backup", latency=0.05)
+    router = ProviderRouter([route(primary), route(backup)], failure_threshold=2, reset_seconds=60)
+    # Fast enough to stay ranked first despite its errors
+    router.stats["primary/model"].record(0.001)
+
+    for _ in range(3):
+        await router.complete("hi")
+
+    assert router.breakers["primary/model"].state == "open"
+    assert primary.calls == 2
+    assert backup.calls == 3
+
+def test_half_open_breaker_lets_one_probe_through(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.llm.provider_router.time.monotonic", lambda: now[0])
+    breaker = CircuitBreaker("route", failure_threshold=1, reset_seconds=30)
+
+    breaker.record_failure()
+    assert not breaker.available()
+
+    now[0] += 30
+    assert breaker.state == "half_open"
+    breaker.begin()
+    assert not breaker.available()
+
+    # A failed probe opens it again; a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == "open"
+    now[0] += 30
+    breaker.begin()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+async def test_unmeasured_route_is_tried_once_measured_ones_are_slower_than_the_prior():
+    stats = RouteStats(prior_latency=2.0)
+    assert stats.score() == 2.0
+
+    slow, fresh = FakeProvider("slow"), FakeProvider("fresh")
+    router = ProviderRouter([route(slow), route(fresh)], prior_latency=2.0)
+    router.stats["slow/model"].record(5.0)
+
+    _, served_by = await router.complete("hi")
+
+    assert served_by.provider == "fresh"
+
+async def test_hedging_is_off_by_default():
+    slow, fast = FakeProvider("slow", latency=0.2), FakeProvider("fast")
+    router = ProviderRouter([route(slow), route(fast)], hedge_max_delay=0.01)
+
+    _, served_by = await router.complete("hi")
+
+    assert served_by.provider == "slow"
+    assert fast.calls == 0
+
+async def test_hedge_wins_and_cancels_the_slow_call():
+    slow, fast = FakeProvider("slow", latency=1.0), FakeProvider("fast")
+    router = ProviderRouter([route(slow), route(fast)], hedge=True, hedge_min_delay=0.01, hedge_max_delay=0.01)
+
+    _, served_by = await router.complete("hi")
+    await asyncio.sleep(0)
+
+    assert served_by.provider == "fast"
+    assert slow.cancelled == 1
+    # Losing a hedge says nothing about the provider's health
+    assert router.breakers["slow/model"].failures == 0
+
+class FakeStreamingProvider(FakeProvider):
+    def __init__(self, name, chunks=("a", "b"), fail_after=None):
+        super().__init__(name)
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.closed = False
+
+    async def stream(self, input, system_prompt, model):
+        self.calls += 1
+        try:
+            for index, chunk in enumerate(self.chunks):
+                if index == self.fail_after:
+                    raise HTTPException(status_code=503, detail=f"{self.name} is down")
+                yield chunk
+        finally:
+            self.closed = True
+
+def streaming_route(provider):
+    return ProviderRoute(provider.name, "model", provider.complete, provider.stream)
+
+async def test_stream_fails_over_until_a_route_starts():
+    down, backup = FakeStreamingProvider("down", fail_after=0), FakeStreamingProvider("backup")
+    router = ProviderRouter([streaming_route(down), streaming_route(backup)])
+
+    chunks, served_by = await router.stream("hi")
+
+    assert served_by.provider == "backup"
+    assert [text async for text in chunks] == ["a", "b"]
+    assert down.closed and backup.closed
+    assert router.breakers["down/model"].failures == 1
+
+async def test_stream_failure_after_the_first_chunk_is_not_retried():
+    flaky, backup = FakeStreamingProvider("flaky", fail_after=1), FakeStreamingProvider("backup")
+    router = ProviderRouter([streaming_route(flaky), streaming_route(backup)])
+
+    chunks, served_by = await router.stream("hi")
+    received = []
+    with pytest.raises(HTTPException):
+        async for text in chunks:
+            received.append(text)
+
+    assert served_by.provider == "flaky"
+    assert received == ["a"]
+    assert backup.calls == 0
+    assert router.breakers["flaky/model"].failures == 1
+
+async def test_routes_without_streaming_are_skipped():
+    plain, streaming = FakeProvider("plain"), FakeStreamingProvider("streaming")
+    router = ProviderRouter([route(plain), streaming_route(streaming)])
+
+    _, served_by = await router.stream("hi")
+
+    assert served_by.provider == "streaming"
+    assert plain.calls == 0
@@ -0,0 +1,91 @@
+import fakeredis
+import pytest
+from utils.rate_limiter import HybridRateLimiter, RateLimiter
+
+@pytest.fixture
+def limiter(redis_client):
+    return RateLimiter(redis_client)
+
+@pytest.mark.parametrize("algorithm", ["sliding_window", "token_bucket"])
+async def test_limit_is_enforced(limiter, algorithm):
+    results = [await limiter.check("1.2.3.4:/api", 3, 60, algorithm) for _ in range(4)]
+
+    assert [result.allowed for result in results] == [True, True, True, False]
+    assert [result.remaining for result in results[:3]] == [2, 1, 0]
+    rejected = results[-1]
+    assert 0 < rejected.retry_after <= 60
+    assert rejected.headers()["Retry-After"] == str(rejected.retry_after)
+    assert "Retry-After" not in results[0].headers()
+
+async def test_keys_and_algorithms_are_limited_separately(limiter):
+    for _ in range(2):
+        await limiter.check("a", 2, 60)
+
+    assert not (await limiter.check("a", 2, 60)).allowed
+    assert (await limiter.check("b", 2, 60)).allowed
+    assert (await limiter.check("a", 2, 60, "token_bucket")).allowed
+
+async def test_admitted_requests_count_against_the_limit(limiter):
+    synced = await limiter.check("a", 5, 60, cost=0, admitted=4)
+    assert synced.allowed and synced.remaining == 1
+
+    assert (await limiter.check("a", 5, 60)).allowed
+    assert not (await limiter.check("a", 5, 60)).allowed
+
+async def test_record_syncs_many_keys_in_one_pipeline(limiter):
+    results = await limiter.record([("a", 5, 60, "sliding_window", 3), ("b", 5, 60, "token_bucket", 5)])
+
+    assert [result.remaining for result in results] == [2, 0]
+    assert not (await limiter.check("b", 5, 60, "token_bucket")).allowed
+
+async def test_redis_outage_fails_open():
+    server = fakeredis.FakeServer()
+    server.connected = False
+    limiter = RateLimiter(fakeredis.FakeAsyncRedis(server=server))
+
+    assert await limiter.check("a", 1, 60) is None
+
+class CountingLimiter(RateLimiter):
+    def __init__(self, redis_client):
+        super().__init__(redis_client)
+        self.round_trips = 0
+
+    async def check(self, *args, **kwargs):
+        self.round_trips += 1
+        return await super().check(*args, **kwargs)
+
+async def test_hybrid_never_admits_more_than_the_limit_on_one_replica(redis_client):
+    limiter = CountingLimiter(redis_client)
+    hybrid = HybridRateLimiter(limiter, local_budget=2, sync_interval=60)
+
+    results = [await hybrid.check("a", 10, 60) for _ in range(20)]
+
+    assert sum(result.allowed for result in results) == 10
+    # Some checks were answered in process, and rejected keys stop costing round trips
+    assert limiter.round_trips < 10
+
+async def test_hybrid_sync_pushes_locally_admitted_requests(redis_client):
+    limiter = RateLimiter(redis_client)
+    hybrid = HybridRateLimiter(limiter, local_budget=3, sync_interval=60)
+    for _ in range(4):
+        assert (await hybrid.check("a", 10, 60)).allowed
+
+    await hybrid.sync()
+
+    # One exact check plus three local admissions, all recorded in Redis
+    assert (await limiter.check("a", 10, 60, cost=0)).remaining == 6
+    assert hybrid.quotas[("sliding_window", "a")].pending == 0
+
+async def test_hybrid_keeps_unsynced_counts_when_redis_is_down(redis_client):
+    hybrid = HybridRateLimiter(RateLimiter(redis_client), local_budget=3, sync_interval=60)
+    for _ in range(3):
+        await hybrid.check("a", 10, 60)
+    quota = hybrid.quotas[("sliding_window", "a")]
+    assert quota.pending == 2
+
+    server = fakeredis.FakeServer()
+    server.connected = False
+    hybrid.limiter = RateLimiter(fakeredis.FakeAsyncRedis(server=server))
+    await hybrid.sync()
+
+    assert quota.pending == 2
@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+from utils.cache_codec import CacheCodec
+from utils.redis_cache import LocalCache, RedisCache
+
+@pytest.fixture
+def cache(redis_client):
+    return RedisCache(redis_client, LocalCache(16), CacheCodec())
+
+async def test_invalidate_tags_deletes_tagged_entries(cache, redis_client):
+    await cache.store("cache:a", b'{"a": 1}', expire=60, tags=["prompt:p1", "category:*"])
+    await cache.store("cache:b", b'{"b": 1}', expire=60, tags=["prompt:p2"])
+
+    await cache.invalidate_tags("prompt:p1")
+
+    assert await cache.get("cache:a") is None
+    assert await cache.get("cache:b") == {"b": 1}
+    assert not await redis_client.exists("tag:prompt:p1")
+    assert await redis_client.sismember("tag:prompt:p2", "cache:b")
+
+async def test_invalidate_tags_drops_local_copies(cache):
+    await cache.store("cache:a", b'{"a": 1}', expire=60, local_ttl=30, tags=["prompt:p1"])
+    assert cache.local_cache.get("cache:a") == b'{"a": 1}'
+
+    await cache.invalidate_tags("prompt:p1")
+
+    assert cache.local_cache.get("cache:a") is None
+
+async def test_tag_set_lives_as_long_as_its_longest_entry(cache, redis_client):
+    await cache.store("cache:long", b"1", expire=600, tags=["prompt:p1"])
+    await cache.store("cache:short", b"2", expire=60, tags=["prompt:p1"])
+
+    assert await redis_client.ttl("tag:prompt:p1") > 60
+
+async def test_value_computed_across_an_invalidation_is_not_stored(cache):
+    computing = asyncio.Event()
+    invalidated = asyncio.Event()
+
+    async def load():
+        computing.set()
+        await invalidated.wait()
+        return {"like_count": 3}
+
+    task = asyncio.create_task(
+        cache.compute("cache:a", load, expire=60, local_ttl=30, tags=lambda response: ["prompt:p1"])
+    )
+    await computing.wait()
+    await cache.invalidate_tags("prompt:p1")
+    invalidated.set()
+
+    # The caller still gets its result, but it is not cached anywhere
+    assert await task == b'{"like_count":3}'
+    assert await cache.get("cache:a") is None
+    assert cache.local_cache.get("cache:a") is None
+
+async def test_invalidation_of_other_tags_does_not_block_store(cache):
+    async def load():
+        await cache.invalidate_tags("prompt:p2")
+        return {"like_count": 3}
+
+    await cache.compute("cache:a", load, expire=60, tags=lambda response: ["prompt:p1"])
+
+    assert await cache.get("cache:a") == {"like_count": 3}
@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from utils.request_coalescing import RequestCoalescer
+
+class Upstream:
+    def __init__(self, result, delay: float = 0.1, error: Exception = None):
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+@pytest.fixture
+def replicas(redis_client):
+    # Two coalescers on one Redis stand in for two replicas
+    return (RequestCoalescer(redis_client, poll_interval=0.01),
+            RequestCoalescer(redis_client, poll_interval=0.01))
+
+async def test_concurrent_identical_calls_execute_once(replicas):
+    coalescer, _ = replicas
+    upstream = Upstream({"matches": ["p1"]})
+
+    results = await asyncio.gather(*(coalescer.do("search", upstream, timeout=1) for _ in range(5)))
+
+    assert results == [{"matches": ["p1"]}] * 5
+    assert upstream.calls == 1
+    assert not coalescer.single_flight.in_flight("search")
+
+async def test_follower_replica_receives_the_leaders_result(replicas):
+    leader, follower = replicas
+    leader_upstream = Upstream({"matches": ["p1"]})
+    follower_upstream = Upstream({"matches": ["p2"]})
+
+    leader_task = asyncio.create_task(leader.do("search", leader_upstream, timeout=1, across_replicas=True))
+    await asyncio.sleep(0.01)
+    result = await follower.do("search", follower_upstream, timeout=1, across_replicas=True)
+
+    assert result == {"matches": ["p1"]}
+    assert await leader_task == {"matches": ["p1"]}
+    assert leader_upstream.calls == 1
+    assert follower_upstream.calls == 0
+
+async def test_follower_calls_upstream_when_the_leader_fails(replicas):
+    leader, follower = replicas
+    leader_upstream = Upstream(None, error=RuntimeError("Pinecone is down"))
+    follower_upstream = Upstream({"matches": ["p2"]})
+
+    leader_task = asyncio.create_task(leader.do("search", leader_upstream, timeout=1, across_replicas=True))
+    await asyncio.sleep(0.01)
+    result = await follower.do("search", follower_upstream, timeout=1, across_replicas=True)
+
+    assert result == {"matches": ["p2"]}
+    assert follower_upstream.calls == 1
+    with pytest.raises(RuntimeError):
+        await leader_task
+
+async def test_follower_calls_upstream_when_the_leader_times_out(replicas):
+    leader, follower = replicas
+    leader_upstream = Upstream({"matches": ["p1"]}, delay=1)
+    follower_upstream = Upstream({"matches": ["p2"]}, delay=0)
+
+    leader_task = asyncio.create_task(leader.do("search", leader_upstream, timeout=0.1, across_replicas=True))
+    await asyncio.sleep(0.01)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = await follower.do("search", follower_upstream, timeout=0.1, across_replicas=True)
+
+    # The leader's lock expires with the timeout, so the follower stops waiting on it
+    assert result == {"matches": ["p2"]}
+    assert loop.time() - started < 0.5
+    assert not leader_task.done()
+    leader_task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await leader_task
+
+async def test_cancelling_one_waiter_keeps_the_call_for_the_others(replicas):
+    coalescer, _ = replicas
+    upstream = Upstream({"matches": ["p1"]})
+
+    first = asyncio.create_task(coalescer.do("search", upstream, timeout=1, cancel_abandoned=True))
+    second = asyncio.create_task(coalescer.do("search", upstream, timeout=1, cancel_abandoned=True))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == {"matches": ["p1"]}
+    assert first.cancelled()
+    assert upstream.calls == 1
+    assert not upstream.cancelled
+
+async def test_call_is_cancelled_once_its_last_waiter_is(replicas):
+    coalescer, _ = replicas
+    upstream = Upstream({"matches": ["p1"]})
+
+    task = asyncio.create_task(coalescer.do("search", upstream, timeout=1, cancel_abandoned=True))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.sleep(0.01)
+
+    assert upstream.cancelled
+    assert not coalescer.single_flight.in_flight("search")
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta, timezone
+import httpx
+import pytest
+from fastapi import FastAPI
+from utils import redis_cache as redis_cache_module
+from utils.cache_codec import CacheCodec
+from utils.count_cache import CountCache
+from utils.leaderboard import Leaderboard
+from utils.like_buffer import LikeBuffer
+from utils.redis_cache import LocalCache, RedisCache
+
+PROMPT_COUNT = 120
+PAGE_SIZE = 9
+
+@pytest.fixture
+async def client(serve_apis, redis_client, mongo_db, monkeypatch):
+    started = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    await mongo_db.prompts_discover.insert_many([
+        {
+            "prompt_id": f"p{i:03d}",
+            "name": f"Prompt {i}",
+            "description": "",
+            "original_prompt": "",
+            "category": "Technical",
+            "tags": [],
+            "like_count": i % 7,
+            "created_at": started + timedelta(hours=i),
+            "is_public": True,
+        }
+        for i in range(PROMPT_COUNT)
+    ])
+    buffer = LikeBuffer(redis_client, mongo_db.prompts_discover, mongo_db.like_batches_applied)
+    board = Leaderboard(redis_client, mongo_db.prompts_discover)
+    monkeypatch.setattr(redis_cache_module, "cache", RedisCache(redis_client, LocalCache(64), CacheCodec()))
+    monkeypatch.setattr(serve_apis, "db", mongo_db)
+    monkeypatch.setattr(serve_apis, "prompt_counts", CountCache(redis_client, mongo_db.prompts_discover))
+    monkeypatch.setattr(serve_apis, "like_buffer", buffer)
+    monkeypatch.setattr(serve_apis, "leaderboard", board)
+
+    app = FastAPI()
+    app.include_router(serve_apis.router)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        client.leaderboard = board
+        yield client
+
+async def browse(client, **params):
+    response = await client.get("/api/prompts/search", params={"page_size": PAGE_SIZE, "sort_order": "desc", **params})
+    return response
+
+def newest_first(page):
+    start = PROMPT_COUNT - 1 - (page - 1) * PAGE_SIZE
+    return [f"p{i:03d}" for i in range(start, max(start - PAGE_SIZE, -1), -1)]
+
+async def test_pages_past_the_offset_cap_are_reached_by_cursor(client):
+    response = await browse(client, sort_by="created_at", page=1)
+    pages = {1: response.json()}
+    while pages[max(pages)]["next_cursor"]:
+        page = max(pages)
+        response = await browse(client, sort_by="created_at", page=page + 1, cursor=pages[page]["next_cursor"])
+        assert response.status_code == 200
+        pages[page + 1] = response.json()
+
+    assert max(pages) == 14
+    for page in (10, 11, 12, 14):
+        assert pages[page]["current_page"] == page
+        assert [prompt["prompt_id"] for prompt in pages[page]["items"]] == newest_first(page)
+    assert pages[14]["has_next"] is False
+
+async def test_deep_page_without_cursor_is_rejected_with_a_clear_error(client):
+    assert (await browse(client, sort_by="created_at", page=10)).status_code == 200
+
+    response = await browse(client, sort_by="created_at", page=11)
+
+    assert response.status_code == 400
+    assert "next_cursor" in response.json()["detail"]
+
+async def test_like_ordered_pages_past_the_cap_come_from_the_leaderboard(client):
+    await client.leaderboard.seed()
+
+    response = await browse(client, sort_by="like_count", category="Technical", page=12)
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["current_page"] == 12
+    likes = [prompt["like_count"] for prompt in result["items"]]
+    assert likes == sorted(likes, reverse=True)
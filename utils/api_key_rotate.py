@@ -1,45 +1,132 @@
-from time import sleep
-from datetime import datetime, timedelta
+import asyncio
+import hashlib
+import time
 import random
-from typing import List
+from typing import List, Optional
+import redis
 from utils.app_logger import setup_logger
 
 logger = setup_logger("utils/api_key_rotate.py")
-class APIKeyManager:
-    def __init__(self, api_keys: List[str], rate_limit: int = 10, cooldown_period: int = 60):
-        self.api_keys = api_keys
-        self.current_key_index = 0
-        self.request_counts = {key: 0 for key in api_keys}
-        self.last_request_time = {key: datetime.now() for key in api_keys}
+
+# Take one token from the first usable key, scanning from ARGV[3]. Each key is
+# a token bucket (ARGV[1] requests per ARGV[2] ms) that can be quarantined
+# after a 429. Returns {index, 0}, or {-1, ms until some key is usable}.
+ACQUIRE_KEY_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local rate = capacity / window
+local start = tonumber(ARGV[3])
+local wait = -1
+for j = 0, #KEYS - 1 do
+    local i = (start + j) % #KEYS + 1
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'ts', 'quarantined_until')
+    local tokens = tonumber(state[1]) or capacity
+    local last = tonumber(state[2]) or now_ms
+    local quarantined_until = tonumber(state[3]) or 0
+    tokens = math.min(capacity, tokens + math.max(0, now_ms - last) * rate)
+    local key_wait
+    if quarantined_until > now_ms then
+        key_wait = quarantined_until - now_ms
+    elseif tokens >= 1 then
+        redis.call('HSET', KEYS[i], 'tokens', tostring(tokens - 1), 'ts', now_ms)
+        redis.call('PEXPIRE', KEYS[i], math.max(window, quarantined_until - now_ms) * 2)
+        return {i - 1, 0}
+    else
+        key_wait = math.ceil((1 - tokens) / rate)
+    end
+    if wait < 0 or key_wait < wait then
+        wait = key_wait
+    end
+end
+return {-1, wait}
+"""
+
+QUARANTINE_KEY_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local quarantine_end = now_ms + tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'quarantined_until')) or 0
+if quarantine_end > current then
+    redis.call('HSET', KEYS[1], 'quarantined_until', quarantine_end)
+end
+redis.call('PEXPIRE', KEYS[1], math.max(tonumber(ARGV[1]), tonumber(ARGV[2])) * 2)
+return 1
+"""
+
+class NoAvailableKeyError(Exception):
+    """
+    Every key in the pool stayed rate limited or quarantined for the whole acquire timeout
+    """
+
+class RedisKeyPool:
+    """
+    API key pool shared by every replica through Redis.
+
+    Each key has a token bucket of rate_limit requests per window_seconds, and
+    is quarantined when the provider answers 429 (for its Retry-After, or
+    quarantine_seconds). acquire() takes a token atomically and, when every key
+    is exhausted, sleeps asynchronously until the earliest one is usable.
+    Only hashes of the keys are stored in Redis.
+    """
+
+    def __init__(self, redis_client, name: str, api_keys: List[str], rate_limit: int = 10,
+                 window_seconds: int = 60, quarantine_seconds: float = 60.0):
+        self.redis_client = redis_client
+        self.api_keys = [key for key in api_keys if key]
         self.rate_limit = rate_limit
-        self.cooldown_period = cooldown_period
+        self.window_seconds = window_seconds
+        self.quarantine_seconds = quarantine_seconds
+        self.state_keys = [
+            f"keypool:{name}:{hashlib.sha256(key.encode()).hexdigest()[:16]}"
+            for key in self.api_keys
+        ]
+        self.fallback_index = 0
+        self.acquire_script = self.redis_client.register_script(ACQUIRE_KEY_SCRIPT)
+        self.quarantine_script = self.redis_client.register_script(QUARANTINE_KEY_SCRIPT)
+
+    def __len__(self) -> int:
+        return len(self.api_keys)
 
-    def get_next_available_key(self) -> str:
-        start_index = self.current_key_index
-        
+    async def acquire(self, timeout: float = 10.0) -> str:
+        if not self.api_keys:
+            raise NoAvailableKeyError("No API keys configured")
+        deadline = time.monotonic() + timeout
         while True:
-            current_key = self.api_keys[self.current_key_index]
-            current_time = datetime.now()
-            
-            # Check if current key has cooled down
-            time_diff = (current_time - self.last_request_time[current_key]).total_seconds()
-            
-            if time_diff >= self.cooldown_period:
-                # Reset counter if cooldown period has passed
-                self.request_counts[current_key] = 0
-                
-            if self.request_counts[current_key] < self.rate_limit:
-                # Key is available
-                return current_key
-            
-            # Move to next key
-            self.current_key_index = (self.current_key_index + 1) % len(self.api_keys)
-            
-            # If we've checked all keys and none are available, wait
-            if self.current_key_index == start_index:
-                sleep(10)
-                
-    def use_key(self, key: str):
-        self.request_counts[key] += 1
-        logger.info(f"Key has been used {self.request_counts[key]} times")
-        self.last_request_time[key] = datetime.now()
\ No newline at end of file
+            try:
+                index, wait_ms = await self.acquire_script(
+                    keys=self.state_keys,
+                    args=[self.rate_limit, self.window_seconds * 1000, random.randrange(len(self.api_keys))]
+                )
+            except redis.RedisError as e:
+                # Without Redis, rotate locally and let the provider enforce quotas
+                logger.error(f"Redis error acquiring API key: {e}")
+                self.fallback_index = (self.fallback_index + 1) % len(self.api_keys)
+                return self.api_keys[self.fallback_index]
+
+            if index >= 0:
+                return self.api_keys[index]
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise NoAvailableKeyError("All API keys are rate limited")
+            logger.info(f"All API keys busy, waiting {wait_ms} ms")
+            await asyncio.sleep(min(wait_ms / 1000, remaining))
+
+    async def quarantine(self, api_key: str, seconds: Optional[float] = None) -> None:
+        """
+        Take api_key out of rotation, e.g. after a 429 with Retry-After: seconds
+        """
+        if api_key not in self.api_keys:
+            return
+        seconds = seconds if seconds is not None else self.quarantine_seconds
+        state_key = self.state_keys[self.api_keys.index(api_key)]
+        logger.warning(f"Quarantining API key {state_key} for {seconds} seconds")
+        try:
+            await self.quarantine_script(
+                keys=[state_key],
+                args=[int(seconds * 1000), self.window_seconds * 1000]
+            )
+        except redis.RedisError as e:
+            logger.error(f"Redis error quarantining API key: {e}")
@@ -0,0 +1,40 @@
+from typing import Any
+import lz4.frame
+import orjson
+
+class CacheCodec:
+    """
+    Serializes cached values as orjson bytes, framed with a one-byte header.
+
+    Payloads above compress_threshold bytes are lz4-compressed. unpack()
+    returns plain JSON bytes, which can be written to an HTTP response as-is.
+    Entries written before the header existed (plain JSON text) are still read.
+    """
+
+    PLAIN = b"\x00"
+    LZ4 = b"\x01"
+
+    def __init__(self, compress_threshold: int = 1024):
+        self.compress_threshold = compress_threshold
+
+    @staticmethod
+    def dumps(value: Any) -> bytes:
+        # orjson handles datetimes (ISO 8601) and str enums natively
+        return orjson.dumps(value)
+
+    @staticmethod
+    def loads(payload: bytes) -> Any:
+        return orjson.loads(payload)
+
+    def pack(self, payload: bytes) -> bytes:
+        if len(payload) > self.compress_threshold:
+            return self.LZ4 + lz4.frame.compress(payload)
+        return self.PLAIN + payload
+
+    def unpack(self, blob: bytes) -> bytes:
+        header, body = blob[:1], blob[1:]
+        if header == self.PLAIN:
+            return body
+        if header == self.LZ4:
+            return lz4.frame.decompress(body)
+        return blob
@@ -0,0 +1,54 @@
+from typing import Any, Dict, List, Optional
+
+# Dependency tags for cached responses. A cached entry is registered under
+# every tag it depends on, and write paths invalidate tags instead of keys.
+
+CATEGORIES_TAG = "categories"
+
+def prompt_tag(prompt_id: str) -> str:
+    """
+    Entries that show this prompt's fields (the prompt page, listing pages containing it)
+    """
+    return f"prompt:{prompt_id}"
+
+def category_tag(category: Optional[str]) -> str:
+    """
+    Listing pages filtered to category, or "*" for unfiltered listings
+    """
+    if category is None:
+        return "category:*"
+    return f"category:{getattr(category, 'value', category)}"
+
+def browse_tag(sort_by: str, category: Optional[str]) -> str:
+    """
+    Browse pages whose order depends on sort_by, filtered to category or unfiltered
+    """
+    if category is None:
+        return f"browse:{sort_by}:*"
+    return f"browse:{sort_by}:{getattr(category, 'value', category)}"
+
+def author_tag(author_id: str) -> str:
+    return f"author:{author_id}"
+
+def prompt_inserted_tags(document: Dict[str, Any]) -> List[str]:
+    """
+    Tags to invalidate when document is added to (or removed from) prompts_discover
+    """
+    category = document.get("category")
+    return [
+        prompt_tag(document["prompt_id"]),
+        category_tag(category),
+        category_tag(None),
+        author_tag(document.get("author_id")),
+        CATEGORIES_TAG
+    ]
+
+def prompt_liked_tags(prompt_id: str, category: Optional[str]) -> List[str]:
+    """
+    Tags to invalidate when a prompt's like_count changes
+    """
+    return [
+        prompt_tag(prompt_id),
+        browse_tag("like_count", category),
+        browse_tag("like_count", None)
+    ]
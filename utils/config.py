@@ -23,6 +23,67 @@ class Settings(BaseSettings):
     
     API_BASE_URL: Optional[str] = os.getenv("API_BASE_URL")
     
+    # Redis
+    REDIS_MAX_CONNECTIONS: int = 64
+    REDIS_POOL_TIMEOUT_SECONDS: float = 2.0  # wait for a free pooled connection
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = 5.0
+    LOCAL_CACHE_MAX_ENTRIES: int = 1024
+    CACHE_LOCK_TIMEOUT_SECONDS: float = 10.0
+    CACHE_COMPRESS_THRESHOLD_BYTES: int = 1024
+    COALESCE_ACROSS_REPLICAS: bool = True
+    COALESCE_RESULT_TTL_SECONDS: int = 5
+    RATE_LIMIT_LOCAL_BUDGET: int = 2
+    RATE_LIMIT_SYNC_INTERVAL_SECONDS: float = 0.25
+    LIKE_FLUSH_INTERVAL_SECONDS: float = 5.0
+    LIKE_FLUSH_MAX_PENDING: int = 500
+    LIKE_APPLIED_BATCH_TTL_SECONDS: int = 7 * 24 * 3600  # must exceed LIKE_STALE_BATCH_SECONDS
+    LIKE_STALE_BATCH_SECONDS: float = 60.0
+    TRENDING_HALF_LIFE_SECONDS: float = 24 * 3600
+
+    # LLM providers
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    GEMINI_MAX_CONCURRENCY: int = 32
+    GROQ_MAX_CONCURRENCY: int = 16
+    MISTRAL_MAX_CONCURRENCY: int = 16
+    GEMINI_KEY_RATE_LIMIT: int = 10  # requests per key per window
+    GEMINI_KEY_WINDOW_SECONDS: int = 60
+    GEMINI_KEY_QUARANTINE_SECONDS: float = 60.0  # after a 429 without Retry-After
+    GEMINI_KEY_ACQUIRE_TIMEOUT_SECONDS: float = 10.0
+    LLM_LATENCY_EWMA_ALPHA: float = 0.2
+    LLM_ROUTE_PRIOR_LATENCY_SECONDS: float = 2.0  # assumed latency of a route until it has samples
+    LLM_HEDGE_ENABLED: bool = False  # a hedged request can be billed by two providers
+    LLM_HEDGE_MIN_DELAY_SECONDS: float = 0.5
+    LLM_HEDGE_MAX_DELAY_SECONDS: float = 5.0  # also the delay before a route has latency samples
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+    CUSTOMIZATION_MODEL: str = "gemini-2.0-flash-exp"
+    CUSTOMIZATION_GROQ_MODEL: str = "llama-3.3-70b-versatile"
+    CUSTOMIZATION_MISTRAL_MODEL: str = "mistral-large-latest"
+    CUSTOMIZATION_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    CUSTOMIZATION_SEMANTIC_THRESHOLD: float = 0.97  # cosine similarity; above 1 disables the semantic tier
+    CUSTOMIZATION_SEMANTIC_MAX_ENTRIES: int = 32
+    
+    # Vector retrieval
+    RETRIEVAL_BACKEND: str = "pinecone"  # "pinecone" or "numpy"
+    NUMPY_INDEX_PATH: str = "data/vector_index/manifest.json"
+    NUMPY_INDEX_RELOAD_SECONDS: float = 5.0
+    RETRIEVAL_MAX_WORKERS: int = 8
+    RETRIEVAL_TIMEOUT_SECONDS: float = 10.0
+    SEARCH_MAX_RESULTS: int = 200
+    SEARCH_DEFAULT_MODE: str = "vector"  # "vector", "hybrid" or "lexical"
+    SEARCH_NAVIGATIONAL_MIN_SCORE: float = 0.6  # fraction of the best possible BM25 score; above 1 always fuses
+    LEXICAL_INDEX_REFRESH_SECONDS: float = 600.0
+    SEARCH_CURSOR_TTL_SECONDS: int = 600
+    BROWSE_MAX_OFFSET_PAGES: int = 10  # deeper browse pages need a seek cursor
+    EMBEDDING_CACHE_SIZE: int = 2048
+    EMBEDDING_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    
+    # Startup checks
+    MONGO_PLAN_CHECK: str = "log"  # "off", "log" or "fail"
     
     class Config:
         env_file = ".env"
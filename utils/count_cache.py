@@ -0,0 +1,111 @@
+from typing import Any, Dict, List, Optional, Tuple
+import orjson
+import redis
+from utils.app_logger import setup_logger
+
+logger = setup_logger("utils/count_cache.py")
+
+# Only adjust counts that are already cached; a missing field is filled by the
+# next count() so it never starts from a partial increment
+ADJUST_COUNTS_SCRIPT = """
+for i = 2, #ARGV do
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[1])
+    end
+end
+return 1
+"""
+
+# Cache a fresh count unless one was stored meanwhile, and start the hash's
+# expiry clock if it has none (EXPIRE NX without needing Redis 7)
+STORE_COUNT_SCRIPT = """
+redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2])
+if redis.call('TTL', KEYS[1]) == -1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+class CountCache:
+    """
+    Per-filter document counts for a collection, kept in one Redis hash.
+
+    Each field is a (category, tag set) combination that has been counted
+    before. Writers keep the fields current with record_insert/record_remove,
+    and the hash expires periodically so any drift is corrected by a recount.
+    """
+
+    def __init__(self, redis_client, collection, key: str = "counts:prompts_discover", expire: int = 3600):
+        self.redis_client = redis_client
+        self.collection = collection
+        self.key = key
+        self.expire = expire
+        self.adjust_counts = self.redis_client.register_script(ADJUST_COUNTS_SCRIPT)
+        self.store_count = self.redis_client.register_script(STORE_COUNT_SCRIPT)
+
+    @staticmethod
+    def filter_parts(filters: Dict[str, Any]) -> Tuple[Optional[str], List[str]]:
+        category = filters.get("category")
+        if category is not None:
+            category = getattr(category, "value", category)
+        tags = filters.get("tags") or []
+        if isinstance(tags, dict):
+            tags = tags.get("$all", [])
+        elif isinstance(tags, str):
+            tags = [tags]
+        return category, sorted(set(tags))
+
+    @staticmethod
+    def field_for(category: Optional[str], tags: List[str]) -> str:
+        return orjson.dumps([category, tags]).decode()
+
+    @staticmethod
+    def parse_field(field: str) -> Tuple[Optional[str], List[str]]:
+        category, tags = orjson.loads(field)
+        return category, tags
+
+    async def count(self, filters: Dict[str, Any]) -> int:
+        if not filters:
+            return await self.collection.estimated_document_count()
+
+        field = self.field_for(*self.filter_parts(filters))
+        try:
+            cached = await self.redis_client.hget(self.key, field)
+            if cached is not None:
+                return int(cached)
+        except redis.RedisError as e:
+            logger.error(f"Redis error reading count for {field}: {e}")
+
+        total = await self.collection.count_documents(filters)
+        try:
+            await self.store_count(keys=[self.key], args=[field, total, self.expire])
+        except redis.RedisError as e:
+            logger.error(f"Redis error caching count for {field}: {e}")
+        return total
+
+    async def record_change(self, document: Dict[str, Any], delta: int) -> None:
+        """
+        Adjust every cached count whose filter matches document by delta
+        """
+        try:
+            fields = await self.redis_client.hkeys(self.key)
+            category = document.get("category")
+            tags = set(document.get("tags") or [])
+            matching = []
+            for field in fields:
+                field_category, field_tags = self.parse_field(field)
+                if field_category not in (None, category):
+                    continue
+                if not tags.issuperset(field_tags):
+                    continue
+                matching.append(field)
+            if matching:
+                await self.adjust_counts(keys=[self.key], args=[delta, *matching])
+        except redis.RedisError as e:
+            logger.error(f"Redis error updating counts: {e}")
+
+    async def record_insert(self, document: Dict[str, Any]) -> None:
+        await self.record_change(document, 1)
+
+    async def record_remove(self, document: Dict[str, Any]) -> None:
+        await self.record_change(document, -1)
@@ -0,0 +1,136 @@
+from typing import Any, Dict, List, Tuple
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import ConnectionFailure
+from utils.app_logger import setup_logger
+from utils.config import settings
+
+logger = setup_logger("utils/db_indexes.py")
+
+# Every browse sort is paired with prompt_id as a tie-breaker (keyset
+# pagination), with and without a leading category filter. Compound indexes
+# can be walked backwards, so one direction covers both sort orders.
+PROMPTS_DISCOVER_INDEXES = [
+    IndexModel([("prompt_id", ASCENDING)], unique=True),
+    IndexModel([("author_id", ASCENDING)]),
+    IndexModel([("like_count", DESCENDING), ("prompt_id", DESCENDING)]),
+    IndexModel([("created_at", DESCENDING), ("prompt_id", DESCENDING)]),
+    IndexModel([("name", ASCENDING), ("prompt_id", ASCENDING)]),
+    IndexModel([("category", ASCENDING), ("like_count", DESCENDING), ("prompt_id", DESCENDING)]),
+    IndexModel([("category", ASCENDING), ("created_at", DESCENDING), ("prompt_id", DESCENDING)]),
+    IndexModel([("category", ASCENDING), ("name", ASCENDING), ("prompt_id", ASCENDING)]),
+    IndexModel([("tags", ASCENDING), ("like_count", DESCENDING), ("prompt_id", DESCENDING)]),
+]
+
+# One marker per (like batch, prompt) applied by the like flusher, kept well
+# past the window in which an abandoned batch can be recovered
+LIKE_BATCHES_APPLIED_INDEXES = [
+    IndexModel([("batch_id", ASCENDING), ("prompt_id", ASCENDING)], unique=True),
+    IndexModel([("applied_at", ASCENDING)], expireAfterSeconds=settings.LIKE_APPLIED_BATCH_TTL_SECONDS),
+]
+
+def canonical_queries(collection_name: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    The query shapes the API runs against prompts_discover, as explainable commands
+    """
+    sample_id = "00000000-0000-0000-0000-000000000000"
+    queries = [
+        ("get_prompt", {"find": collection_name, "filter": {"prompt_id": sample_id}, "limit": 1}),
+        ("customize_prompt", {"find": collection_name, "filter": {"prompt_id": sample_id, "is_public": True}, "limit": 1}),
+        ("get_prompts_by_author", {"find": collection_name, "filter": {"author_id": "harsh90731"}}),
+        ("get_categories", {"distinct": collection_name, "key": "category"}),
+        ("like_prompt", {"find": collection_name, "filter": {"prompt_id": sample_id}, "projection": {"category": 1}, "limit": 1}),
+        ("flush_likes", {
+            "update": collection_name,
+            "updates": [{
+                "q": {"prompt_id": sample_id, "pending_like_batches": {"$ne": "batch"}},
+                "u": {"$inc": {"like_count": 1}, "$push": {"pending_like_batches": "batch"}}
+            }]
+        }),
+        ("count_by_category", {"count": collection_name, "query": {"category": "Technical"}}),
+    ]
+    for sort_by in ("like_count", "created_at", "name"):
+        sort = {sort_by: -1, "prompt_id": -1}
+        queries.append((f"browse_by_{sort_by}", {"find": collection_name, "filter": {}, "sort": sort, "limit": 9}))
+        queries.append((f"browse_category_by_{sort_by}", {
+            "find": collection_name, "filter": {"category": "Technical"}, "sort": sort, "limit": 9
+        }))
+    queries.append(("browse_tags_by_like_count", {
+        "find": collection_name,
+        "filter": {"tags": {"$all": ["python"]}},
+        "sort": {"like_count": -1, "prompt_id": -1},
+        "limit": 9
+    }))
+    return queries
+
+def find_stages(plan: Any) -> List[str]:
+    """
+    Every stage name in an explain plan tree
+    """
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(find_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            stages.extend(find_stages(value))
+    return stages
+
+async def ensure_indexes(db) -> List[str]:
+    """
+    Create the prompts_discover and like_batches_applied indexes; a no-op for indexes that already exist
+    """
+    names = await db.prompts_discover.create_indexes(PROMPTS_DISCOVER_INDEXES)
+    logger.info(f"Ensured prompts_discover indexes: {', '.join(names)}")
+    names += await db.like_batches_applied.create_indexes(LIKE_BATCHES_APPLIED_INDEXES)
+    return names
+
+async def verify_query_plans(db) -> List[str]:
+    """
+    Explain each canonical query and return the names of those that fall back to a COLLSCAN
+    """
+    collection_scans = []
+    for name, command in canonical_queries("prompts_discover"):
+        try:
+            explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        except ConnectionFailure as e:
+            # Each remaining explain would wait out its own server selection timeout
+            logger.error(f"Stopped checking query plans, Mongo is unreachable: {str(e)}")
+            break
+        except Exception as e:
+            logger.error(f"Could not explain query {name}: {str(e)}")
+            continue
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in find_stages(winning_plan):
+            collection_scans.append(name)
+            logger.warning(f"Query {name} falls back to a COLLSCAN: {winning_plan}")
+    return collection_scans
+
+async def bootstrap_indexes(db, plan_check: str = "log") -> None:
+    """
+    Create indexes and check query plans at startup.
+
+    plan_check is "off", "log" (warn about COLLSCANs) or "fail" (raise, so the
+    deploy stops instead of the regression showing up under load).
+    """
+    try:
+        await ensure_indexes(db)
+    except ConnectionFailure as e:
+        # Checking plans would stall startup on one server selection timeout per query
+        logger.error(f"Skipping index bootstrap, Mongo is unreachable: {str(e)}")
+        if plan_check == "fail":
+            raise
+        return
+    except Exception as e:
+        # e.g. an existing index with the same keys but different options
+        logger.error(f"Error creating prompts_discover indexes: {str(e)}")
+        if plan_check == "fail":
+            raise
+    if plan_check == "off":
+        return
+    collection_scans = await verify_query_plans(db)
+    if collection_scans and plan_check == "fail":
+        raise RuntimeError(f"Queries fall back to a COLLSCAN: {', '.join(collection_scans)}")
+    if not collection_scans:
+        logger.info("All canonical prompts_discover queries use an index")
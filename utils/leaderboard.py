@@ -0,0 +1,236 @@
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from uuid import uuid4
+import redis
+from utils.app_logger import setup_logger
+from utils.config import get_async_database, settings
+from utils.like_buffer import like_buffer
+from utils.redis_client import async_redis_client
+
+logger = setup_logger("utils/leaderboard.py")
+
+# Like counts only move in leaderboards that have been seeded, so a missing
+# key always means "not seeded yet" rather than "partial". While a seed holds
+# the lock (KEYS[10]), likes for a missing leaderboard go to its delta key
+# (KEYS[6..9]) instead, and the seed merges them in when it swaps the board in.
+# Trending scores use forward decay: a like at time t adds
+# 2^((t - epoch) / half_life), and the set is rescaled (with its epoch moved
+# to now) before the weights get large.
+RECORD_LIKE_SCRIPT = """
+local now = tonumber(ARGV[3])
+local half_life = tonumber(ARGV[4])
+local seeding = redis.call('EXISTS', KEYS[10]) == 1
+for i = 1, 2 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('ZINCRBY', KEYS[i], ARGV[2], ARGV[1])
+    elseif seeding then
+        redis.call('ZINCRBY', KEYS[i + 5], ARGV[2], ARGV[1])
+    end
+end
+for i = 3, 4 do
+    local epoch = tonumber(redis.call('HGET', KEYS[5], KEYS[i]))
+    if epoch == nil then
+        epoch = now
+        redis.call('HSET', KEYS[5], KEYS[i], now)
+    end
+    local exponent = (now - epoch) / half_life
+    if exponent > 32 then
+        redis.call('ZUNIONSTORE', KEYS[i], 1, KEYS[i], 'WEIGHTS', math.pow(2, -exponent))
+        redis.call('HSET', KEYS[5], KEYS[i], now)
+        exponent = 0
+    end
+    local target = KEYS[i]
+    if seeding and redis.call('EXISTS', KEYS[i]) == 0 then
+        target = KEYS[i + 5]
+    end
+    redis.call('ZINCRBY', target, tonumber(ARGV[2]) * math.pow(2, exponent), ARGV[1])
+end
+return 1
+"""
+
+# Swap a seeded leaderboard in: the seed (KEYS[2]) plus the likes recorded
+# while it ran (KEYS[3]), merged with whatever was added to the live board
+# meanwhile (KEYS[1], e.g. newly published prompts). For trending boards
+# (ARGV[1] is the seed's epoch), the delta is rescaled from the epoch
+# record_like weighted it with to the seed's.
+FINISH_SEED_SCRIPT = """
+local weight = 1
+if ARGV[1] ~= '' then
+    local epoch = tonumber(redis.call('HGET', KEYS[4], KEYS[1]))
+    if epoch ~= nil then
+        weight = math.pow(2, (epoch - tonumber(ARGV[1])) / tonumber(ARGV[2]))
+    end
+    redis.call('HSET', KEYS[4], KEYS[1], ARGV[1])
+end
+redis.call('ZUNIONSTORE', KEYS[2], 2, KEYS[2], KEYS[3], 'WEIGHTS', 1, weight)
+redis.call('ZUNIONSTORE', KEYS[1], 2, KEYS[2], KEYS[1], 'AGGREGATE', 'MAX')
+redis.call('DEL', KEYS[2], KEYS[3])
+return 1
+"""
+
+class Leaderboard:
+    """
+    Like-count and trending rankings of prompts in Redis sorted sets, one
+    global and one per category.
+
+    Like leaderboards are seeded from Mongo (plus buffered likes) and then kept
+    current on every like, so top-N and like-ordered pages are a ZRANGE away.
+    Ties are ordered by prompt_id in the same direction, like the Mongo sort.
+    """
+
+    def __init__(self, redis_client, collection, prefix: str = "leaderboard", half_life: float = 86400.0):
+        self.redis_client = redis_client
+        self.collection = collection
+        self.prefix = prefix
+        self.half_life = half_life
+        self.epochs_key = f"{prefix}:trending:epochs"
+        self.seed_lock_key = f"{prefix}:seeding"
+        self.record_like_script = self.redis_client.register_script(RECORD_LIKE_SCRIPT)
+        self.finish_seed_script = self.redis_client.register_script(FINISH_SEED_SCRIPT)
+
+    def key_for(self, board: str, category: Optional[str] = None) -> str:
+        if category is None:
+            return f"{self.prefix}:{board}:*"
+        return f"{self.prefix}:{board}:{getattr(category, 'value', category)}"
+
+    @staticmethod
+    def delta_key(key: str) -> str:
+        return f"{key}:seeding:delta"
+
+    async def record_like(self, prompt_id: str, category: Optional[str], count: int = 1) -> None:
+        boards = [
+            self.key_for("likes"),
+            self.key_for("likes", category),
+            self.key_for("trending"),
+            self.key_for("trending", category)
+        ]
+        try:
+            await self.record_like_script(
+                keys=[*boards, self.epochs_key, *map(self.delta_key, boards), self.seed_lock_key],
+                args=[prompt_id, count, time.time(), self.half_life]
+            )
+        except redis.RedisError as e:
+            logger.error(f"Redis error updating leaderboards for {prompt_id}: {e}")
+
+    async def add_prompt(self, document: dict) -> None:
+        """
+        Give a newly published prompt its place in the like leaderboards
+        """
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key in (self.key_for("likes"), self.key_for("likes", document.get("category"))):
+                    pipe.zadd(key, {document["prompt_id"]: document.get("like_count", 0)}, nx=True)
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Redis error adding {document['prompt_id']} to leaderboards: {e}")
+
+    async def page(self, board: str, category: Optional[str], offset: int, limit: int,
+                   descending: bool = True) -> Optional[Tuple[List[Tuple[str, float]], int]]:
+        """
+        Return (hits for the page, total), or None if this leaderboard is not seeded
+        """
+        key = self.key_for(board, category)
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.zrange(key, offset, offset + limit - 1, desc=descending, withscores=True)
+                pipe.zcard(key)
+                entries, total = await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Redis error reading leaderboard {key}: {e}")
+            return None
+        if not total:
+            return None
+        return [(prompt_id.decode(), score) for prompt_id, score in entries], total
+
+    async def seed(self) -> None:
+        """
+        Build the like leaderboards from Mongo if they are missing (e.g. first
+        start, or Redis lost its data), and the trending ones from recency.
+
+        Likes recorded while the seed runs are collected in delta keys. Each
+        prompt's deltas are reset just before its buffered likes are read, so
+        likes up to then come from Mongo and the buffer and later ones from the
+        deltas, which are merged in when the seeded boards are swapped in. Only
+        a like landing between those two steps for its chunk is counted twice.
+        """
+        if not await self.redis_client.set(self.seed_lock_key, uuid4().hex, nx=True, ex=300):
+            return
+        try:
+            seed_likes = not await self.redis_client.exists(self.key_for("likes"))
+            seed_trending = not await self.redis_client.exists(self.key_for("trending"))
+            if not seed_likes and not seed_trending:
+                return
+
+            # Deltas left by a seed that failed
+            async for key in self.redis_client.scan_iter(match=self.delta_key(f"{self.prefix}:*")):
+                await self.redis_client.delete(key)
+
+            documents = await self.collection.find(
+                {},
+                {"_id": 0, "prompt_id": 1, "category": 1, "like_count": 1, "created_at": 1, "pending_like_batches": 1}
+            ).to_list(length=None)
+            pending: Dict[str, int] = {}
+            for start in range(0, len(documents), 1000):
+                chunk = documents[start:start + 1000]
+                deltas: Dict[str, List[str]] = {}
+                for document in chunk:
+                    for board in ("likes", "trending"):
+                        for category in (None, document.get("category")):
+                            deltas.setdefault(self.delta_key(self.key_for(board, category)), []).append(document["prompt_id"])
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    for key, prompt_ids in deltas.items():
+                        pipe.zrem(key, *prompt_ids)
+                    await pipe.execute()
+                pending.update(await like_buffer.pending(
+                    [document["prompt_id"] for document in chunk],
+                    {document["prompt_id"]: document.get("pending_like_batches") for document in chunk}
+                ))
+
+            now = time.time()
+            boards: Dict[str, Dict[str, float]] = {}
+            for document in documents:
+                prompt_id = document["prompt_id"]
+                likes = document.get("like_count", 0) + pending.get(prompt_id, 0)
+                category = document.get("category")
+                if seed_likes:
+                    for key in (self.key_for("likes"), self.key_for("likes", category)):
+                        boards.setdefault(key, {})[prompt_id] = likes
+                if seed_trending:
+                    # Every board gets swapped in, even empty, so its deltas are merged
+                    for key in (self.key_for("trending"), self.key_for("trending", category)):
+                        board = boards.setdefault(key, {})
+                        if likes:
+                            # No like timestamps in Mongo: weight likes by the prompt's age instead
+                            created_at = document.get("created_at") or datetime.now(timezone.utc)
+                            if created_at.tzinfo is None:
+                                created_at = created_at.replace(tzinfo=timezone.utc)
+                            weight = 2 ** (max(created_at.timestamp() - now, -32 * self.half_life) / self.half_life)
+                            board[prompt_id] = likes * weight
+
+            # Build under temporary keys and merge each in with its deltas
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                for key, scores in boards.items():
+                    staging_key = f"{key}:seeding"
+                    pipe.delete(staging_key)
+                    items = list(scores.items())
+                    for start in range(0, len(items), 1000):
+                        pipe.zadd(staging_key, dict(items[start:start + 1000]))
+                    trending = key.startswith(f"{self.prefix}:trending:")
+                    await self.finish_seed_script(
+                        keys=[key, staging_key, self.delta_key(key), self.epochs_key],
+                        args=[now if trending else "", self.half_life],
+                        client=pipe
+                    )
+                await pipe.execute()
+            logger.info(f"Seeded {len(boards)} leaderboards from {len(documents)} prompts")
+        except Exception as e:
+            logger.error(f"Error seeding leaderboards: {str(e)}")
+        finally:
+            await self.redis_client.delete(self.seed_lock_key)
+
+leaderboard = Leaderboard(
+    async_redis_client,
+    get_async_database().prompts_discover,
+    half_life=settings.TRENDING_HALF_LIFE_SECONDS
+)
@@ -0,0 +1,269 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from uuid import uuid4
+import redis
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from utils.app_logger import setup_logger
+from utils.cache_tags import prompt_liked_tags
+from utils.config import get_async_database, settings
+from utils.redis_cache import cache
+from utils.redis_client import async_redis_client
+
+logger = setup_logger("utils/like_buffer.py")
+
+# Move the pending hash aside under a unique batch key and register the batch,
+# atomically, so likes recorded from now on go to a fresh pending hash
+START_BATCH_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('RENAME', KEYS[1], KEYS[2])
+redis.call('ZADD', KEYS[3], ARGV[1], KEYS[2])
+return 1
+"""
+
+# Likes not yet in Mongo for each id: the pending hash plus every batch still
+# being flushed. KEYS are the pending hash, the batch registry and the batch
+# keys the caller read from the registry, so every key the script touches is
+# declared (Redis Cluster). If a batch started since that read, it returns nil
+# and the caller retries. ARGV is the number of ids n, the n ids, then for each
+# id a comma-separated list of batch ids its like_count already includes.
+PENDING_LIKES_SCRIPT = """
+local declared = {}
+for i = 3, #KEYS do
+    declared[KEYS[i]] = true
+end
+local batches = redis.call('ZRANGE', KEYS[2], 0, -1)
+for _, batch in ipairs(batches) do
+    if not declared[batch] then
+        return false
+    end
+end
+local n = tonumber(ARGV[1])
+local ids = {}
+local totals = {}
+local included = {}
+for i = 1, n do
+    ids[i] = ARGV[i + 1]
+    totals[i] = tonumber(redis.call('HGET', KEYS[1], ids[i])) or 0
+    included[i] = ',' .. (ARGV[n + i + 1] or '') .. ','
+end
+for _, batch in ipairs(batches) do
+    local batch_id = ',' .. string.match(batch, '([^:]+)$') .. ','
+    local counts = redis.call('HMGET', batch, unpack(ids))
+    for i = 1, n do
+        if not string.find(included[i], batch_id, 1, true) then
+            totals[i] = totals[i] + (tonumber(counts[i]) or 0)
+        end
+    end
+end
+return totals
+"""
+
+class LikeBuffer:
+    """
+    Write-behind like counter.
+
+    Likes are HINCRBYs on a Redis hash. A flusher periodically renames the hash
+    to a batch key and applies it to Mongo, exactly once per prompt:
+
+    1. $inc like_count and add the batch id to pending_like_batches, unless
+       the id is already there (one atomic update per prompt);
+    2. record (batch_id, prompt_id) in the applied collection, which outlives
+       the stale-batch window by far (TTL);
+    3. delete the batch from Redis;
+    4. $pull the batch id from pending_like_batches.
+
+    A batch left behind by a crashed replica is picked up again from the batch
+    registry once stale. Prompts recorded in the applied collection are skipped
+    and the others are protected by pending_like_batches, so no step counts a
+    like twice. Readers pass pending_like_batches to pending(), so a batch is
+    not added on top of a like_count that already includes it.
+
+    Every Redis key is derived from key, so on Redis Cluster give it a hash
+    tag (e.g. "{likes}:pending") to keep them in one slot for the scripts.
+    """
+
+    def __init__(self, redis_client, collection, applied_collection, key: str = "likes:pending",
+                 flush_interval: float = 5.0, max_pending: int = 500, stale_batch_seconds: float = 60.0):
+        self.redis_client = redis_client
+        self.collection = collection
+        self.applied_collection = applied_collection
+        self.key = key
+        self.batches_key = f"{key}:batches"
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.stale_batch_seconds = stale_batch_seconds
+        self.recorded = 0
+        self.flush_requested = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.start_batch = self.redis_client.register_script(START_BATCH_SCRIPT)
+        self.pending_likes = self.redis_client.register_script(PENDING_LIKES_SCRIPT)
+
+    async def record(self, prompt_id: str, count: int = 1) -> bool:
+        try:
+            await self.redis_client.hincrby(self.key, prompt_id, count)
+        except redis.RedisError as e:
+            logger.error(f"Redis error recording like for {prompt_id}: {e}")
+            return False
+        self.recorded += count
+        if self.recorded >= self.max_pending:
+            self.flush_requested.set()
+        return True
+
+    async def pending(self, prompt_ids: List[str], included: Optional[Dict[str, List[str]]] = None) -> Dict[str, int]:
+        """
+        Likes recorded for prompt_ids that Mongo does not have yet. included maps
+        a prompt_id to the pending_like_batches of the document it was read from.
+        """
+        if not prompt_ids:
+            return {}
+        included = included or {}
+        args = [
+            len(prompt_ids),
+            *prompt_ids,
+            *(",".join(included.get(prompt_id) or []) for prompt_id in prompt_ids)
+        ]
+        totals = None
+        try:
+            for _ in range(3):
+                batch_keys = await self.redis_client.zrange(self.batches_key, 0, -1)
+                totals = await self.pending_likes(keys=[self.key, self.batches_key, *batch_keys], args=args)
+                if totals is not None:
+                    break
+        except redis.RedisError as e:
+            logger.error(f"Redis error reading pending likes: {e}")
+            return {}
+        if totals is None:
+            logger.warning("Like batches kept changing while reading pending likes")
+            return {}
+        return {prompt_id: int(total) for prompt_id, total in zip(prompt_ids, totals) if total}
+
+    async def apply_pending(self, prompts: List[dict]) -> List[dict]:
+        """
+        Add pending likes to the like_count of each prompt, in place, and drop
+        the pending_like_batches bookkeeping field
+        """
+        included = {prompt["prompt_id"]: prompt.pop("pending_like_batches", None) for prompt in prompts}
+        pending = await self.pending(list(included), included)
+        for prompt in prompts:
+            if prompt["prompt_id"] in pending:
+                prompt["like_count"] = prompt.get("like_count", 0) + pending[prompt["prompt_id"]]
+        return prompts
+
+    async def apply_batch(self, batch_key: str) -> int:
+        """
+        Apply one batch to Mongo, then drop it. Returns the number of prompts updated.
+        """
+        counts = await self.redis_client.hgetall(batch_key)
+        batch_id = batch_key.rsplit(":", 1)[-1]
+        likes = {prompt_id.decode(): int(count) for prompt_id, count in counts.items() if int(count)}
+
+        modified = 0
+        if likes:
+            # Prompts a previous attempt at this batch fully applied
+            applied = await self.applied_collection.find(
+                {"batch_id": batch_id, "prompt_id": {"$in": list(likes)}},
+                {"_id": 0, "prompt_id": 1}
+            ).to_list(length=None)
+            applied_ids = {document["prompt_id"] for document in applied}
+
+            operations = [
+                UpdateOne(
+                    {"prompt_id": prompt_id, "pending_like_batches": {"$ne": batch_id}},
+                    {"$inc": {"like_count": count}, "$push": {"pending_like_batches": batch_id}}
+                )
+                for prompt_id, count in likes.items()
+                if prompt_id not in applied_ids
+            ]
+            if operations:
+                result = await self.collection.bulk_write(operations, ordered=False)
+                modified = result.modified_count
+
+            markers = [
+                InsertOne({"batch_id": batch_id, "prompt_id": prompt_id, "applied_at": datetime.now(timezone.utc)})
+                for prompt_id in likes
+                if prompt_id not in applied_ids
+            ]
+            if markers:
+                try:
+                    await self.applied_collection.bulk_write(markers, ordered=False)
+                except BulkWriteError as e:
+                    # Markers written by an earlier attempt are fine; anything else is not
+                    if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                        raise
+
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(batch_key)
+            pipe.zrem(self.batches_key, batch_key)
+            await pipe.execute()
+
+        if likes:
+            await self.collection.update_many(
+                {"prompt_id": {"$in": list(likes)}, "pending_like_batches": batch_id},
+                {"$pull": {"pending_like_batches": batch_id}}
+            )
+            # Cached pages carry the Mongo count; now that it includes this
+            # batch, drop them so they are not counted twice
+            documents = await self.collection.find(
+                {"prompt_id": {"$in": list(likes)}},
+                {"_id": 0, "prompt_id": 1, "category": 1}
+            ).to_list(length=len(likes))
+            tags = set()
+            for document in documents:
+                tags.update(prompt_liked_tags(document["prompt_id"], document.get("category")))
+            await cache.invalidate_tags(*tags)
+        return modified
+
+    async def flush(self) -> int:
+        """
+        Flush batches abandoned by crashed replicas, then the current pending likes
+        """
+        async with self.flush_lock:
+            self.flush_requested.clear()
+            self.recorded = 0
+            modified = 0
+            now = time.time()
+
+            stale_batches = await self.redis_client.zrangebyscore(
+                self.batches_key, 0, now - self.stale_batch_seconds
+            )
+            for batch_key in stale_batches:
+                batch_key = batch_key.decode()
+                logger.warning(f"Recovering abandoned like batch {batch_key}")
+                modified += await self.apply_batch(batch_key)
+
+            batch_key = f"{self.key}:batch:{uuid4().hex}"
+            if await self.start_batch(keys=[self.key, batch_key, self.batches_key], args=[now]):
+                modified += await self.apply_batch(batch_key)
+
+            if modified:
+                logger.info(f"Flushed likes for {modified} prompts")
+            return modified
+
+    async def run_flusher(self) -> None:
+        """
+        Flush every flush_interval seconds, or sooner once max_pending likes are recorded, until cancelled
+        """
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                # The batch stays registered and is retried once it goes stale
+                logger.error(f"Error flushing likes: {str(e)}")
+
+like_buffer = LikeBuffer(
+    async_redis_client,
+    get_async_database().prompts_discover,
+    get_async_database().like_batches_applied,
+    flush_interval=settings.LIKE_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.LIKE_FLUSH_MAX_PENDING,
+    stale_batch_seconds=settings.LIKE_STALE_BATCH_SECONDS
+)
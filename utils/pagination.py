@@ -0,0 +1,141 @@
+import base64
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import orjson
+import redis
+from utils.app_logger import setup_logger
+
+logger = setup_logger("utils/pagination.py")
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """
+    Encode a cursor payload as an opaque, URL-safe token
+    """
+    return base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b"=").decode()
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decode a token produced by encode_cursor, raising ValueError if it is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = orjson.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
+
+def filters_fingerprint(filters: Dict[str, Any]) -> str:
+    """
+    Short stable hash of a filter dict, used to bind a cursor to the query that produced it
+    """
+    return hashlib.sha256(orjson.dumps(filters, option=orjson.OPT_SORT_KEYS)).hexdigest()[:16]
+
+def seek_filter(sort_by: str, direction: int, last_value: Any, last_prompt_id: str) -> Dict[str, Any]:
+    """
+    Match the documents that come after (last_value, last_prompt_id) in a
+    {sort_by: direction, "prompt_id": direction} ordering.
+
+    Mongo sorts null and missing values before every other value, but $gt and
+    $lt never match them, so they get their own branches.
+    """
+    op = "$gt" if direction == 1 else "$lt"
+    after = [{sort_by: last_value, "prompt_id": {op: last_prompt_id}}]
+    if last_value is None:
+        if direction == 1:
+            # Past the nulls: every non-null value comes next
+            after.append({sort_by: {"$ne": None}})
+    else:
+        after.insert(0, {sort_by: {op: last_value}})
+        if direction == -1:
+            # Descending, the nulls come last
+            after.append({sort_by: None})
+    return {"$or": after}
+
+def encode_seek_cursor(sort_by: str, direction: int, filters: Dict[str, Any], last_document: Dict[str, Any], page: int) -> str:
+    """
+    Cursor pointing just after last_document in a browse ordering
+    """
+    return encode_cursor({
+        "s": sort_by,
+        "d": direction,
+        "f": filters_fingerprint(filters),
+        "v": last_document.get(sort_by),
+        "i": last_document["prompt_id"],
+        "p": page
+    })
+
+def decode_seek_cursor(cursor: str, sort_by: str, direction: int, filters: Dict[str, Any]) -> Tuple[Any, str, int]:
+    """
+    Return (last sort value, last prompt_id, page) from a seek cursor, raising
+    ValueError if the cursor was issued for a different ordering or filter set
+    """
+    payload = decode_cursor(cursor)
+    if payload.get("s") != sort_by or payload.get("d") != direction or payload.get("f") != filters_fingerprint(filters):
+        raise ValueError("Cursor does not match this listing")
+    try:
+        last_value = payload["v"]
+        if sort_by == "created_at" and last_value is not None:
+            last_value = datetime.fromisoformat(last_value)
+        return last_value, str(payload["i"]), int(payload["p"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+class RankedResultStore:
+    """
+    Keeps the ranked (prompt_id, score) list of a semantic search in Redis, so
+    later pages are served by slicing it instead of re-running the vector query.
+
+    Each list starts with a header element so an empty result set is still
+    distinguishable from an expired one.
+    """
+
+    HEADER = b"#"
+
+    def __init__(self, redis_client, expire: int = 600, prefix: str = "search:ranked"):
+        self.redis_client = redis_client
+        self.expire = expire
+        self.prefix = prefix
+
+    def key_for(self, query: str, filters: Dict[str, Any], mode: str = "vector") -> str:
+        params = orjson.dumps(
+            {"query": " ".join(query.lower().split()), "filters": filters, "mode": mode},
+            option=orjson.OPT_SORT_KEYS
+        )
+        return f"{self.prefix}:{hashlib.sha256(params).hexdigest()}"
+
+    async def get_page(self, key: str, offset: int, limit: int) -> Optional[Tuple[List[Tuple[str, float]], int]]:
+        """
+        Return (hits for the page, total hits), or None if the list has expired
+        """
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lrange(key, offset + 1, offset + limit)
+                pipe.llen(key)
+                entries, length = await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Redis error reading ranked results: {e}")
+            return None
+
+        if not length:
+            return None
+
+        hits = []
+        for entry in entries:
+            prompt_id, score = entry.decode().rsplit("\t", 1)
+            hits.append((prompt_id, float(score)))
+        return hits, length - 1
+
+    async def save(self, key: str, ranked: List[Tuple[str, float]]) -> bool:
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.rpush(key, self.HEADER, *[f"{prompt_id}\t{score}" for prompt_id, score in ranked])
+                pipe.expire(key, self.expire)
+                await pipe.execute()
+            return True
+        except redis.RedisError as e:
+            logger.error(f"Redis error saving ranked results: {e}")
+            return False
@@ -1,87 +1,389 @@
+import asyncio
+import time
+from dataclasses import dataclass
 from fastapi import HTTPException, Request
 import redis
-import time
 from functools import wraps
-from typing import Optional, Callable
-from utils.config import settings
+from typing import Dict, List, Optional, Tuple
 from utils.app_logger import setup_logger
+from utils.config import settings
+from utils.redis_client import async_redis_client
 
 logger = setup_logger("utils/rate_limiter.py")
 
+# Both scripts read the clock with TIME so every replica shares Redis' clock,
+# and return {allowed, remaining, retry_after_ms, reset_ms}. ARGV[4] counts
+# requests a replica already admitted locally; they are recorded
+# unconditionally before cost is checked (cost 0 is a pure sync).
+
+# Sliding window counter: the previous fixed window's count is weighted by how
+# much of it still overlaps the sliding window. State is one hash per key.
+SLIDING_WINDOW_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local admitted = tonumber(ARGV[4]) or 0
+
+local current_window = math.floor(now_ms / window)
+local offset = now_ms % window
+local state = redis.call('HMGET', KEYS[1], 'w', 'c', 'p')
+local stored_window = tonumber(state[1])
+local current = tonumber(state[2]) or 0
+local previous = tonumber(state[3]) or 0
+if stored_window == current_window - 1 then
+    previous = current
+    current = 0
+elseif stored_window ~= current_window then
+    previous = 0
+    current = 0
+end
+current = current + admitted
+
+local estimated = previous * (window - offset) / window + current
+local allowed = 0
+local retry_after = 0
+if estimated + cost <= limit then
+    allowed = 1
+    current = current + cost
+    estimated = estimated + cost
+elseif current + cost > limit or previous == 0 then
+    retry_after = window - offset
+else
+    -- Wait until enough of the previous window has slid out
+    retry_after = math.ceil((estimated + cost - limit) * window / previous)
+end
+
+redis.call('HSET', KEYS[1], 'w', current_window, 'c', current, 'p', previous)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+return {allowed, math.max(0, math.floor(limit - estimated)), retry_after, window - offset}
+"""
+
+# Token bucket: holds up to limit tokens and refills limit tokens per window,
+# so short bursts are allowed while the long-run rate stays bounded.
+TOKEN_BUCKET_SCRIPT = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local capacity = tonumber(ARGV[1])
+local rate = capacity / tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local admitted = tonumber(ARGV[4]) or 0
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local last = tonumber(state[2])
+if tokens == nil or last == nil then
+    tokens = capacity
+    last = now_ms
+end
+tokens = math.min(capacity, tokens + math.max(0, now_ms - last) * rate) - admitted
+
+local allowed = 0
+local retry_after = 0
+if tokens >= cost then
+    allowed = 1
+    tokens = tokens - cost
+else
+    retry_after = math.ceil((cost - tokens) / rate)
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now_ms)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate))
+return {allowed, math.max(0, math.floor(tokens)), retry_after, math.ceil((capacity - tokens) / rate)}
+"""
+
+ALGORITHMS = {
+    "sliding_window": SLIDING_WINDOW_SCRIPT,
+    "token_bucket": TOKEN_BUCKET_SCRIPT,
+}
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int  # seconds, 0 when allowed
+    reset: int  # seconds until the quota is fully available again
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
 class RateLimiter:
-    def __init__(self):
-        self.redis_client = redis.Redis.from_url(settings.REDIS_URI)
-        try:
-            self.redis_client.ping()
-            logger.info("Successfully connected to Redis")
-        except redis.exceptions.ConnectionError as e:
-            logger.error(f"Redis connection error: {e}")
-            raise
+    """
+    Rate limits checked with one atomic Lua script (one round trip) per request
+    """
 
-    def is_rate_limited(self, key: str, max_requests: int, window_seconds: int) -> tuple[bool, Optional[int]]:
+    def __init__(self, redis_client):
+        # Shared async client: no per-request pool or connectivity check
+        self.redis_client = redis_client
+        self.scripts = {
+            algorithm: self.redis_client.register_script(script)
+            for algorithm, script in ALGORITHMS.items()
+        }
+
+    @staticmethod
+    def to_result(max_requests: int, response) -> RateLimitResult:
+        allowed, remaining, retry_after_ms, reset_ms = response
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=max_requests,
+            remaining=int(remaining),
+            retry_after=-(-int(retry_after_ms) // 1000),
+            reset=-(-int(reset_ms) // 1000)
+        )
+
+    async def check(self, key: str, max_requests: int, window_seconds: int,
+                    algorithm: str = "sliding_window", cost: int = 1, admitted: int = 0) -> Optional[RateLimitResult]:
         """
-        Simple rate limiting implementation using Redis
+        Count one request against key; returns None if Redis is unavailable
         """
+        script = self.scripts[algorithm]
         try:
-            # Create a window key that includes the time window
-            current_time = int(time.time())
-            window_key = f"ratelimit:{key}:{current_time // window_seconds}"
-
-            # Get the current count
-            count = self.redis_client.get(window_key)
-            
-            if count is None:
-                # First request in this window
-                self.redis_client.setex(window_key, window_seconds, 1)
-                return False, None
-            
-            count = int(count)
-            if count >= max_requests:
-                # Calculate retry after
-                retry_after = window_seconds - (current_time % window_seconds)
-                return True, retry_after
-            
-            # Increment the counter
-            self.redis_client.incr(window_key)
-            return False, None
-
+            response = await script(
+                keys=[f"ratelimit:{algorithm}:{key}"],
+                args=[max_requests, window_seconds * 1000, cost, admitted]
+            )
         except redis.RedisError as e:
             logger.error(f"Redis error: {e}")
-            return False, None  # Fail open in case of Redis errors
+            return None
+        return self.to_result(max_requests, response)
+
+    async def record(self, batch: List[Tuple[str, int, int, str, int]]) -> Optional[List[RateLimitResult]]:
+        """
+        Record locally admitted requests for many keys in one pipeline.
+        batch holds (key, max_requests, window_seconds, algorithm, admitted).
+        """
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for key, max_requests, window_seconds, algorithm, admitted in batch:
+                    await self.scripts[algorithm](
+                        keys=[f"ratelimit:{algorithm}:{key}"],
+                        args=[max_requests, window_seconds * 1000, 0, admitted],
+                        client=pipe
+                    )
+                responses = await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Redis error syncing rate limits: {e}")
+            return None
+        return [self.to_result(entry[1], response) for entry, response in zip(batch, responses)]
 
-def rate_limit(max_requests: int = 100, window_seconds: int = 60):
+class LocalQuota:
     """
-    Rate limiting decorator for FastAPI endpoints
+    What one replica knows about a key: Redis' last answer plus requests admitted since
     """
+
+    def __init__(self, max_requests: int, window_seconds: int, algorithm: str):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.algorithm = algorithm
+        self.remaining = 0
+        self.reset = 0
+        self.synced_at = 0.0
+        self.blocked_until = 0.0
+        self.pending = 0
+        self.touched_at = time.monotonic()
+
+    def update(self, result: RateLimitResult, now: float):
+        self.remaining = result.remaining
+        self.reset = result.reset
+        self.synced_at = now
+        if not result.allowed:
+            self.blocked_until = now + result.retry_after
+
+class HybridRateLimiter:
+    """
+    Answers most rate limit checks in process and keeps Redis in sync in batches.
+
+    - Keys Redis has rejected are rejected locally until their retry_after,
+      so abusive clients cost no round trip.
+    - Keys with plenty of recently synced headroom are admitted locally, up to
+      local_budget requests per key between syncs. Across N replicas the
+      limit can therefore be overshot by at most N * local_budget requests.
+    - Everything else (new keys, stale or near-limit quotas) is checked
+      exactly in Redis, together with the key's unsynced requests.
+    """
+
+    def __init__(self, limiter: RateLimiter, local_budget: int = 2, sync_interval: float = 0.25,
+                 max_keys: int = 10000):
+        self.limiter = limiter
+        self.local_budget = local_budget
+        self.sync_interval = sync_interval
+        self.max_keys = max_keys
+        self.quotas: Dict[Tuple[str, str], LocalQuota] = {}
+
+    def quota_for(self, key: str, max_requests: int, window_seconds: int, algorithm: str) -> LocalQuota:
+        quota = self.quotas.get((algorithm, key))
+        if quota is None:
+            if len(self.quotas) >= self.max_keys:
+                self.prune(force=True)
+            quota = LocalQuota(max_requests, window_seconds, algorithm)
+            self.quotas[(algorithm, key)] = quota
+        quota.touched_at = time.monotonic()
+        return quota
+
+    async def check(self, key: str, max_requests: int, window_seconds: int,
+                    algorithm: str = "sliding_window") -> Optional[RateLimitResult]:
+        quota = self.quota_for(key, max_requests, window_seconds, algorithm)
+        now = time.monotonic()
+
+        if quota.blocked_until > now:
+            return RateLimitResult(
+                allowed=False,
+                limit=max_requests,
+                remaining=0,
+                retry_after=max(1, round(quota.blocked_until - now)),
+                reset=quota.reset
+            )
+
+        fresh = now - quota.synced_at < self.sync_interval * 4
+        if fresh and quota.pending < self.local_budget and quota.remaining - quota.pending > self.local_budget:
+            quota.pending += 1
+            return RateLimitResult(
+                allowed=True,
+                limit=max_requests,
+                remaining=quota.remaining - quota.pending,
+                retry_after=0,
+                reset=quota.reset
+            )
+
+        admitted, quota.pending = quota.pending, 0
+        result = await self.limiter.check(key, max_requests, window_seconds, algorithm, admitted=admitted)
+        if result is None:
+            quota.pending += admitted
+            return None
+        quota.update(result, time.monotonic())
+        return result
+
+    async def sync(self) -> None:
+        """
+        Push every key's locally admitted requests to Redis in one pipeline
+        """
+        keys = [(quota_key, quota) for quota_key, quota in self.quotas.items() if quota.pending]
+        if not keys:
+            return
+        batch = []
+        for (algorithm, key), quota in keys:
+            batch.append((key, quota.max_requests, quota.window_seconds, algorithm, quota.pending))
+            quota.pending = 0
+        results = await self.limiter.record(batch)
+        if results is None:
+            # Keep the counts for the next attempt
+            for (_, quota), entry in zip(keys, batch):
+                quota.pending += entry[4]
+            return
+        now = time.monotonic()
+        for (_, quota), result in zip(keys, results):
+            quota.update(result, now)
+
+    def prune(self, force: bool = False) -> None:
+        """
+        Forget idle keys; with force, also the least recently used half
+        """
+        now = time.monotonic()
+        for quota_key, quota in list(self.quotas.items()):
+            if not quota.pending and now - quota.touched_at > quota.window_seconds:
+                del self.quotas[quota_key]
+        if force and len(self.quotas) >= self.max_keys:
+            idle = sorted(self.quotas.items(), key=lambda item: item[1].touched_at)
+            for quota_key, quota in idle[:len(idle) // 2]:
+                if not quota.pending:
+                    del self.quotas[quota_key]
+
+    async def run_sync(self) -> None:
+        """
+        Sync local counts every sync_interval seconds until cancelled
+        """
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.sync()
+                self.prune()
+            except Exception as e:
+                logger.error(f"Error syncing rate limits: {str(e)}")
+
+rate_limiter = HybridRateLimiter(
+    RateLimiter(async_redis_client),
+    local_budget=settings.RATE_LIMIT_LOCAL_BUDGET,
+    sync_interval=settings.RATE_LIMIT_SYNC_INTERVAL_SECONDS
+)
+
+class RateLimitHeadersMiddleware:
+    """
+    Add X-RateLimit-* headers to responses of rate-limited endpoints.
+
+    The rate_limit decorator leaves its result in request.state; this reads it
+    back when the response starts, including for 429 responses.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                result = scope.get("state", {}).get("rate_limit")
+                if result is not None:
+                    headers = list(message.get("headers", []))
+                    headers.extend(
+                        (name.lower().encode(), value.encode())
+                        for name, value in result.headers().items()
+                    )
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+def rate_limit(max_requests: int = 100, window_seconds: int = 60, algorithm: str = "sliding_window"):
+    """
+    Rate limiting decorator for FastAPI endpoints.
+
+    algorithm is "sliding_window" (at most max_requests in any window_seconds)
+    or "token_bucket" (bursts up to max_requests, refilled over window_seconds).
+    """
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+
     def decorator(func):
         @wraps(func)
         async def wrapped(request: Request, *args, **kwargs):
-            limiter = RateLimiter()
-            
             # Get client IP
             client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-            
+
             # Add endpoint path to make rate limit specific to each endpoint
             rate_limit_key = f"{client_ip}:{request.url.path}"
-            
+
             logger.debug(f"Checking rate limit for IP: {client_ip} on path: {request.url.path}")
-            
-            is_limited, retry_after = limiter.is_rate_limited(
-                rate_limit_key,
-                max_requests,
-                window_seconds
-            )
-            
-            if is_limited:
+
+            result = await rate_limiter.check(rate_limit_key, max_requests, window_seconds, algorithm)
+
+            # Fail open in case of Redis errors
+            if result is None:
+                return await func(request, *args, **kwargs)
+
+            request.state.rate_limit = result
+
+            if not result.allowed:
                 logger.warning(f"Rate limit exceeded for IP: {client_ip}")
                 raise HTTPException(
                     status_code=429,
                     detail={
                         "error": "Too many requests",
-                        "retry_after": retry_after
+                        "retry_after": result.retry_after
                     }
                 )
-            
+
             return await func(request, *args, **kwargs)
         return wrapped
-    return decorator
\ No newline at end of file
+    return decorator
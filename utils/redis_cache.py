@@ -1,56 +1,390 @@
+import asyncio
 import json
-from datetime import datetime
-from typing import Any, Optional, Callable
+import time
+from typing import Any, Optional, Callable, Iterable, Tuple
 from functools import wraps
 import hashlib
+from uuid import uuid4
+import orjson
 import redis
-from fastapi import Request
-from utils.config import settings
+from cachetools import LRUCache
+from fastapi import Request, Response
 from utils.app_logger import setup_logger
-from app import redis_client_main
+from utils.cache_codec import CacheCodec
+from utils.config import settings
+from utils.redis_client import async_redis_client
+from utils.single_flight import SingleFlight
 
 logger = setup_logger("utils/redis_cache.py")
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return super().default(obj)
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Delete the lock only if it is still ours
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Global counter bumped by every tag invalidation. Each invalidated tag
+# remembers the value it was invalidated at, so a value computed before the
+# invalidation can be recognised and not stored.
+TAG_GENERATION_KEY = "cache:tag-generation"
+
+# Bump the generation of the given tags (KEYS[n+1..2n], then the global
+# counter), then delete every key registered under the tag sets (KEYS[1..n])
+# and the sets themselves
+INVALIDATE_TAGS_SCRIPT = """
+local n = (#KEYS - 1) / 2
+local generation = redis.call('INCR', KEYS[#KEYS])
+for i = n + 1, 2 * n do
+    redis.call('SET', KEYS[i], generation, 'EX', ARGV[1])
+end
+local keys = {}
+for i = 1, n do
+    for _, key in ipairs(redis.call('SMEMBERS', KEYS[i])) do
+        table.insert(keys, key)
+    end
+    redis.call('DEL', KEYS[i])
+end
+for i = 1, #keys, 1000 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 999, #keys)))
+end
+return keys
+"""
+
+# Store KEYS[1] and register it under the tag sets KEYS[2..n+1], unless one of
+# the tags (generations in KEYS[n+2..2n+1]) was invalidated after generation
+# ARGV[3] was read; -1 skips the check. Plain EXPIRE/TTL rather than
+# EXPIRE NX/GT, which needs Redis 7.
+STORE_SCRIPT = """
+local n = (#KEYS - 1) / 2
+local generation = tonumber(ARGV[3])
+if generation >= 0 then
+    for i = n + 2, #KEYS do
+        if (tonumber(redis.call('GET', KEYS[i])) or 0) > generation then
+            return 0
+        end
+    end
+end
+local ttl = tonumber(ARGV[2])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ttl)
+for i = 2, n + 1 do
+    redis.call('SADD', KEYS[i], KEYS[1])
+    -- A tag set lives as long as its longest-lived entry
+    if redis.call('TTL', KEYS[i]) < ttl then
+        redis.call('EXPIRE', KEYS[i], ttl)
+    end
+end
+return 1
+"""
+
+class LocalCache:
+    """
+    Bounded in-process LRU of JSON bytes, each with its own deadline
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.entries = LRUCache(maxsize=max_entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        deadline, value = entry
+        if deadline <= time.monotonic():
+            self.entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, *keys: str):
+        for key in keys:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
 
 class RedisCache:
-    def __init__(self):
-        self.redis_client = redis_client_main
-        try:
-            self.redis_client.ping()
-            logger.info("Successfully connected to Redis Cache")
-        except redis.exceptions.ConnectionError as e:
-            logger.error(f"Redis Cache connection error: {e}")
-            raise
+    """
+    Redis cache with an optional in-process L1.
+
+    Values move through the cache as JSON bytes: Redis stores them framed (and
+    compressed when large) by the codec, L1 holds them unframed for a short
+    local_ttl. Invalidations are published on INVALIDATION_CHANNEL so every
+    replica drops its L1 copy too.
+
+    Entries can be registered under dependency tags (a Redis set per tag), so
+    writers invalidate what they changed without knowing the cache keys. A
+    value computed while one of its tags was invalidated is not stored.
+    """
 
-    async def get(self, key: str) -> Optional[Any]:
+    def __init__(self, redis_client, local_cache: Optional[LocalCache] = None, codec: Optional[CacheCodec] = None,
+                 generation_ttl: int = 3600):
+        # Shared async client: no per-instance pool or connectivity check
+        self.redis_client = redis_client
+        self.local_cache = local_cache or LocalCache()
+        self.codec = codec or CacheCodec()
+        self.instance_id = uuid4().hex
+        self.single_flight = SingleFlight()
+        self.background_tasks = set()
+        self.release_lock_script = self.redis_client.register_script(RELEASE_LOCK_SCRIPT)
+        self.generation_ttl = generation_ttl
+        self.invalidate_tags_script = self.redis_client.register_script(INVALIDATE_TAGS_SCRIPT)
+        self.store_script = self.redis_client.register_script(STORE_SCRIPT)
+
+    def unpack(self, blob: bytes) -> Optional[bytes]:
         try:
-            value = self.redis_client.get(key)
-            if value:
-                try:
-                    return json.loads(value)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON decode error: {e}")
-                    return None
+            return self.codec.unpack(blob)
+        except Exception as e:
+            logger.error(f"Cache decode error: {e}")
             return None
+
+    async def lookup(self, key: str, local_ttl: Optional[float] = None,
+                     stale_ttl: Optional[int] = None) -> Tuple[Optional[bytes], bool]:
+        """
+        Return (JSON bytes, is_stale). An entry is stale during the last
+        stale_ttl seconds of its Redis TTL; L1 only ever holds fresh entries.
+        """
+        if local_ttl:
+            payload = self.local_cache.get(key)
+            if payload is not None:
+                return payload, False
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.pttl(key)
+                blob, ttl_ms = await pipe.execute()
         except redis.RedisError as e:
             logger.error(f"Redis get error: {e}")
-            return None
+            return None, False
+
+        if not blob:
+            return None, False
+        payload = self.unpack(blob)
+        if payload is None:
+            return None, False
 
-    async def set(self, key: str, value: Any, expire: int = 300) -> bool:
+        fresh_seconds = ttl_ms / 1000 - (stale_ttl or 0)
+        if local_ttl and fresh_seconds > 0:
+            self.local_cache.set(key, payload, min(local_ttl, fresh_seconds))
+        return payload, fresh_seconds <= 0
+
+    async def store(self, key: str, payload: bytes, expire: int = 300, local_ttl: Optional[float] = None,
+                    stale_ttl: Optional[int] = None, tags: Iterable[str] = (),
+                    generation: Optional[int] = None) -> bool:
+        """
+        Store payload, unless generation (from current_generation(), read before
+        computing it) is older than an invalidation of one of its tags
+        """
+        tags = sorted(set(tags))
+        # Stale entries stay readable for stale_ttl seconds past expire
+        ttl = expire + (stale_ttl or 0)
         try:
-            return self.redis_client.setex(
-                name=key,
-                time=expire,
-                value=json.dumps(value, cls=DateTimeEncoder)
+            stored = await self.store_script(
+                keys=[key, *(f"tag:{tag}" for tag in tags), *(f"tag-generation:{tag}" for tag in tags)],
+                args=[self.codec.pack(payload), ttl, generation if generation is not None else -1]
             )
         except redis.RedisError as e:
             logger.error(f"Redis set error: {e}")
-            return False
+            stored = False
+        else:
+            if not stored:
+                logger.debug(f"Not caching {key}: its tags were invalidated while it was computed")
+                return False
+        if local_ttl:
+            self.local_cache.set(key, payload, min(local_ttl, expire))
+        return bool(stored)
+
+    async def current_generation(self) -> Optional[int]:
+        try:
+            return int(await self.redis_client.get(TAG_GENERATION_KEY) or 0)
+        except redis.RedisError as e:
+            logger.error(f"Redis get error: {e}")
+            return None
+
+    async def get(self, key: str, local_ttl: Optional[float] = None) -> Optional[Any]:
+        payload, _ = await self.lookup(key, local_ttl)
+        return self.codec.loads(payload) if payload is not None else None
+
+    async def set(self, key: str, value: Any, expire: int = 300, local_ttl: Optional[float] = None,
+                  stale_ttl: Optional[int] = None) -> bool:
+        return await self.store(key, self.codec.dumps(value), expire, local_ttl, stale_ttl)
+
+    async def acquire_lock(self, key: str, timeout: float) -> Optional[str]:
+        """
+        Take the cross-replica recompute lock for key; returns the lock token or None
+        """
+        token = uuid4().hex
+        try:
+            if await self.redis_client.set(f"lock:{key}", token, nx=True, px=int(timeout * 1000)):
+                return token
+            return None
+        except redis.RedisError as e:
+            logger.error(f"Redis lock error: {e}")
+            # Without Redis there is nobody to coordinate with
+            return token
+
+    async def release_lock(self, key: str, token: str) -> None:
+        try:
+            await self.release_lock_script(keys=[f"lock:{key}"], args=[token])
+        except redis.RedisError as e:
+            logger.error(f"Redis unlock error: {e}")
+
+    async def wait_for_value(self, key: str, timeout: float, poll_interval: float = 0.05) -> Optional[bytes]:
+        """
+        Poll for a value another replica is computing. Gives up after timeout
+        seconds, or as soon as the lock is released without a value (e.g. the
+        computation raised).
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.get(key)
+                    pipe.exists(f"lock:{key}")
+                    blob, locked = await pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"Redis get error: {e}")
+                return None
+            if blob:
+                return self.unpack(blob)
+            if not locked:
+                return None
+        return None
+
+    async def compute(self, key: str, func: Callable, expire: int, local_ttl: Optional[float] = None,
+                      stale_ttl: Optional[int] = None, wait_for_peer: bool = True,
+                      tags: Optional[Callable[[Any], Iterable[str]]] = None) -> Optional[bytes]:
+        """
+        Recompute key under the cross-replica lock and return the JSON bytes.
+        If another replica holds the lock, wait for its value (or, for
+        background refreshes, do nothing).
+        """
+        token = await self.acquire_lock(key, settings.CACHE_LOCK_TIMEOUT_SECONDS)
+        if token is None:
+            if not wait_for_peer:
+                return None
+            value = await self.wait_for_value(key, settings.CACHE_LOCK_TIMEOUT_SECONDS)
+            if value is not None:
+                return value
+        try:
+            generation = await self.current_generation()
+            response = await func()
+            payload = self.codec.dumps(response)
+            await self.store(key, payload, expire, local_ttl, stale_ttl, tags(response) if tags else (), generation)
+            logger.debug(f"Cache set for key: {key}")
+            return payload
+        finally:
+            if token is not None:
+                await self.release_lock(key, token)
+
+    def refresh_in_background(self, key: str, func: Callable, expire: int, local_ttl: Optional[float] = None,
+                              stale_ttl: Optional[int] = None,
+                              tags: Optional[Callable[[Any], Iterable[str]]] = None) -> None:
+        if self.single_flight.in_flight(key):
+            return
+
+        async def refresh():
+            try:
+                await self.single_flight.do(
+                    key,
+                    lambda: self.compute(key, func, expire, local_ttl, stale_ttl, wait_for_peer=False, tags=tags)
+                )
+            except Exception as e:
+                logger.error(f"Background refresh of {key} failed: {str(e)}")
+
+        task = asyncio.create_task(refresh())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def invalidate(self, *keys: str) -> None:
+        """
+        Drop keys from Redis and from the L1 of every replica
+        """
+        if not keys:
+            return
+        self.local_cache.delete(*keys)
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.delete(*keys)
+                pipe.publish(INVALIDATION_CHANNEL, orjson.dumps({"origin": self.instance_id, "keys": list(keys)}))
+                await pipe.execute()
+        except redis.RedisError as e:
+            logger.error(f"Redis invalidate error: {e}")
+
+    async def invalidate_tags(self, *tags: str) -> None:
+        """
+        Drop every entry registered under any of tags, in Redis and in the L1 of every replica
+        """
+        if not tags:
+            return
+        try:
+            tags = sorted(set(tags))
+            deleted = await self.invalidate_tags_script(
+                keys=[
+                    *(f"tag:{tag}" for tag in tags),
+                    *(f"tag-generation:{tag}" for tag in tags),
+                    TAG_GENERATION_KEY
+                ],
+                args=[self.generation_ttl]
+            )
+            if not deleted:
+                return
+            keys = list({key.decode() if isinstance(key, bytes) else key for key in deleted})
+            self.local_cache.delete(*keys)
+            await self.redis_client.publish(
+                INVALIDATION_CHANNEL,
+                orjson.dumps({"origin": self.instance_id, "keys": keys})
+            )
+            logger.debug(f"Invalidated {len(keys)} cache entries for tags: {', '.join(tags)}")
+        except redis.RedisError as e:
+            logger.error(f"Redis tag invalidate error: {e}")
+
+    def handle_invalidation(self, message: bytes) -> None:
+        try:
+            payload = orjson.loads(message)
+        except orjson.JSONDecodeError as e:
+            logger.error(f"Invalid cache invalidation message: {e}")
+            return
+        if payload.get("origin") != self.instance_id:
+            self.local_cache.delete(*payload.get("keys", []))
+
+    async def listen_for_invalidations(self) -> None:
+        """
+        Apply invalidations published by other replicas until cancelled.
+
+        Messages sent while the subscription is down are lost, so L1 is
+        cleared on every (re)connect.
+        """
+        while True:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                self.local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.handle_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except redis.RedisError as e:
+                logger.error(f"Cache invalidation listener error: {e}")
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.aclose()
+                except redis.RedisError:
+                    pass
+
+cache = RedisCache(
+    async_redis_client,
+    LocalCache(settings.LOCAL_CACHE_MAX_ENTRIES),
+    CacheCodec(settings.CACHE_COMPRESS_THRESHOLD_BYTES)
+)
 
 def generate_cache_key(func_name: str, args: tuple, kwargs: dict) -> str:
     params = {
@@ -61,27 +395,48 @@ def generate_cache_key(func_name: str, args: tuple, kwargs: dict) -> str:
     param_hash = hashlib.md5(param_str.encode()).hexdigest()
     return f"cache:{func_name}:{param_hash}"
 
-def cached(expire: int = 300):
+def cached(expire: int = 300, local_ttl: Optional[float] = None, stale_ttl: Optional[int] = None,
+           raw: bool = False, tags: Optional[Callable[[dict, Any], Iterable[str]]] = None):
+    """
+    Cache an endpoint's response in Redis for expire seconds.
+
+    local_ttl: also keep hot entries in this process for up to local_ttl seconds.
+    stale_ttl: after expire, keep serving the old value for up to stale_ttl
+    seconds while one background task refreshes it.
+    raw: return the cached JSON bytes as the HTTP response instead of decoding
+    them into Python objects for FastAPI to encode again.
+    tags: called with the endpoint's keyword arguments and its response,
+    returns the dependency tags to register the entry under (see invalidate_tags).
+
+    Misses are single-flight: one recomputation per key per replica, and a
+    Redis lock so only one replica recomputes while the others wait for it.
+    """
     def decorator(func: Callable):
+        def respond(payload: bytes):
+            if raw:
+                return Response(content=payload, media_type="application/json")
+            return cache.codec.loads(payload)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            cache = RedisCache()
             cache_key = generate_cache_key(func.__name__, args, kwargs)
-            
+            load = lambda: func(*args, **kwargs)
+            entry_tags = (lambda response: tags(kwargs, response)) if tags else None
+
             # Try to get cached response
-            cached_response = await cache.get(cache_key)
-            
-            if cached_response is not None:
+            cached_payload, is_stale = await cache.lookup(cache_key, local_ttl, stale_ttl)
+
+            if cached_payload is not None:
                 logger.debug(f"Cache hit for key: {cache_key}")
-                return cached_response  # Already decoded JSON
-
-            # Execute function if cache miss
-            response = await func(*args, **kwargs)
-            
-            # Cache the response
-            await cache.set(cache_key, response, expire)
-            logger.debug(f"Cache set for key: {cache_key}")
-            
-            return response
+                if is_stale:
+                    cache.refresh_in_background(cache_key, load, expire, local_ttl, stale_ttl, entry_tags)
+                return respond(cached_payload)
+
+            # Execute function if cache miss, once per key
+            payload = await cache.single_flight.do(
+                cache_key,
+                lambda: cache.compute(cache_key, load, expire, local_ttl, stale_ttl, tags=entry_tags)
+            )
+            return respond(payload)
         return wrapper
-    return decorator
\ No newline at end of file
+    return decorator
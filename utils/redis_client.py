@@ -0,0 +1,38 @@
+import redis
+import redis.asyncio as aioredis
+from utils.config import settings
+from utils.app_logger import setup_logger
+
+logger = setup_logger("utils/redis_client.py")
+
+# Binary-safe client (no decode_responses) for values stored as raw bytes,
+# e.g. packed float32 vectors
+sync_redis_client = redis.Redis.from_url(settings.REDIS_URI)
+
+# Shared async client for request paths. Every caller borrows connections from
+# this one pool; it is opened and closed by the app lifespan. When all
+# REDIS_MAX_CONNECTIONS are busy, callers wait up to REDIS_POOL_TIMEOUT_SECONDS
+# for one to be returned, then get a ConnectionError (a RedisError, which every
+# caller already treats as a cache miss) instead of failing immediately.
+async_redis_pool = aioredis.BlockingConnectionPool.from_url(
+    settings.REDIS_URI,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    timeout=settings.REDIS_POOL_TIMEOUT_SECONDS,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+    health_check_interval=30
+)
+async_redis_client = aioredis.Redis(connection_pool=async_redis_pool)
+
+async def open_async_redis():
+    """
+    Check connectivity once at startup instead of on every request
+    """
+    try:
+        await async_redis_client.ping()
+        logger.info("Successfully connected to Redis")
+    except redis.RedisError as e:
+        logger.error(f"Redis connection error: {e}")
+
+async def close_async_redis():
+    await async_redis_client.aclose()
+    await async_redis_pool.disconnect()
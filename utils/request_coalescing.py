@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import time
+from functools import wraps
+from typing import Any, Awaitable, Callable, Optional
+from uuid import uuid4
+import orjson
+import redis
+from utils.app_logger import setup_logger
+from utils.config import settings
+from utils.redis_cache import RELEASE_LOCK_SCRIPT
+from utils.redis_client import async_redis_client
+from utils.single_flight import SingleFlight
+
+logger = setup_logger("utils/request_coalescing.py")
+
+def request_key(*parts: Any) -> str:
+    """
+    Digest of a normalized request, for use as a coalescing key
+    """
+    return hashlib.sha256(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+
+class RequestCoalescer:
+    """
+    Run one upstream call per in-flight request.
+
+    Duplicates on this replica await the same future (SingleFlight). Across
+    replicas, the first one to take the Redis lock for the key makes the call
+    and publishes the result under a short-lived key; the others poll for it,
+    and fall back to calling upstream themselves if the leader gives up
+    without a result.
+    """
+
+    def __init__(self, redis_client, prefix: str = "flight", result_ttl: int = 5, poll_interval: float = 0.05):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.single_flight = SingleFlight()
+        self.release_lock_script = self.redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], timeout: float,
+                 across_replicas: bool = False, dumps: Callable[[Any], bytes] = orjson.dumps,
+                 loads: Callable[[bytes], Any] = orjson.loads, cancel_abandoned: bool = False) -> Any:
+        if across_replicas:
+            return await self.single_flight.do(
+                key,
+                lambda: self.run_once(key, func, timeout, dumps, loads),
+                cancel_abandoned=cancel_abandoned
+            )
+        return await self.single_flight.do(key, func, cancel_abandoned=cancel_abandoned)
+
+    async def run_once(self, key: str, func: Callable[[], Awaitable[Any]], timeout: float,
+                       dumps: Callable[[Any], bytes], loads: Callable[[bytes], Any]) -> Any:
+        lock_key = f"{self.prefix}:lock:{key}"
+        result_key = f"{self.prefix}:result:{key}"
+        token = uuid4().hex
+        try:
+            leader = await self.redis_client.set(lock_key, token, nx=True, px=int(timeout * 1000))
+        except redis.RedisError as e:
+            logger.error(f"Redis error coalescing {key}: {e}")
+            return await func()
+
+        if not leader:
+            blob = await self.wait_for_result(result_key, lock_key, timeout)
+            if blob is not None:
+                return loads(blob)
+            return await func()
+
+        try:
+            result = await func()
+            try:
+                await self.redis_client.set(result_key, dumps(result), ex=self.result_ttl)
+            except redis.RedisError as e:
+                logger.error(f"Redis error publishing coalesced result for {key}: {e}")
+            return result
+        finally:
+            try:
+                await self.release_lock_script(keys=[lock_key], args=[token])
+            except redis.RedisError as e:
+                logger.error(f"Redis unlock error: {e}")
+
+    async def wait_for_result(self, result_key: str, lock_key: str, timeout: float) -> Optional[bytes]:
+        """
+        Poll for the leader's result; None once the lock is gone without one, or after timeout
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.get(result_key)
+                    pipe.exists(lock_key)
+                    blob, locked = await pipe.execute()
+            except redis.RedisError as e:
+                logger.error(f"Redis get error: {e}")
+                return None
+            if blob is not None:
+                return blob
+            if not locked:
+                return None
+        return None
+
+coalescer = RequestCoalescer(async_redis_client, result_ttl=settings.COALESCE_RESULT_TTL_SECONDS)
+
+def coalesced(key: Callable[..., str], timeout: float, across_replicas: bool = False,
+              dumps: Callable[[Any], bytes] = orjson.dumps, loads: Callable[[bytes], Any] = orjson.loads,
+              cancel_abandoned: bool = False):
+    """
+    Coalesce concurrent calls of the decorated coroutine whose key(*args, **kwargs) match
+    """
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await coalescer.do(
+                f"{func.__name__}:{key(*args, **kwargs)}",
+                lambda: func(*args, **kwargs),
+                timeout=timeout,
+                across_replicas=across_replicas,
+                dumps=dumps,
+                loads=loads,
+                cancel_abandoned=cancel_abandoned
+            )
+        return wrapper
+    return decorator
@@ -0,0 +1,46 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one execution.
+
+    The first caller starts the work; callers arriving while it runs await the
+    same future. The work is shielded, so a cancelled caller (e.g. a client
+    that disconnected) does not cancel it for the others. With
+    cancel_abandoned, the work is cancelled once its last caller is.
+    """
+
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.waiters: Dict[asyncio.Future, int] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self.calls
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], cancel_abandoned: bool = False) -> Any:
+        future = self.calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self.calls[key] = future
+
+            def forget(done: asyncio.Future):
+                if self.calls.get(key) is done:
+                    del self.calls[key]
+                # Mark the exception as retrieved even if every caller went away
+                if not done.cancelled():
+                    done.exception()
+
+            future.add_done_callback(forget)
+
+        self.waiters[future] = self.waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if cancel_abandoned and self.waiters[future] == 1:
+                future.cancel()
+            raise
+        finally:
+            self.waiters[future] -= 1
+            if not self.waiters[future]:
+                del self.waiters[future]